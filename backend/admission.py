@@ -0,0 +1,248 @@
+# backend/admission.py
+# Admission control in front of the inference endpoints. Each request must
+# get one of CAPACITY slots before its view runs (before the upload is even
+# parsed), and each endpoint may hold at most its own limit of them. Requests
+# that can't run wait in one priority queue (verification first, then
+# identification, enrollment, visualization); a full queue is answered
+# immediately with 429 and a request that waits past its endpoint's deadline
+# with 503, both with a Retry-After estimate.
+import os
+import heapq
+import math
+import time
+import itertools
+import threading
+from collections import deque
+from functools import wraps
+from typing import Dict, List, Optional
+
+import numpy as np
+from flask import jsonify
+
+# =========================
+# Public constants / knobs
+# =========================
+# Inference requests running at once, over all endpoints.
+CAPACITY = int(os.environ.get("KEYVOX_ADMISSION_CAPACITY", str(max(4, os.cpu_count() or 1))))
+# Requests allowed to wait for a slot; the next one gets 429.
+MAX_QUEUE = int(os.environ.get("KEYVOX_ADMISSION_MAX_QUEUE", "32"))
+
+# Lower value = served first.
+PRIORITY_VERIFY = 0
+PRIORITY_IDENTIFY = 1
+PRIORITY_ENROLL = 2
+PRIORITY_VISUALIZE = 3
+
+# endpoint -> (priority, max concurrent, max queue wait in seconds)
+ENDPOINT_POLICIES = {
+    "verify_voice": (PRIORITY_VERIFY, CAPACITY, 5.0),
+    "identify_voice": (PRIORITY_IDENTIFY, max(1, CAPACITY // 2), 5.0),
+    "enroll_voice": (PRIORITY_ENROLL, max(1, CAPACITY // 2), 15.0),
+    "visualize_gates": (PRIORITY_VISUALIZE, 1, 10.0),
+}
+
+# Service-time average used for Retry-After (seconds, exponentially weighted).
+SERVICE_TIME_ALPHA = 0.2
+INITIAL_SERVICE_TIME_S = 0.5
+
+
+class AdmissionRejected(Exception):
+    """The request was not admitted; `status` is 429 (queue full) or 503 (queue deadline)."""
+
+    def __init__(self, status: int, retry_after: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def rejection_response(error: AdmissionRejected):
+    """429/503 JSON answer with a Retry-After header for a request that was not admitted."""
+    # Endpoint-neutral body (same shape as the server's 503 for a busy
+    # inference pool): nothing was verified or enrolled, and clients
+    # tell a rejection from a result by the 429/503 status code.
+    response = jsonify({"status": "error", "message": str(error), "retry_after": error.retry_after})
+    response.status_code = error.status
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+
+class _Waiter:
+    __slots__ = ("endpoint", "event", "granted", "enqueued")
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.event = threading.Event()
+        self.granted = False
+        self.enqueued = time.monotonic()
+
+
+class _EndpointStats:
+    __slots__ = ("running", "queued", "admitted", "rejected_full", "rejected_deadline", "waits_ms")
+
+    def __init__(self):
+        self.running = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_deadline = 0
+        self.waits_ms = deque(maxlen=500)
+
+
+class AdmissionController:
+    """
+    Slot scheduler. A waiting request is granted a slot when a total slot is
+    free and its endpoint is under its limit; among those, the lowest priority
+    value (then arrival order) goes first, so an endpoint at its own limit
+    never holds up requests of other endpoints behind it.
+    """
+
+    def __init__(self, capacity: int = CAPACITY, max_queue: int = MAX_QUEUE,
+                 policies: Optional[Dict[str, tuple]] = None):
+        self.capacity = max(1, capacity)
+        self.max_queue = max(0, max_queue)
+        self.policies = dict(policies or ENDPOINT_POLICIES)
+        self._lock = threading.Lock()
+        self._heap: List[tuple] = []          # (priority, seq, waiter)
+        self._seq = itertools.count()
+        self._running = 0
+        self._queued = 0
+        self._max_queued = 0
+        self._service_s = INITIAL_SERVICE_TIME_S
+        self._stats: Dict[str, _EndpointStats] = {name: _EndpointStats() for name in self.policies}
+
+    # --- Scheduling (caller holds self._lock) ---
+    def _can_run(self, endpoint: str) -> bool:
+        return self._running < self.capacity and self._stats[endpoint].running < self.policies[endpoint][1]
+
+    def _grant(self, waiter: _Waiter) -> None:
+        waiter.granted = True
+        self._running += 1
+        stats = self._stats[waiter.endpoint]
+        stats.running += 1
+        stats.admitted += 1
+        stats.waits_ms.append((time.monotonic() - waiter.enqueued) * 1000.0)
+
+    def _dispatch(self) -> None:
+        """Grant slots to the best eligible waiters; cancelled waiters are dropped lazily."""
+        if not self._heap or self._running >= self.capacity:
+            return
+        kept = []
+        while self._heap and self._running < self.capacity:
+            entry = heapq.heappop(self._heap)
+            waiter = entry[2]
+            if waiter.event.is_set():
+                continue  # timed out and already accounted for
+            if self._can_run(waiter.endpoint):
+                self._grant(waiter)
+                self._queued -= 1
+                self._stats[waiter.endpoint].queued -= 1
+                waiter.event.set()
+            else:
+                kept.append(entry)
+        for entry in kept:
+            heapq.heappush(self._heap, entry)
+
+    def _retry_after(self) -> int:
+        """Seconds until the current queue should have drained."""
+        return max(1, math.ceil(self._service_s * (self._queued + 1) / self.capacity))
+
+    # --- Public ---
+    def acquire(self, endpoint: str) -> None:
+        """Block until `endpoint` may run, or raise AdmissionRejected."""
+        priority, _, deadline_s = self.policies[endpoint]
+        waiter = _Waiter(endpoint)
+        with self._lock:
+            if self._can_run(endpoint) and not self._has_waiting_ahead(priority):
+                self._grant(waiter)
+                return
+            stats = self._stats[endpoint]
+            if self._queued >= self.max_queue:
+                stats.rejected_full += 1
+                raise AdmissionRejected(429, self._retry_after(), "Server is busy: too many requests queued.")
+            heapq.heappush(self._heap, (priority, next(self._seq), waiter))
+            self._queued += 1
+            self._max_queued = max(self._max_queued, self._queued)
+            stats.queued += 1
+
+        if waiter.event.wait(deadline_s):
+            return
+        with self._lock:
+            if waiter.granted:
+                return  # granted between the timeout and taking the lock
+            waiter.event.set()  # tells _dispatch to skip it
+            self._queued -= 1
+            stats = self._stats[endpoint]
+            stats.queued -= 1
+            stats.rejected_deadline += 1
+            raise AdmissionRejected(503, self._retry_after(),
+                                    f"Server is busy: not admitted within {deadline_s:g}s.")
+
+    def _has_waiting_ahead(self, priority: int) -> bool:
+        """Someone of equal or higher priority that could run is already waiting (no overtaking)."""
+        return any(p <= priority and not w.event.is_set() and self._can_run(w.endpoint)
+                   for p, _, w in self._heap)
+
+    def release(self, endpoint: str, service_s: float) -> None:
+        with self._lock:
+            self._running -= 1
+            self._stats[endpoint].running -= 1
+            self._service_s += SERVICE_TIME_ALPHA * (service_s - self._service_s)
+            self._dispatch()
+
+    def limit(self, endpoint: str):
+        """
+        Flask view decorator: admit the request under `endpoint`'s policy, or
+        answer 429/503 with a Retry-After header without running the view.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                try:
+                    self.acquire(endpoint)
+                except AdmissionRejected as e:
+                    return rejection_response(e)
+                started = time.monotonic()
+                try:
+                    return view(*args, **kwargs)
+                finally:
+                    self.release(endpoint, time.monotonic() - started)
+            return wrapper
+        return decorator
+
+    def metrics(self) -> Dict[str, object]:
+        with self._lock:
+            endpoints = {}
+            for name, stats in self._stats.items():
+                waits = np.array(stats.waits_ms) if stats.waits_ms else None
+                priority, limit, deadline_s = self.policies[name]
+                endpoints[name] = {
+                    "priority": priority,
+                    "limit": limit,
+                    "deadline_s": deadline_s,
+                    "running": stats.running,
+                    "queued": stats.queued,
+                    "admitted": stats.admitted,
+                    "rejected_queue_full": stats.rejected_full,
+                    "rejected_deadline": stats.rejected_deadline,
+                    "wait_ms_mean": round(float(waits.mean()), 2) if waits is not None else None,
+                    "wait_ms_p95": round(float(np.percentile(waits, 95)), 2) if waits is not None else None,
+                }
+            return {
+                "capacity": self.capacity,
+                "running": self._running,
+                "queue_depth": self._queued,
+                "queue_depth_max": self._max_queued,
+                "max_queue": self.max_queue,
+                "service_time_ms": round(self._service_s * 1000.0, 1),
+                "endpoints": endpoints,
+            }
+
+
+__all__ = [
+    "CAPACITY",
+    "MAX_QUEUE",
+    "ENDPOINT_POLICIES",
+    "AdmissionRejected",
+    "AdmissionController",
+    "rejection_response",
+]
@@ -0,0 +1,187 @@
+# backend/audio_io.py
+# Decodes uploaded audio straight from the request stream into a float32
+# NumPy buffer, so the inference endpoints never touch a temp file.
+import io
+import os
+from typing import BinaryIO, Tuple, Union
+
+import numpy as np
+import soundfile as sf
+import librosa
+import soxr
+
+# =========================
+# Public constants / knobs
+# =========================
+SAMPLE_RATE = 16000
+
+# Anything past this many seconds of an upload is never decoded.
+MAX_UPLOAD_SECONDS = float(os.environ.get("KEYVOX_MAX_UPLOAD_SECONDS", "10"))
+# Largest upload accepted at all: MAX_UPLOAD_SECONDS of the heaviest audio the
+# decoders expect (48 kHz stereo 32-bit PCM), plus room for the container header.
+MAX_UPLOAD_BYTES = int(os.environ.get("KEYVOX_MAX_UPLOAD_BYTES",
+                                      str(int(MAX_UPLOAD_SECONDS * 48000 * 2 * 4) + 64 * 1024)))
+
+# Upload transports the server accepts, most compact first (advertised by
+# /api/status so clients can pick one):
+#   flac  - lossless FLAC (decoded by soundfile like any other container)
+#   pcm16 - raw little-endian int16, rate/channels in the part's Content-Type:
+#           "audio/x-pcm16le; rate=16000; channels=1"
+#   wav   - 16-bit PCM WAV
+AUDIO_FORMATS = ("flac", "pcm16", "wav")
+PCM16_MIMETYPE = "audio/x-pcm16le"
+
+
+def decode_audio(source: Union[bytes, BinaryIO],
+                 target_sr: int = SAMPLE_RATE,
+                 max_seconds: float = MAX_UPLOAD_SECONDS) -> np.ndarray:
+    """
+    Decode a WAV/FLAC/OGG payload (raw bytes or a seekable binary stream) into
+    a mono float32 signal at `target_sr`, reading at most `max_seconds` of it.
+    Mirrors librosa.load(..., sr=target_sr, mono=True): channels are averaged
+    and resampling uses the same soxr_hq resampler, so embeddings match the
+    file-based path.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+
+    with sf.SoundFile(source) as f:
+        native_sr = f.samplerate
+        frames = f.frames
+        if max_seconds and max_seconds > 0:
+            frames = min(frames, int(max_seconds * native_sr))
+        data = f.read(frames=frames, dtype="float32", always_2d=True)
+
+    signal = data.mean(axis=1) if data.shape[1] > 1 else data[:, 0]
+    return resample(signal, native_sr, target_sr)
+
+
+def resample(signal: np.ndarray, native_sr: int, target_sr: int = SAMPLE_RATE) -> np.ndarray:
+    """Mono float32 signal at target_sr (soxr_hq, like librosa.load); no-op if the rates match."""
+    if native_sr != target_sr:
+        signal = librosa.resample(signal, orig_sr=native_sr, target_sr=target_sr, res_type="soxr_hq")
+    return np.ascontiguousarray(signal, dtype=np.float32)
+
+
+class StreamResampler:
+    """
+    resample() for audio that arrives in chunks: one running soxr_hq stream
+    keeps the filter state between chunks, so each sample is resampled once
+    (pass-through when the rates already match).
+    """
+
+    def __init__(self, native_sr: int, target_sr: int = SAMPLE_RATE):
+        self._stream = None
+        if native_sr != target_sr:
+            self._stream = soxr.ResampleStream(native_sr, target_sr, 1, dtype="float32", quality="HQ")
+
+    def feed(self, signal: np.ndarray, last: bool = False) -> np.ndarray:
+        """Resampled output available so far; last=True flushes the filter tail."""
+        signal = np.ascontiguousarray(signal, dtype=np.float32)
+        if self._stream is None:
+            return signal
+        return self._stream.resample_chunk(signal, last=last)
+
+
+def pcm16_to_float32(data: bytes, channels: int = 1) -> np.ndarray:
+    """Raw little-endian int16 PCM (what pyaudio paInt16 yields) -> mono float32 in [-1, 1)."""
+    samples = np.frombuffer(data, dtype="<i2")
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    return samples.astype(np.float32) / 32768.0
+
+
+def decode_pcm16(data: bytes, sample_rate: int, channels: int = 1,
+                 target_sr: int = SAMPLE_RATE,
+                 max_seconds: float = MAX_UPLOAD_SECONDS) -> np.ndarray:
+    """Raw little-endian int16 PCM at `sample_rate` -> mono float32 at `target_sr` (no container to parse)."""
+    if max_seconds and max_seconds > 0:
+        data = data[:int(max_seconds * sample_rate) * channels * 2]
+    data = data[:len(data) - len(data) % (2 * channels)]
+    return resample(pcm16_to_float32(data, channels), sample_rate, target_sr)
+
+
+def upload_format(file_storage) -> str:
+    """'pcm16' for raw int16 uploads, otherwise 'flac' / 'wav' / ... from the filename."""
+    if file_storage.mimetype == PCM16_MIMETYPE:
+        return "pcm16"
+    return os.path.splitext(file_storage.filename or "")[1].lstrip(".").lower() or "wav"
+
+
+def pcm16_params(file_storage) -> Tuple[int, int]:
+    """(sample_rate, channels) declared in a pcm16 upload's Content-Type."""
+    params = file_storage.mimetype_params
+    sample_rate = int(params.get("rate", SAMPLE_RATE))
+    channels = int(params.get("channels", 1))
+    if sample_rate <= 0 or channels <= 0:
+        raise ValueError(f"Invalid {PCM16_MIMETYPE} parameters: rate={sample_rate}, channels={channels}")
+    return sample_rate, channels
+
+
+def upload_decode_key(file_storage) -> str:
+    """
+    Everything besides the bytes that decode_upload's result depends on, e.g.
+    "pcm16;rate=16000;channels=1" or "flac" (for caches keyed by content).
+    """
+    fmt = upload_format(file_storage)
+    if fmt == "pcm16":
+        sample_rate, channels = pcm16_params(file_storage)
+        return f"{fmt};rate={sample_rate};channels={channels}"
+    return fmt
+
+
+def decode_upload(file_storage,
+                  target_sr: int = SAMPLE_RATE,
+                  max_seconds: float = MAX_UPLOAD_SECONDS) -> np.ndarray:
+    """
+    decode_audio (or decode_pcm16 for raw int16 uploads) for a Flask/werkzeug
+    FileStorage. The stream is rewound afterwards so the caller can still
+    persist the original upload.
+    """
+    stream = file_storage.stream
+    try:
+        stream.seek(0)
+        if upload_format(file_storage) == "pcm16":
+            sample_rate, channels = pcm16_params(file_storage)
+            # Read only the bytes max_seconds of samples can take, never the whole body.
+            limit = int(max_seconds * sample_rate) * channels * 2 if max_seconds and max_seconds > 0 else -1
+            return decode_pcm16(stream.read(limit), sample_rate, channels, target_sr=target_sr, max_seconds=max_seconds)
+        return decode_audio(stream, target_sr=target_sr, max_seconds=max_seconds)
+    finally:
+        stream.seek(0)
+
+
+def upload_size(file_storage) -> int:
+    """Size in bytes of an uploaded file, measured by seeking; the stream is rewound."""
+    stream = file_storage.stream
+    size = stream.seek(0, os.SEEK_END)
+    stream.seek(0)
+    return size
+
+
+def save_upload_as_wav(file_storage, signal: np.ndarray, path: str, sr: int = SAMPLE_RATE,
+                       max_seconds: float = MAX_UPLOAD_SECONDS) -> None:
+    """
+    Persist an upload as WAV, only the first `max_seconds` (what decode_upload
+    scored): WAV uploads byte-for-byte if they are no longer than that, else
+    their leading frames at the native rate and subtype; other transports from
+    the decoded signal.
+    """
+    if max_seconds and max_seconds > 0:
+        signal = signal[:int(max_seconds * sr)]
+    if upload_format(file_storage) != "wav":
+        sf.write(path, signal, sr, subtype="PCM_16")
+        return
+    stream = file_storage.stream
+    try:
+        stream.seek(0)
+        with sf.SoundFile(stream) as f:
+            limit = int(max_seconds * f.samplerate) if max_seconds and max_seconds > 0 else f.frames
+            if f.frames <= limit:
+                stream.seek(0)
+                file_storage.save(path)
+                return
+            data = f.read(frames=limit, dtype="float32", always_2d=True)
+            sf.write(path, data, f.samplerate, subtype=f.subtype, format="WAV")
+    finally:
+        stream.seek(0)
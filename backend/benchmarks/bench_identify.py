@@ -0,0 +1,89 @@
+# benchmarks/bench_identify.py
+# Recall and latency of 1:N identification: exact brute-force matmul vs. the
+# in-repo IVF index, on synthetic populations of 1k / 10k / 100k voiceprints.
+#
+#   python benchmarks/bench_identify.py [--sizes 1000 10000 100000] [--queries 200] [--k 5] [--codec int8]
+#
+# Synthetic voiceprints are drawn around a few hundred "speaker cluster"
+# centres (like accents/genders in real embedding spaces) and each query is a
+# noisy re-recording of one enrolled user, so the true match is known.
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from speaker_index import BruteForceIndex, IVFIndex, normalize_rows
+from voiceprint_codec import CODEC_MODES, VoiceprintCodec
+
+DIM = 64  # LSTM embedding size
+
+
+def synthetic_population(rng, n_users, dim=DIM, n_groups=256, spread=0.6, noise=0.35, n_queries=200):
+    centres = normalize_rows(rng.standard_normal((n_groups, dim)))
+    groups = rng.integers(0, n_groups, size=n_users)
+    users = normalize_rows(centres[groups] + spread * normalize_rows(rng.standard_normal((n_users, dim))))
+    truth = rng.choice(n_users, size=n_queries, replace=False)
+    queries = normalize_rows(users[truth] + noise * normalize_rows(rng.standard_normal((n_queries, dim))))
+    return users, queries, truth
+
+def _per_query_ms(search, queries):
+    search(queries[:1])  # warm-up
+    started = time.perf_counter()
+    results = [search(q[np.newaxis]) for q in queries]
+    elapsed = (time.perf_counter() - started) * 1000.0 / len(queries)
+    idx = np.concatenate([r[0] for r in results])
+    return elapsed, idx
+
+def _recall(found, expected):
+    """Fraction of the exact top-k neighbours that were returned."""
+    hits = [len(set(f) & set(e)) / len(e) for f, e in zip(found, expected)]
+    return float(np.mean(hits))
+
+
+def run(sizes, n_queries, k, nprobes, codec_mode="float32", seed=0):
+    rng = np.random.default_rng(seed)
+    codec = VoiceprintCodec(codec_mode)
+    print(f"{'users':>8} {'index':<14}{'build s':>9}{'ms/query':>10}{'recall@k':>10}{'top1 acc':>10}{'MB':>8}")
+    for n in sizes:
+        users, queries, truth = synthetic_population(rng, n, n_queries=n_queries)
+
+        started = time.perf_counter()
+        exact = BruteForceIndex(users)
+        build = time.perf_counter() - started
+        t_exact, exact_idx = _per_query_ms(lambda q: exact.search(q, k), queries)
+        top1 = float(np.mean(exact_idx[:, 0] == truth))
+        print(f"{n:>8} {'brute_force':<14}{build:>9.2f}{t_exact:>10.3f}{1.0:>10.3f}{top1:>10.3f}{exact.encoded.nbytes / 1e6:>8.1f}")
+
+        # Exact float32 results are the recall reference; a codec is compared against them.
+        if codec.mode != "float32":
+            started = time.perf_counter()
+            compressed = BruteForceIndex(users, codec=codec)
+            build = time.perf_counter() - started
+            t_c, c_idx = _per_query_ms(lambda q: compressed.search(q, k), queries)
+            label = f"brute/{codec.name}"
+            print(f"{n:>8} {label:<14}{build:>9.2f}{t_c:>10.3f}{_recall(c_idx, exact_idx):>10.3f}"
+                  f"{float(np.mean(c_idx[:, 0] == truth)):>10.3f}{compressed.encoded.nbytes / 1e6:>8.1f}")
+
+        started = time.perf_counter()
+        ivf = IVFIndex(users, codec=codec)
+        build = time.perf_counter() - started
+        for nprobe in nprobes:
+            t_ivf, ivf_idx = _per_query_ms(lambda q: ivf.search(q, k, nprobe=nprobe), queries)
+            recall = _recall(ivf_idx, exact_idx)
+            top1 = float(np.mean(ivf_idx[:, 0] == truth))
+            label = f"ivf/{nprobe}of{ivf.n_lists}"
+            print(f"{n:>8} {label:<14}{build:>9.2f}{t_ivf:>10.3f}{recall:>10.3f}{top1:>10.3f}{ivf.encoded.nbytes / 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 32])
+    parser.add_argument("--codec", choices=CODEC_MODES, default="float32")
+    args = parser.parse_args()
+    run(args.sizes, args.queries, args.k, args.nprobe, args.codec)
@@ -0,0 +1,91 @@
+# benchmarks/bench_transport.py
+# Upload size and latency of each audio transport (WAV / FLAC / raw int16):
+# client encode + transfer on a simulated uplink + server decode, and
+# optionally real round trips against a running server.
+#
+#   python benchmarks/bench_transport.py [--wav rec.wav] [--uplink-kbps 256 1000 10000] [--url http://127.0.0.1:5000]
+#
+# Without --wav a 4 s, 16 kHz synthetic "voice" (harmonics + noise bursts) is used.
+import io
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import soundfile as sf
+from werkzeug.datastructures import FileStorage
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+sys.path.append(os.path.join(os.path.dirname(BACKEND_DIR), "frontend"))
+from audio_io import SAMPLE_RATE, decode_upload
+from api_client import AUDIO_FORMATS, encode_audio_file
+
+
+def synthetic_recording(path, seconds=4.0, sr=SAMPLE_RATE, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    f0 = 140 + 20 * np.sin(2 * np.pi * 0.7 * t)
+    voiced = sum(np.sin(2 * np.pi * h * np.cumsum(f0) / sr) / h for h in range(1, 12))
+    envelope = (np.sin(2 * np.pi * 2.5 * t) > -0.2).astype(float)
+    signal = 0.3 * voiced * envelope + 0.01 * rng.standard_normal(len(t))
+    sf.write(path, signal / np.abs(signal).max() * 0.8, sr, subtype="PCM_16")
+
+def _best_ms(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        out = fn()
+        times.append((time.perf_counter() - started) * 1000.0)
+    return min(times), out
+
+def _server_decode(filename, payload, content_type):
+    storage = FileStorage(io.BytesIO(payload), filename=filename, content_type=content_type)
+    return decode_upload(storage)
+
+
+def run(wav_path, uplinks_kbps, url=None, repeats=20):
+    print(f"{'format':<8}{'bytes':>10}{'ratio':>7}{'encode ms':>11}{'decode ms':>11}"
+          + "".join(f"{f'e2e@{k:g}k ms':>15}" for k in uplinks_kbps))
+    reference = None
+    for fmt in AUDIO_FORMATS:
+        encode_ms, (filename, payload, content_type) = _best_ms(lambda: encode_audio_file(wav_path, fmt), repeats)
+        decode_ms, signal = _best_ms(lambda: _server_decode(filename, payload, content_type), repeats)
+        if reference is None:
+            reference = signal
+        # Every transport must be lossless relative to the 16-bit recording.
+        assert len(signal) == len(reference) and np.max(np.abs(signal - reference)) == 0, fmt
+        e2e = [encode_ms + len(payload) * 8 / (k * 1000.0) * 1000.0 + decode_ms for k in uplinks_kbps]
+        ratio = len(payload) / os.path.getsize(wav_path)
+        print(f"{fmt:<8}{len(payload):>10}{ratio:>7.2f}{encode_ms:>11.2f}{decode_ms:>11.2f}"
+              + "".join(f"{ms:>15.1f}" for ms in e2e))
+
+    if url:
+        import requests
+        print(f"\nRound trips to {url}/api/identify_voice (includes embedding):")
+        for fmt in AUDIO_FORMATS:
+            filename, payload, content_type = encode_audio_file(wav_path, fmt)
+            def _post():
+                return requests.post(f"{url}/api/identify_voice", files={"audio_file": (filename, payload, content_type)},
+                                     data={"top_k": "1"}, timeout=30)
+            _post()  # warm-up
+            ms, response = _best_ms(_post, max(3, repeats // 4))
+            print(f"{fmt:<8}{ms:>10.1f} ms  (HTTP {response.status_code})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--wav", help="16-bit PCM WAV recording to upload (default: synthetic 4 s clip)")
+    parser.add_argument("--uplink-kbps", type=float, nargs="+", default=[256, 1000, 10000])
+    parser.add_argument("--url", help="also time real uploads against this running server")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    if args.wav:
+        run(args.wav, args.uplink_kbps, args.url, args.repeats)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "synthetic.wav")
+            synthetic_recording(path)
+            run(path, args.uplink_kbps, args.url, args.repeats)
@@ -0,0 +1,129 @@
+# benchmarks/load_test.py
+# Throughput/latency of the production server (serve.py) as the number of
+# inference workers grows. For each worker count a server is started on a
+# free port, hammered with concurrent /api/identify_voice uploads for a fixed
+# time, then stopped.
+#
+#   python benchmarks/load_test.py [--workers 1 2 4 8] [--concurrency 16] [--seconds 15] [--wav rec.wav]
+#   python benchmarks/load_test.py --url http://host:5000   # load an already running server instead
+#
+# identify_voice runs the full decode -> MFCC -> embedding -> 1:N search path
+# and writes nothing, so it is safe against a live server.
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import numpy as np
+import requests
+import soundfile as sf
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_ready(url, proc, timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            if requests.get(f"{url}/api/status", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+def _test_clip(path, seconds=4.0, sr=16000):
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sr)) / sr
+    voiced = sum(np.sin(2 * np.pi * 140 * h * t) / h for h in range(1, 10))
+    sf.write(path, 0.2 * voiced + 0.01 * rng.standard_normal(len(t)), sr, subtype="PCM_16")
+
+
+def hammer(url, payload, concurrency, seconds):
+    """Closed-loop load: `concurrency` clients each send the next request as soon as the last returns."""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + seconds
+
+    def _client():
+        session = requests.Session()
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            try:
+                r = session.post(f"{url}/api/identify_voice", files={"audio_file": ("clip.wav", payload, "audio/wav")},
+                                 data={"top_k": "1"}, timeout=120)
+                ok = r.status_code == 200
+            except requests.RequestException:
+                ok = False
+            with lock:
+                if ok:
+                    latencies.append((time.perf_counter() - started) * 1000.0)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=_client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    lat = np.array(latencies) if latencies else np.array([np.nan])
+    return len(latencies) / elapsed, np.percentile(lat, 50), np.percentile(lat, 95), errors[0]
+
+
+def run(worker_counts, concurrency, seconds, wav_path, url=None):
+    with open(wav_path, "rb") as f:
+        payload = f.read()
+    print(f"cores={os.cpu_count()} concurrency={concurrency} duration={seconds}s")
+    print(f"{'workers':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}{'speedup':>9}")
+    if url:
+        _wait_ready(url, None)
+        rps, p50, p95, errors = hammer(url, payload, concurrency, seconds)
+        print(f"{'remote':>8}{rps:>10.2f}{p50:>10.1f}{p95:>10.1f}{errors:>8}{'':>9}")
+        return
+
+    baseline = None
+    for workers in worker_counts:
+        port = _free_port()
+        env = dict(os.environ, KEYVOX_WORKERS=str(workers), KEYVOX_PORT=str(port), KEYVOX_HOST="127.0.0.1")
+        proc = subprocess.Popen([sys.executable, "serve.py"], cwd=BACKEND_DIR, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            server_url = f"http://127.0.0.1:{port}"
+            _wait_ready(server_url, proc)
+            hammer(server_url, payload, concurrency, min(2.0, seconds))  # warm-up
+            rps, p50, p95, errors = hammer(server_url, payload, concurrency, seconds)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+        baseline = baseline or rps
+        print(f"{workers:>8}{rps:>10.2f}{p50:>10.1f}{p95:>10.1f}{errors:>8}{rps / baseline:>8.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--wav", help="clip to upload (default: synthetic 4 s, 16 kHz)")
+    parser.add_argument("--url", help="load an already running server instead of starting serve.py")
+    args = parser.parse_args()
+    if args.wav:
+        run(args.workers, args.concurrency, args.seconds, args.wav, args.url)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            clip = os.path.join(tmp, "clip.wav")
+            _test_clip(clip)
+            run(args.workers, args.concurrency, args.seconds, clip, args.url)
@@ -1,7 +1,18 @@
 import os
-import librosa
+import sys
+import time
+import argparse
 import numpy as np
 import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from mfcc_frontend import load_audio, trim_silence, mfcc_batch
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:  # optional: only keeps BLAS from oversubscribing the workers
+    threadpool_limits = None
 
 # --- Configuration ---
 # This should match the sample rate of your recordings
@@ -16,7 +27,9 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 # Directory where your recording script saves the .wav files
 SOURCE_FOLDER = os.path.join(script_dir, "recordings")
 
-# File where we will save the processed data
+# Where we will save the processed data: a binary, memory-mappable dataset
+# (feature_dataset.py). data_features.json is only written on request.
+DATASET_PATH = os.path.join(script_dir, "data_features")
 JSON_PATH = os.path.join(script_dir, "data_features.json")
 
 
@@ -26,6 +39,137 @@ N_MFCC = 13       # Number of MFCCs to extract
 N_FFT = 2048      # Window size for the Fast Fourier Transform
 HOP_LENGTH = 512  # Number of samples between successive frames
 
+# Files are decoded one by one but their MFCCs are computed in batches of this size
+# (also the work unit handed to each process in parallel mode)
+EXTRACT_BATCH_SIZE = 32
+
+# Parallel mode: worker processes (decode + trim + MFCC run in each)
+EXTRACT_WORKERS = int(os.environ.get("KEYVOX_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+# Work units in flight per worker; bounds the results waiting to be written in order
+EXTRACT_PREFETCH = 2
+
+# Use a higher top_db for more aggressive silence trimming
+TRIM_TOP_DB = 25
+
+# Everything that changes the extracted MFCCs (feature_store.py re-extracts when it does)
+EXTRACT_PARAMS = {
+    "sample_rate": TARGET_SAMPLE_RATE,
+    "top_db": TRIM_TOP_DB,
+    "n_mfcc": N_MFCC,
+    "n_fft": N_FFT,
+    "hop_length": HOP_LENGTH,
+}
+
+def load_trimmed(file_path):
+    """Decode a recording at TARGET_SAMPLE_RATE and trim its silence."""
+    signal = load_audio(file_path, TARGET_SAMPLE_RATE)
+    return trim_silence(signal, top_db=TRIM_TOP_DB, sr=TARGET_SAMPLE_RATE)
+
+def extract_mfccs(signals):
+    """(frames, N_MFCC) MFCCs of each trimmed signal, in one batched pass."""
+    return mfcc_batch(signals,
+                      TARGET_SAMPLE_RATE,
+                      n_mfcc=N_MFCC,
+                      n_fft=N_FFT,
+                      hop_length=HOP_LENGTH)
+
+def extract_chunk(file_paths):
+    """
+    Decode, trim and MFCC one work unit. Returns one (status, mfccs) per file,
+    in order: ("ok", (frames, N_MFCC) float32), ("silent" | "too_short", None)
+    or ("error", message).
+    """
+    results = [None] * len(file_paths)
+    loaded = []
+    for k, file_path in enumerate(file_paths):
+        try:
+            signal = load_trimmed(file_path)
+        except Exception as e:
+            results[k] = ("error", str(e))
+            continue
+        if len(signal) == 0:
+            results[k] = ("silent", None)
+        else:
+            loaded.append((k, signal))
+    for (k, _), mfccs in zip(loaded, extract_mfccs([signal for _, signal in loaded])):
+        results[k] = ("ok", mfccs.astype(np.float32)) if mfccs.shape[0] > 0 else ("too_short", None)
+    return results
+
+def _init_worker():
+    # One BLAS/FFT thread per process; the pool provides the parallelism.
+    if threadpool_limits is not None:
+        threadpool_limits(1)
+
+def iter_extract(file_paths, workers=1, chunk_size=EXTRACT_BATCH_SIZE):
+    """
+    Yield (file_path, status, mfccs) for every file, in input order. With
+    workers > 1 the chunks run in a process pool; at most EXTRACT_PREFETCH
+    chunks per worker are in flight, so memory stays bounded however many
+    files there are.
+    """
+    chunks = [file_paths[i:i + chunk_size] for i in range(0, len(file_paths), chunk_size)]
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            for file_path, (status, mfccs) in zip(chunk, extract_chunk(chunk)):
+                yield file_path, status, mfccs
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        pending = deque()
+        next_chunk = 0
+        while next_chunk < len(chunks) or pending:
+            while next_chunk < len(chunks) and len(pending) < workers * EXTRACT_PREFETCH:
+                pending.append((chunks[next_chunk], pool.submit(extract_chunk, chunks[next_chunk])))
+                next_chunk += 1
+            chunk, future = pending.popleft()
+            for file_path, (status, mfccs) in zip(chunk, future.result()):
+                yield file_path, status, mfccs
+
+def extract_folder_to_dataset(folder_path, dataset_path, workers=EXTRACT_WORKERS, chunk_size=EXTRACT_BATCH_SIZE):
+    """
+    Parallel counterpart of preprocess_and_extract_features + save: streams
+    every file's MFCCs straight into a binary feature dataset (same order,
+    mappings and labels), so no file's features stay in memory once written.
+
+    :return stats (dict): file counts, frames, seconds and throughput.
+    """
+    from feature_dataset import FeatureDatasetWriter
+
+    if not os.path.exists(folder_path):
+        print(f"❌ Error: The folder '{folder_path}' does not exist. Please run the recording script first.")
+        return None
+
+    # Same order and labels as preprocess_and_extract_features
+    wav_files = [(i, filename) for i, filename in enumerate(os.listdir(folder_path)) if filename.endswith(".wav")]
+    paths = [os.path.join(folder_path, filename) for _, filename in wav_files]
+    labels = {path: i for path, (i, _) in zip(paths, wav_files)}
+    input_bytes = sum(os.path.getsize(path) for path in paths)
+    stats = {"files": len(paths), "extracted": 0, "skipped": 0, "errors": 0, "frames": 0}
+
+    print(f"Extracting features from {len(paths)} file(s) with {workers} worker(s)...")
+    started = time.perf_counter()
+    with FeatureDatasetWriter(dataset_path, N_MFCC) as writer:
+        for done, (path, status, mfccs) in enumerate(iter_extract(paths, workers, chunk_size), 1):
+            if status == "ok":
+                writer.append(mfccs, labels[path], os.path.basename(path))
+                stats["extracted"] += 1
+                stats["frames"] += mfccs.shape[0]
+            elif status == "error":
+                print(f"  ❌ Error processing {os.path.basename(path)}: {mfccs}")
+                stats["errors"] += 1
+            else:
+                stats["skipped"] += 1
+            if done % (chunk_size * max(1, workers)) == 0 or done == len(paths):
+                elapsed = time.perf_counter() - started
+                print(f"  {done}/{len(paths)} files, {done / elapsed:.1f} files/s", file=sys.stderr)
+    elapsed = time.perf_counter() - started
+    stats.update({
+        "seconds": round(elapsed, 3),
+        "files_per_s": round(len(paths) / elapsed, 2) if elapsed > 0 else None,
+        "mb_per_s": round(input_bytes / 1e6 / elapsed, 2) if elapsed > 0 else None,
+    })
+    return stats
+
 def preprocess_and_extract_features(folder_path):
     """
     Loads audio files, preprocesses them, extracts MFCCs, and returns the data.
@@ -45,41 +189,39 @@ def preprocess_and_extract_features(folder_path):
         return None
 
     print("Starting feature extraction...")
-    for i, filename in enumerate(os.listdir(folder_path)):
-        if filename.endswith(".wav"):
+    wav_files = [(i, filename) for i, filename in enumerate(os.listdir(folder_path)) if filename.endswith(".wav")]
+
+    for start in range(0, len(wav_files), EXTRACT_BATCH_SIZE):
+        loaded = []
+        for i, filename in wav_files[start:start + EXTRACT_BATCH_SIZE]:
             file_path = os.path.join(folder_path, filename)
             print(f"Processing: {file_path}")
 
             try:
-                signal, sr = librosa.load(file_path, sr=TARGET_SAMPLE_RATE, mono=True)
-                
-                # Use a higher top_db for more aggressive silence trimming
-                signal, _ = librosa.effects.trim(signal, top_db=25)
+                signal = load_trimmed(file_path)
 
                 if len(signal) == 0:
                     print(f"  ⚠️ File {filename} is all silence. Skipping.")
                     continue
 
-                mfccs = librosa.feature.mfcc(y=signal, 
-                                             sr=sr, 
-                                             n_mfcc=N_MFCC, 
-                                             n_fft=N_FFT, 
-                                             hop_length=HOP_LENGTH)
-                
-                mfccs = mfccs.T
-                
-                if mfccs.shape[0] > 0: # Check if there are any frames
-                    # THIS IS THE CRITICAL FIX: Convert the numpy array to a nested list.
-                    data["mfccs"].append(mfccs.tolist()) 
-                    data["mappings"].append(filename)
-                    data["labels"].append(i) # For now, each file is its own class
-                    print(f"  ✅ Successfully extracted MFCCs with shape: {mfccs.shape}")
-                else:
-                    print(f"  ⚠️ Could not extract MFCCs from {filename}. File might be too short after trimming.")
+                loaded.append((i, filename, signal))
 
             except Exception as e:
                 print(f"  ❌ Error processing {filename}: {e}")
 
+        # One STFT -> mel -> DCT pass for the whole chunk of files
+        batch_mfccs = extract_mfccs([signal for _, _, signal in loaded])
+
+        for (i, filename, _), mfccs in zip(loaded, batch_mfccs):
+            if mfccs.shape[0] > 0: # Check if there are any frames
+                # THIS IS THE CRITICAL FIX: Convert the numpy array to a nested list.
+                data["mfccs"].append(mfccs.tolist()) 
+                data["mappings"].append(filename)
+                data["labels"].append(i) # For now, each file is its own class
+                print(f"  ✅ Successfully extracted MFCCs with shape: {mfccs.shape}")
+            else:
+                print(f"  ⚠️ Could not extract MFCCs from {filename}. File might be too short after trimming.")
+
     return data
 def save_data_to_json(data, json_path):
     """
@@ -98,9 +240,41 @@ def save_data_to_json(data, json_path):
     print("✅ Data successfully saved.")
 
 
+def save_data_to_dataset(data, dataset_path):
+    """
+    Saves the extracted features and labels as a binary feature dataset.
+
+    :param data (dict): The data dictionary to save.
+    :param dataset_path (str): The dataset directory.
+    """
+    if data is None or not data["mfccs"]:
+        print("No data was extracted. Dataset will not be created.")
+        return
+
+    from feature_dataset import write_dataset
+    print(f"\nSaving data to {dataset_path}...")
+    write_dataset(data, dataset_path)
+    print("✅ Data successfully saved.")
+
+
 if __name__ == "__main__":
-    # Run the main processing function
-    extracted_data = preprocess_and_extract_features(SOURCE_FOLDER)
-    
-    # Save the results to a file
-    save_data_to_json(extracted_data, JSON_PATH)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Extract MFCCs from a folder of .wav recordings.")
+    parser.add_argument("folder", nargs="?", default=SOURCE_FOLDER)
+    parser.add_argument("--out", default=DATASET_PATH, help="feature dataset directory")
+    parser.add_argument("--workers", type=int, default=EXTRACT_WORKERS,
+                        help="worker processes (1 = the original one-file-at-a-time pass)")
+    parser.add_argument("--chunk-size", type=int, default=EXTRACT_BATCH_SIZE, help="files per work unit")
+    args = parser.parse_args()
+
+    if args.workers <= 1:
+        # Run the main processing function
+        extracted_data = preprocess_and_extract_features(args.folder)
+
+        # Save the results (`python feature_dataset.py export` converts to data_features.json)
+        save_data_to_dataset(extracted_data, args.out)
+    else:
+        stats = extract_folder_to_dataset(args.folder, args.out, args.workers, args.chunk_size)
+        if stats is not None:
+            print(f"✅ {stats['extracted']}/{stats['files']} file(s) extracted to {args.out} "
+                  f"({stats['skipped']} skipped, {stats['errors']} failed) in {stats['seconds']}s: "
+                  f"{stats['files_per_s']} files/s, {stats['mb_per_s']} MB/s")
\ No newline at end of file
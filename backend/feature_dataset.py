@@ -0,0 +1,308 @@
+# backend/feature_dataset.py
+# Compact, memory-mappable replacement for data_features.json. The JSON file
+# stores every MFCC as a nested list of decimal floats (indented), which is
+# several times the size of the data and has to be parsed whole before any of
+# it can be used. Here every utterance's frames are concatenated into one
+# float32 matrix that is memory-mapped, so opening a dataset is O(1) and an
+# utterance is a slice.
+#
+# On disk (one directory):
+#   index.json          {"version", "dtype", "n_mfcc", "n_frames", "n_utterances", "generation",
+#                        "frames_file", "offsets_file", "labels_file", "mappings"}
+#   frames.<gen>.f32    raw row-major (n_frames, n_mfcc) float32, utterances back to back
+#   offsets.<gen>.npy   (n_utterances + 1,) int64; utterance i is frames[offsets[i]:offsets[i + 1]]
+#   labels.<gen>.npy    (n_utterances,) int64
+#
+# Every rewrite is a new generation: its data files get new names (fsynced),
+# then index.json is written under a .tmp name, fsynced and os.replace()d into
+# place. That replace is the only commit point, so a reader always gets one
+# generation's index, offsets, labels and frames together, and an interrupted
+# rewrite leaves the previous generation untouched. Older generations' files
+# are deleted after the commit.
+#
+#   python feature_dataset.py import data_features.json data_features/
+#   python feature_dataset.py export data_features/ data_features.json
+#   python feature_dataset.py info data_features/
+import os
+import json
+import argparse
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# =========================
+# Public constants / knobs
+# =========================
+DTYPE = np.float32
+INDEX_NAME = "index.json"
+# Data file names per generation: name.format(generation)
+FRAMES_NAME = "frames.{}.f32"
+OFFSETS_NAME = "offsets.{}.npy"
+LABELS_NAME = "labels.{}.npy"
+# Fixed names of datasets written before generations (still readable).
+LEGACY_NAMES = {"frames_file": "frames.f32", "offsets_file": "offsets.npy", "labels_file": "labels.npy"}
+DATASET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_features")
+
+
+# =========================
+# Writing
+# =========================
+class FeatureDatasetWriter:
+    """
+    Streams utterances to disk one at a time (only offsets, labels and names
+    are kept in memory). Use as a context manager; the dataset becomes visible
+    when it's closed.
+    """
+
+    def __init__(self, path: str, n_mfcc: Optional[int] = None):
+        self.path = path
+        self.n_mfcc = n_mfcc
+        os.makedirs(path, exist_ok=True)
+        self.generation = _next_generation(path)
+        self._files = {
+            "frames_file": FRAMES_NAME.format(self.generation),
+            "offsets_file": OFFSETS_NAME.format(self.generation),
+            "labels_file": LABELS_NAME.format(self.generation),
+        }
+        self._frames = open(os.path.join(path, self._files["frames_file"]), "wb")
+        self._offsets: List[int] = [0]
+        self._labels: List[int] = []
+        self._mappings: List[str] = []
+
+    def __enter__(self) -> "FeatureDatasetWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def __len__(self) -> int:
+        return len(self._labels)
+
+    def append(self, mfccs, label: int, mapping: str) -> None:
+        """Add one utterance: (frames, n_mfcc) MFCCs."""
+        mfccs = np.ascontiguousarray(mfccs, dtype=DTYPE)
+        if mfccs.ndim != 2:
+            raise ValueError(f"Expected (frames, n_mfcc) MFCCs, got shape {mfccs.shape}.")
+        if self.n_mfcc is None:
+            self.n_mfcc = mfccs.shape[1]
+        elif mfccs.shape[1] != self.n_mfcc:
+            raise ValueError(f"Utterance '{mapping}' has {mfccs.shape[1]} coefficients, dataset has {self.n_mfcc}.")
+        self._frames.write(mfccs.tobytes())
+        self._offsets.append(self._offsets[-1] + mfccs.shape[0])
+        self._labels.append(int(label))
+        self._mappings.append(str(mapping))
+
+    def close(self) -> None:
+        self._frames.flush()
+        os.fsync(self._frames.fileno())
+        self._frames.close()
+        _write_synced(os.path.join(self.path, self._files["offsets_file"]),
+                      lambda f: np.save(f, np.array(self._offsets, dtype=np.int64)))
+        _write_synced(os.path.join(self.path, self._files["labels_file"]),
+                      lambda f: np.save(f, np.array(self._labels, dtype=np.int64)))
+        index = {
+            "version": 1,
+            "dtype": np.dtype(DTYPE).name,
+            "n_mfcc": self.n_mfcc or 0,
+            "n_frames": self._offsets[-1],
+            "n_utterances": len(self._labels),
+            "generation": self.generation,
+            **self._files,
+            "mappings": self._mappings,
+        }
+        # The commit point: only now do readers see the new generation.
+        tmp = os.path.join(self.path, INDEX_NAME + ".tmp")
+        try:
+            _write_synced(tmp, lambda f: f.write(json.dumps(index).encode("utf-8")))
+            os.replace(tmp, os.path.join(self.path, INDEX_NAME))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            self._remove_files()
+            raise
+        _remove_stale_files(self.path, self.generation)
+
+    def abort(self) -> None:
+        self._frames.close()
+        self._remove_files()
+
+    def _remove_files(self) -> None:
+        for fname in self._files.values():
+            try:
+                os.remove(os.path.join(self.path, fname))
+            except FileNotFoundError:
+                pass
+
+
+def _write_synced(path: str, write) -> None:
+    """write(f) into `path` (binary) and fsync it."""
+    with open(path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _next_generation(path: str) -> int:
+    """One past the committed generation and past any data file already on disk (e.g. from a crashed write)."""
+    generation = 0
+    try:
+        with open(os.path.join(path, INDEX_NAME), "r", encoding="utf-8") as f:
+            generation = int(json.load(f).get("generation", 0)) + 1
+    except (OSError, ValueError):
+        pass
+    while any(os.path.exists(os.path.join(path, name.format(generation)))
+              for name in (FRAMES_NAME, OFFSETS_NAME, LABELS_NAME)):
+        generation += 1
+    return generation
+
+
+def _remove_stale_files(path: str, generation: int) -> None:
+    """
+    Delete the data files of generations older than `generation` (newer ones
+    may belong to a writer still in progress). Best effort: a file still
+    mapped by a reader (Windows) is removed after the next rewrite.
+    """
+    patterns = [name.split("{}") for name in (FRAMES_NAME, OFFSETS_NAME, LABELS_NAME)]
+    for fname in os.listdir(path):
+        stale = fname in LEGACY_NAMES.values()
+        for head, tail in patterns:
+            number = fname[len(head):-len(tail)]
+            if fname.startswith(head) and fname.endswith(tail) and number.isdigit():
+                stale = int(number) < generation
+        if stale:
+            try:
+                os.remove(os.path.join(path, fname))
+            except OSError:
+                pass
+
+
+def write_dataset(data: Dict[str, list], path: str) -> int:
+    """Write a data_features.json-style dict ({"mappings", "labels", "mfccs"}). Returns the utterance count."""
+    with FeatureDatasetWriter(path) as writer:
+        for mapping, label, mfccs in zip(data["mappings"], data["labels"], data["mfccs"]):
+            writer.append(mfccs, label, mapping)
+    return len(data["mappings"])
+
+
+# =========================
+# Reading
+# =========================
+class FeatureDataset:
+    """
+    Read-only, memory-mapped dataset.
+      frames:   (n_frames, n_mfcc) float32 memmap of all utterances
+      offsets:  (n + 1,) int64
+      labels:   (n,) int64
+      mappings: n source filenames
+    dataset[i] -> (mfccs, label, mapping), where mfccs is a view into `frames`.
+    """
+
+    def __init__(self, path: str = DATASET_PATH):
+        self.path = path
+        # A writer may commit a new generation and delete this one between
+        # reading index.json and opening its files; the retry reads the new one.
+        for attempt in range(3):
+            try:
+                self._open()
+                break
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+        if len(self.offsets) != len(self.mappings) + 1 or len(self.labels) != len(self.mappings):
+            raise ValueError(f"Feature dataset '{path}' is inconsistent (index and arrays disagree).")
+
+    def _open(self) -> None:
+        with open(os.path.join(self.path, INDEX_NAME), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        files = {key: index.get(key, legacy) for key, legacy in LEGACY_NAMES.items()}
+        self.generation = index.get("generation")
+        self.n_mfcc = index["n_mfcc"]
+        self.mappings: List[str] = index["mappings"]
+        self.offsets = np.load(os.path.join(self.path, files["offsets_file"]))
+        self.labels = np.load(os.path.join(self.path, files["labels_file"]))
+        n_frames = index["n_frames"]
+        if n_frames:
+            self.frames = np.memmap(os.path.join(self.path, files["frames_file"]), dtype=np.dtype(index["dtype"]),
+                                    mode="r", shape=(n_frames, self.n_mfcc))
+        else:
+            self.frames = np.zeros((0, self.n_mfcc), dtype=DTYPE)
+
+    def __len__(self) -> int:
+        return len(self.mappings)
+
+    def __getitem__(self, i: int) -> Tuple[np.ndarray, int, str]:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.frames[self.offsets[i]:self.offsets[i + 1]], int(self.labels[i]), self.mappings[i]
+
+    def __iter__(self) -> Iterator[Tuple[np.ndarray, int, str]]:
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """Frames per utterance."""
+        return np.diff(self.offsets)
+
+    def to_dict(self) -> Dict[str, list]:
+        """The data_features.json layout."""
+        return {
+            "mappings": list(self.mappings),
+            "labels": self.labels.tolist(),
+            "mfccs": [mfccs.tolist() for mfccs, _, _ in self],
+        }
+
+
+# =========================
+# JSON compatibility
+# =========================
+def import_json(json_path: str, path: str = DATASET_PATH) -> int:
+    """data_features.json -> binary dataset. Returns the utterance count."""
+    with open(json_path, "r", encoding="utf-8") as fp:
+        return write_dataset(json.load(fp), path)
+
+def export_json(path: str, json_path: str) -> int:
+    """Binary dataset -> data_features.json (same layout save_data_to_json writes)."""
+    from extract_features import save_data_to_json
+    data = FeatureDataset(path).to_dict()
+    save_data_to_json(data, json_path)
+    return len(data["mappings"])
+
+
+__all__ = [
+    "DATASET_PATH",
+    "FeatureDataset",
+    "FeatureDatasetWriter",
+    "write_dataset",
+    "import_json",
+    "export_json",
+]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Binary MFCC feature dataset tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    p = commands.add_parser("import", help="convert data_features.json to a binary dataset")
+    p.add_argument("json_path")
+    p.add_argument("path", nargs="?", default=DATASET_PATH)
+    p = commands.add_parser("export", help="convert a binary dataset to data_features.json")
+    p.add_argument("path")
+    p.add_argument("json_path")
+    p = commands.add_parser("info", help="summarize a binary dataset")
+    p.add_argument("path", nargs="?", default=DATASET_PATH)
+    args = parser.parse_args()
+
+    if args.command == "import":
+        print(f"✅ Imported {import_json(args.json_path, args.path)} utterance(s) into {args.path}")
+    elif args.command == "export":
+        print(f"✅ Exported {export_json(args.path, args.json_path)} utterance(s) to {args.json_path}")
+    else:
+        ds = FeatureDataset(args.path)
+        lengths = ds.lengths
+        print(f"{args.path}: {len(ds)} utterance(s), {ds.frames.shape[0]} frame(s) x {ds.n_mfcc} MFCCs, "
+              f"frames/utterance min={lengths.min() if len(ds) else 0} max={lengths.max() if len(ds) else 0}")
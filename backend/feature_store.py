@@ -0,0 +1,259 @@
+# backend/feature_store.py
+# Incremental MFCC store for the enrollment recordings. Features are computed
+# once per recording *content* and kept, so enrolling a new recording costs
+# one extraction instead of re-extracting and re-serializing every recording
+# ever made into data_features.json.
+#
+# On disk (all in one directory):
+#   manifest.json    {"params", "next_label", "entries": {sha256: entry}, "files": {filename: file}}
+#                      entry: {"mapping", "label", "frames"} (+ "skipped" for silent/too-short clips)
+#                      file:  {"sha256", "size", "mtime_ns"}
+#   <sha256>.npy     (frames, N_MFCC) float32 MFCCs of one recording
+#
+# A recording whose content hash is already in the manifest is never
+# processed again (a copy under another name is only recorded in "files"),
+# and sync() doesn't even re-hash a file whose size and mtime are unchanged.
+# Changing the extraction parameters (EXTRACT_PARAMS) invalidates everything.
+# Training data is exported as a binary feature dataset (feature_dataset.py,
+# streamed one recording at a time); the legacy data_features.json layout is
+# still produced on demand by to_dict() / export_json().
+#
+#   python feature_store.py [--sync [FOLDER]] [--export [DIR]] [--export-json [PATH]]
+import os
+import json
+import hashlib
+import argparse
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from extract_features import (EXTRACT_PARAMS, EXTRACT_WORKERS, SOURCE_FOLDER, DATASET_PATH, JSON_PATH,
+                              iter_extract, save_data_to_json)
+from feature_dataset import FeatureDatasetWriter
+
+# =========================
+# Public constants / knobs
+# =========================
+FEATURES_DIR = os.environ.get("KEYVOX_FEATURES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "features"))
+MANIFEST_NAME = "manifest.json"
+DTYPE = np.float32
+HASH_CHUNK_BYTES = 1 << 20
+
+
+def content_hash(path: str) -> str:
+    """SHA-256 of the file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _file_signature(path: str) -> Dict[str, int]:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+# =========================
+# Store
+# =========================
+class FeatureStore:
+    def __init__(self, directory: str = FEATURES_DIR):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._manifest = self._read_manifest()
+
+    def __len__(self) -> int:
+        return sum(1 for entry in self._manifest["entries"].values() if "skipped" not in entry)
+
+    def __contains__(self, sha256: str) -> bool:
+        return sha256 in self._manifest["entries"]
+
+    # --- Manifest ---
+    @staticmethod
+    def _empty_manifest() -> Dict:
+        return {"version": 1, "params": dict(EXTRACT_PARAMS), "next_label": 0, "entries": {}, "files": {}}
+
+    def _read_manifest(self) -> Dict:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return self._empty_manifest()
+        if manifest.get("params") != EXTRACT_PARAMS:
+            print("⚠️ Feature extraction parameters changed; all recordings will be re-extracted.")
+            for sha in manifest.get("entries", {}):
+                self._remove_features(sha)
+            return self._empty_manifest()
+        return manifest
+
+    def _write_manifest(self) -> None:
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.manifest_path)
+
+    def _features_path(self, sha256: str) -> str:
+        return os.path.join(self.directory, f"{sha256}.npy")
+
+    def _remove_features(self, sha256: str) -> None:
+        try:
+            os.remove(self._features_path(sha256))
+        except FileNotFoundError:
+            pass
+
+    # --- Extraction (caller holds self._lock) ---
+    def _extract_new(self, pending: List[tuple], workers: int = 1) -> int:
+        """Extract and store features for (path, filename, sha256) triples not yet in the manifest."""
+        entries = self._manifest["entries"]
+        by_path = {path: (filename, sha) for path, filename, sha in pending}
+        added = 0
+        # Results are written (and dropped) one by one, in order, as the workers deliver them.
+        for path, status, mfccs in iter_extract(list(by_path), workers):
+            filename, sha = by_path[path]
+            if status == "error":
+                print(f"  ❌ Error processing {filename}: {mfccs}")
+                continue  # not recorded, so it's retried next time
+            if status == "silent":
+                print(f"  ⚠️ File {filename} is all silence. Skipping.")
+                entries[sha] = {"mapping": filename, "skipped": status}
+                continue
+            if status == "too_short":
+                print(f"  ⚠️ Could not extract MFCCs from {filename}. File might be too short after trimming.")
+                entries[sha] = {"mapping": filename, "skipped": status}
+                continue
+            np.save(self._features_path(sha), mfccs)
+            entries[sha] = {"mapping": filename, "label": self._manifest["next_label"], "frames": int(mfccs.shape[0])}
+            self._manifest["next_label"] += 1
+            added += 1
+        return added
+
+    # --- Public ---
+    def add(self, path: str) -> Optional[Dict]:
+        """
+        Record one recording, extracting its features only if its content is
+        new. Returns its manifest entry, or None if it couldn't be decoded.
+        """
+        filename = os.path.basename(path)
+        sha = content_hash(path)
+        with self._lock:
+            if sha not in self._manifest["entries"]:
+                self._extract_new([(path, filename, sha)])
+            entry = self._manifest["entries"].get(sha)
+            if entry is not None:
+                self._manifest["files"][filename] = {"sha256": sha, **_file_signature(path)}
+            self._write_manifest()
+            return entry
+
+    def sync(self, folder: str = SOURCE_FOLDER, workers: int = 1) -> Dict[str, int]:
+        """
+        Bring the store in line with the .wav files in `folder`: extract new or
+        changed recordings (across `workers` processes), forget deleted ones.
+        Unchanged files (same size and mtime) are neither re-hashed nor
+        re-extracted.
+        """
+        if not os.path.isdir(folder):
+            print(f"❌ Error: The folder '{folder}' does not exist. Please run the recording script first.")
+            return {"added": 0, "unchanged": 0, "removed": 0}
+        with self._lock:
+            files = self._manifest["files"]
+            entries = self._manifest["entries"]
+            present, pending, unchanged = {}, [], 0
+            for filename in sorted(os.listdir(folder)):
+                if not filename.endswith(".wav"):
+                    continue
+                path = os.path.join(folder, filename)
+                signature = _file_signature(path)
+                known = files.get(filename)
+                if known and known["size"] == signature["size"] and known["mtime_ns"] == signature["mtime_ns"]:
+                    present[filename] = known
+                    unchanged += 1
+                    continue
+                sha = content_hash(path)
+                present[filename] = {"sha256": sha, **signature}
+                if sha in entries or any(sha == p[2] for p in pending):
+                    unchanged += 1
+                else:
+                    pending.append((path, filename, sha))
+
+            added = self._extract_new(pending, workers)
+            # Files that failed to decode have no entry and are retried next time.
+            self._manifest["files"] = {name: f for name, f in present.items() if f["sha256"] in entries}
+            live = {}
+            for name, f in self._manifest["files"].items():
+                live.setdefault(f["sha256"], name)
+            for sha, name in live.items():
+                if entries[sha]["mapping"] not in self._manifest["files"]:
+                    entries[sha]["mapping"] = name  # the original was deleted, a copy remains
+            removed = 0
+            for sha in [sha for sha in entries if sha not in live]:
+                del entries[sha]
+                self._remove_features(sha)
+                removed += 1
+            self._write_manifest()
+        return {"added": added, "unchanged": unchanged, "removed": removed}
+
+    def load(self, sha256: str) -> Optional[np.ndarray]:
+        """(frames, N_MFCC) MFCCs of one recording, or None."""
+        entry = self._manifest["entries"].get(sha256)
+        if entry is None or "skipped" in entry:
+            return None
+        return np.load(self._features_path(sha256))
+
+    def _labelled(self) -> List[tuple]:
+        with self._lock:
+            return sorted(((sha, e) for sha, e in self._manifest["entries"].items() if "skipped" not in e),
+                          key=lambda item: item[1]["label"])
+
+    def export_dataset(self, path: str = DATASET_PATH) -> int:
+        """Write every recording's features as a binary feature dataset, in label order."""
+        entries = self._labelled()
+        with FeatureDatasetWriter(path, EXTRACT_PARAMS["n_mfcc"]) as writer:
+            for sha, entry in entries:
+                writer.append(self.load(sha), entry["label"], entry["mapping"])
+        return len(entries)
+
+    def to_dict(self) -> Dict[str, list]:
+        """The data_features.json layout ({"mappings", "labels", "mfccs"}), in label order."""
+        data = {"mappings": [], "labels": [], "mfccs": []}
+        for sha, entry in self._labelled():
+            data["mappings"].append(entry["mapping"])
+            data["labels"].append(entry["label"])
+            data["mfccs"].append(self.load(sha).tolist())
+        return data
+
+    def export_json(self, json_path: str = JSON_PATH) -> None:
+        save_data_to_json(self.to_dict(), json_path)
+
+
+__all__ = [
+    "FEATURES_DIR",
+    "FeatureStore",
+    "content_hash",
+]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental MFCC feature store.")
+    parser.add_argument("--sync", nargs="?", const=SOURCE_FOLDER, metavar="FOLDER",
+                        help=f"extract new/changed recordings in FOLDER (default: {SOURCE_FOLDER})")
+    parser.add_argument("--export", nargs="?", const=DATASET_PATH, metavar="DIR",
+                        help=f"write a binary feature dataset (default: {DATASET_PATH})")
+    parser.add_argument("--export-json", nargs="?", const=JSON_PATH, metavar="PATH",
+                        help=f"write the legacy data_features.json layout (default: {JSON_PATH})")
+    parser.add_argument("--dir", default=FEATURES_DIR, help="store directory")
+    parser.add_argument("--workers", type=int, default=EXTRACT_WORKERS, help="extraction processes for --sync")
+    args = parser.parse_args()
+
+    store = FeatureStore(args.dir)
+    if args.sync or not (args.export or args.export_json):
+        print(f"✅ Synced: {store.sync(args.sync or SOURCE_FOLDER, args.workers)}")
+    if args.export:
+        print(f"✅ Exported {store.export_dataset(args.export)} recording(s) to {args.export}")
+    if args.export_json:
+        store.export_json(args.export_json)
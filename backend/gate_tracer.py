@@ -0,0 +1,333 @@
+# backend/gate_tracer.py
+# Gate tracing for every LSTM layer of the speaker model, not just the first
+# one: input/forget/output gates, the candidate, the cell state and the hidden
+# state, per neuron and per time step. Traces are cached by the content hash of
+# the uploaded audio, and reduced on request (per-layer mean, all neurons or
+# the top-k most active ones, optionally pooled down to fewer time steps).
+#
+# Response encodings (picked from the Accept header, JSON by default):
+#   application/json       {"time_steps", "layers": [...]} (+ the legacy first-layer keys in mean mode)
+#   application/x-ndjson   streamed: a header line, then one line per (layer, gate)
+#   application/x-npz      numpy .npz: "time_steps", "<layer>/<gate>", "<layer>/<gate>/neurons"
+#   application/msgpack    like the JSON layout, arrays as {"dtype", "shape", "data": raw bytes}
+#                          (application/x-msgpack too; the response echoes the type asked for)
+# A single .npy can't hold layers of different widths, hence .npz.
+import io
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Union
+
+import numpy as np
+
+from lstm_numpy import LSTMLayer
+
+try:
+    import msgpack
+except ImportError:  # optional: the msgpack types are only offered when installed
+    msgpack = None
+
+# =========================
+# Public constants / knobs
+# =========================
+GATES = ("input_gate", "forget_gate", "candidate", "output_gate", "cell_state", "hidden_state")
+# The four series the original visualizer returned (first layer, mean over neurons)
+LEGACY_GATES = ("forget_gate", "input_gate", "output_gate", "cell_state")
+
+NEURON_MODES = ("mean", "all", "top_k")
+DEFAULT_TOP_K = 8
+
+# Full-resolution traces of this many distinct uploads are kept (~1 MB each).
+CACHE_SIZE = int(os.environ.get("KEYVOX_TRACE_CACHE_SIZE", "32"))
+
+JSON_DECIMALS = 5
+
+MIME_JSON = "application/json"
+MIME_NDJSON = "application/x-ndjson"
+MIME_NPZ = "application/x-npz"
+MIME_MSGPACK = "application/msgpack"
+# Both names are in use for the same encoding; clients get back the one they asked for.
+MSGPACK_TYPES = (MIME_MSGPACK, "application/x-msgpack")
+# In order of preference when the client accepts several (JSON first for */*).
+RESPONSE_TYPES = (MIME_JSON, MIME_NDJSON, MIME_NPZ) + (MSGPACK_TYPES if msgpack is not None else ())
+
+
+class LayerTrace(NamedTuple):
+    """One LSTM layer's trace of one sample: {gate: (time, units) float32}."""
+    name: str
+    units: int
+    gates: Dict[str, np.ndarray]
+
+
+# =========================
+# Tracing
+# =========================
+def trace_lstm_layer(x: np.ndarray, W: np.ndarray, U: np.ndarray, b: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Run a Keras-layout LSTM (gate order i, f, c, o) over a (batch, time,
+    features) array and keep every activation: {gate: (batch, time, units)}.
+    The recurrence is lstm_numpy.LSTMLayer's; its gate hook copies each step
+    out. "hidden_state" is the layer's output sequence.
+    """
+    x = np.asarray(x, dtype=np.float32)
+    batch, steps, _ = x.shape
+    H = U.shape[0]
+    layer = LSTMLayer("trace", {"return_sequences": True}, np.asarray(W, np.float32),
+                      np.asarray(U, np.float32), np.asarray(b, np.float32))
+    gates = np.empty((batch, steps, 4 * H), dtype=np.float32)
+    cells = np.empty((batch, steps, H), dtype=np.float32)
+
+    def keep(t, z, c, h):
+        gates[:, t] = z
+        cells[:, t] = c
+
+    hidden = layer(x, hook=keep)
+    return {
+        "input_gate": gates[..., :H],
+        "forget_gate": gates[..., H:2 * H],
+        "candidate": gates[..., 2 * H:3 * H],
+        "output_gate": gates[..., 3 * H:],
+        "cell_state": cells,
+        "hidden_state": hidden,
+    }
+
+
+def _is_lstm(layer) -> bool:
+    return type(layer).__name__ in ("LSTM", "LSTMLayer")
+
+def _is_passthrough(layer) -> bool:
+    # Dropout is the identity at inference time
+    return type(layer).__name__ in ("Dropout", "DropoutLayer")
+
+
+def trace_model(samples: np.ndarray, model=None) -> List[List[LayerTrace]]:
+    """
+    Trace every LSTM layer of `model` (default: helpers.main_model) for a
+    (batch, time, features) array, feeding each layer's hidden sequence to the
+    next one. Stops at the first layer that is neither LSTM nor Dropout.
+    Returns one list of LayerTrace per sample.
+    """
+    if model is None:
+        from helpers import main_model as model
+    x = np.asarray(samples, dtype=np.float32)
+    if x.ndim == 2:
+        x = x[np.newaxis]
+    per_sample: List[List[LayerTrace]] = [[] for _ in range(x.shape[0])]
+    for layer in model.layers:
+        if _is_passthrough(layer):
+            continue
+        if not _is_lstm(layer):
+            break
+        W, U, b = (np.asarray(w, np.float32) for w in layer.get_weights())
+        trace = trace_lstm_layer(x, W, U, b)
+        for row, traces in enumerate(per_sample):
+            traces.append(LayerTrace(layer.name, U.shape[0], {gate: trace[gate][row] for gate in GATES}))
+        x = trace["hidden_state"]
+    return per_sample
+
+
+# =========================
+# Reduction
+# =========================
+def _pool_time(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Mean over the time bins beginning at `starts` (axis 0)."""
+    counts = np.diff(np.append(starts, values.shape[0])).reshape(-1, *([1] * (values.ndim - 1)))
+    return np.add.reduceat(values, starts, axis=0) / counts
+
+def summarize(traces: List[LayerTrace], neurons: str = "mean", top_k: int = DEFAULT_TOP_K,
+              max_steps: Optional[int] = None, gates=GATES) -> Dict[str, object]:
+    """
+    Reduce one sample's traces for transport:
+      neurons="mean"   (time,) mean over each layer's neurons
+      neurons="all"    (time, units)
+      neurons="top_k"  (time, k) for the k neurons with the largest variation
+                       over time, per gate; their indices go in "neurons"
+    With max_steps, time is mean-pooled into at most that many bins and
+    "time_steps" holds each bin's first frame.
+    """
+    if neurons not in NEURON_MODES:
+        raise ValueError(f"neurons must be one of {', '.join(NEURON_MODES)}.")
+    steps = traces[0].gates[GATES[0]].shape[0] if traces else 0
+    if max_steps and 0 < max_steps < steps:
+        starts = np.unique(np.linspace(0, steps, max_steps, endpoint=False).astype(np.int64))
+    else:
+        starts = np.arange(steps, dtype=np.int64)
+
+    layers = []
+    for trace in traces:
+        reduced, chosen = {}, {}
+        for gate in gates:
+            values = trace.gates[gate]
+            if neurons == "mean":
+                values = values.mean(axis=1)
+            elif neurons == "top_k":
+                k = max(1, min(top_k, values.shape[1]))
+                idx = np.sort(np.argsort(-values.std(axis=0), kind="stable")[:k])
+                values = values[:, idx]
+                chosen[gate] = idx
+            if len(starts) < steps:
+                values = _pool_time(values, starts)
+            reduced[gate] = np.ascontiguousarray(values, dtype=np.float32)
+        layers.append({"name": trace.name, "units": trace.units, "gates": reduced,
+                       "neurons": chosen or None})
+    return {"time_steps": starts, "neuron_mode": neurons, "layers": layers}
+
+
+# =========================
+# Encodings
+# =========================
+def _rounded(values: np.ndarray) -> list:
+    return np.round(values.astype(np.float64), JSON_DECIMALS).tolist()
+
+def to_json(summary: Dict[str, object]) -> Dict[str, object]:
+    """JSON-ready dict; in mean mode it also carries the original first-layer keys."""
+    result: Dict[str, object] = {}
+    layers = summary["layers"]
+    if summary["neuron_mode"] == "mean" and layers:
+        for gate in LEGACY_GATES:
+            result[gate] = _rounded(layers[0]["gates"][gate])
+    result["time_steps"] = summary["time_steps"].tolist()
+    result["neuron_mode"] = summary["neuron_mode"]
+    result["layers"] = [{
+        "name": layer["name"],
+        "units": layer["units"],
+        "neurons": {g: idx.tolist() for g, idx in layer["neurons"].items()} if layer["neurons"] else None,
+        "gates": {g: _rounded(values) for g, values in layer["gates"].items()},
+    } for layer in layers]
+    return result
+
+def iter_ndjson(summary: Dict[str, object]) -> Iterator[str]:
+    """A header line ({"time_steps", "neuron_mode", "layers": [{"name", "units"}]}), then one line per (layer, gate)."""
+    yield json.dumps({
+        "time_steps": summary["time_steps"].tolist(),
+        "neuron_mode": summary["neuron_mode"],
+        "layers": [{"name": layer["name"], "units": layer["units"]} for layer in summary["layers"]],
+    }) + "\n"
+    for layer in summary["layers"]:
+        for gate, values in layer["gates"].items():
+            neurons = layer["neurons"][gate].tolist() if layer["neurons"] else None
+            yield json.dumps({"layer": layer["name"], "gate": gate, "neurons": neurons,
+                              "values": _rounded(values)}) + "\n"
+
+def to_npz(summary: Dict[str, object]) -> bytes:
+    arrays = {"time_steps": summary["time_steps"]}
+    for layer in summary["layers"]:
+        for gate, values in layer["gates"].items():
+            arrays[f"{layer['name']}/{gate}"] = values
+            if layer["neurons"]:
+                arrays[f"{layer['name']}/{gate}/neurons"] = layer["neurons"][gate]
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+def _packed_array(values: np.ndarray) -> Dict[str, object]:
+    values = np.ascontiguousarray(values)
+    return {"dtype": values.dtype.newbyteorder("<").str, "shape": list(values.shape),
+            "data": values.astype(values.dtype.newbyteorder("<"), copy=False).tobytes()}
+
+def to_msgpack(summary: Dict[str, object]) -> bytes:
+    if msgpack is None:
+        raise RuntimeError("msgpack is not installed.")
+    return msgpack.packb({
+        "time_steps": _packed_array(summary["time_steps"]),
+        "neuron_mode": summary["neuron_mode"],
+        "layers": [{
+            "name": layer["name"],
+            "units": layer["units"],
+            "neurons": {g: _packed_array(idx) for g, idx in layer["neurons"].items()} if layer["neurons"] else None,
+            "gates": {g: _packed_array(values) for g, values in layer["gates"].items()},
+        } for layer in summary["layers"]],
+    }, use_bin_type=True)
+
+
+# =========================
+# Cached tracer
+# =========================
+def content_hash(source: Union[bytes, BinaryIO], max_bytes: Optional[int] = None,
+                 block_size: int = 64 * 1024, context: str = "") -> str:
+    """
+    SHA-256 of raw bytes or of a binary stream, read `block_size` bytes at a
+    time. Raises ValueError as soon as more than `max_bytes` have been read.
+    `context` (e.g. audio_io.upload_decode_key) is hashed first, so the same
+    bytes decoded differently get different keys.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    digest = hashlib.sha256()
+    digest.update(context.encode("utf-8") + b"\0")
+    total = 0
+    while True:
+        block = source.read(block_size)
+        if not block:
+            return digest.hexdigest()
+        total += len(block)
+        if max_bytes is not None and total > max_bytes:
+            raise ValueError(f"Upload is larger than {max_bytes} bytes.")
+        digest.update(block)
+
+
+class GateTracer:
+    """
+    Full-resolution traces of recently seen audio, keyed by content hash
+    (LRU, `cache_size` entries). `preprocess` turns a decoded signal into the
+    (time, features) model input; `model` defaults to helpers.main_model.
+    """
+
+    def __init__(self, preprocess, model=None, cache_size: int = CACHE_SIZE):
+        self.preprocess = preprocess
+        self.model = model
+        self.cache_size = max(0, cache_size)
+        self._cache: "OrderedDict[str, List[LayerTrace]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def cached(self, key: str) -> Optional[List[LayerTrace]]:
+        with self._lock:
+            traces = self._cache.get(key)
+            if traces is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            return traces
+
+    def trace(self, key: str, signal) -> Optional[List[LayerTrace]]:
+        """Traces of `signal` (cached under `key`); None if it can't be preprocessed."""
+        traces = self.cached(key)
+        if traces is not None:
+            return traces
+        sample = self.preprocess(signal)
+        if sample is None:
+            return None
+        traces = trace_model(sample[np.newaxis], self.model)[0]
+        with self._lock:
+            self.misses += 1
+            if self.cache_size:
+                self._cache[key] = traces
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return traces
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._cache), "capacity": self.cache_size, "hits": self.hits, "misses": self.misses}
+
+
+__all__ = [
+    "GATES",
+    "NEURON_MODES",
+    "RESPONSE_TYPES",
+    "MSGPACK_TYPES",
+    "LayerTrace",
+    "GateTracer",
+    "trace_lstm_layer",
+    "trace_model",
+    "summarize",
+    "to_json",
+    "iter_ndjson",
+    "to_npz",
+    "to_msgpack",
+    "content_hash",
+]
@@ -1,30 +1,222 @@
 import os
-import tensorflow as tf
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
 import numpy as np
-import librosa
+
+import mfcc_frontend
+from inference_batcher import EmbeddingBatcher
 
 # --- Configuration (MUST MATCH YOUR TRAINING NOTEBOOK) ---
 SAMPLE_RATE = 16000
 N_MFCC = 13
 MAX_LEN = 200 # You used 200 in your final training run
+EMBEDDING_LAYER_INDEX = 4 # main_model.layers[4] is the Dense(64) embedding layer
+
+# --- Inference Backend ---
+# "keras": TensorFlow/Keras model (default).
+# "numpy": pure-NumPy engine reading the same .h5 weights; TensorFlow is never imported.
+EMBEDDING_BACKEND = os.environ.get("KEYVOX_EMBEDDING_BACKEND", "keras").lower()
+
+# --- Variable-length Inference ---
+# Off: every clip is zero-padded/truncated to MAX_LEN frames (what the model was trained on).
+# On: only the real frames are run (packed sequences / Keras masking), and the batcher
+#     groups requests into LENGTH_BUCKETS so short clips are never padded to long ones.
+# Embeddings of clips shorter than MAX_LEN differ between the two modes, so enrollment
+# and verification must use the same setting.
+VARIABLE_LENGTH = os.environ.get("KEYVOX_VARIABLE_LENGTH", "0") == "1"
+LENGTH_BUCKETS = (50, 100, 150, MAX_LEN)
+
+# --- Micro-batching Configuration ---
+# Concurrent requests are grouped into one forward pass. A request waits at most
+# BATCH_MAX_WAIT_MS for company before its batch is run.
+BATCH_MAX_SIZE = int(os.environ.get("KEYVOX_BATCH_MAX_SIZE", "16"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("KEYVOX_BATCH_MAX_WAIT_MS", "5"))
+# A request still waiting for its row after this long is cancelled and answered 503.
+BATCH_TIMEOUT_S = float(os.environ.get("KEYVOX_BATCH_TIMEOUT", "30"))
 
 # --- Load the Model and Create the Embedding Extractor ---
 # This section runs only ONCE when the server starts. It's highly efficient.
-print("--- Loading custom trained LSTM model ---")
+print(f"--- Loading custom trained LSTM model (backend: {EMBEDDING_BACKEND}) ---")
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(BASE_DIR, "models", "lstm_voice_model.h5")
 
-# 1. Load the full model that you trained
-main_model = tf.keras.models.load_model(MODEL_PATH)
+if EMBEDDING_BACKEND == "numpy":
+    from lstm_numpy import NumpyLSTMModel
+
+    # 1. Read the LSTM/Dense weights straight from the .h5 file.
+    main_model = NumpyLSTMModel.from_h5(MODEL_PATH)
+
+    # 2. Same cut as the Keras sub-model: stop at the Dense(64) layer.
+    embedding_model = main_model.truncated(EMBEDDING_LAYER_INDEX)
+
+    # 3. Already vectorized over the batch dimension; nothing to compile.
+    def _predict_embeddings(batch):
+        return embedding_model.predict(batch)
+
+    def _predict_embeddings_variable(batch_and_lengths):
+        batch, lengths = batch_and_lengths
+        return embedding_model.predict(batch, lengths)
+
+elif EMBEDDING_BACKEND == "keras":
+    import tensorflow as tf
+
+    # 1. Load the full model that you trained
+    main_model = tf.keras.models.load_model(MODEL_PATH)
+
+    # 2. The "voiceprint" or "embedding" is the output of the second-to-last layer.
+    #    We create a new, specialized model that stops at this layer to extract the features.
+    embedding_model = tf.keras.Model(
+        inputs=main_model.inputs,
+        outputs=main_model.layers[EMBEDDING_LAYER_INDEX].output # This is the output of the Dense(64) layer
+    )
+
+    # 3. Compile the forward pass once. The batch dimension is left open so every
+    #    micro-batch size reuses the same graph instead of retracing.
+    @tf.function(input_signature=[tf.TensorSpec(shape=[None, MAX_LEN, N_MFCC], dtype=tf.float32)])
+    def _embedding_forward(batch):
+        return embedding_model(batch, training=False)
+
+    def _predict_embeddings(batch):
+        return _embedding_forward(tf.convert_to_tensor(batch, dtype=tf.float32)).numpy()
+
+    # Variable-length variant: time dimension left open, padded frames masked out
+    # of both LSTM layers so they never influence the state.
+    @tf.function(input_signature=[
+        tf.TensorSpec(shape=[None, None, N_MFCC], dtype=tf.float32),
+        tf.TensorSpec(shape=[None], dtype=tf.int32),
+    ])
+    def _embedding_forward_masked(batch, lengths):
+        mask = tf.sequence_mask(lengths, maxlen=tf.shape(batch)[1])
+        x = batch
+        for layer in main_model.layers[:EMBEDDING_LAYER_INDEX + 1]:
+            if isinstance(layer, tf.keras.layers.RNN):
+                x = layer(x, mask=mask)
+            else:
+                x = layer(x, training=False)
+        return x
+
+    def _predict_embeddings_variable(batch_and_lengths):
+        batch, lengths = batch_and_lengths
+        return _embedding_forward_masked(
+            tf.convert_to_tensor(batch, dtype=tf.float32),
+            tf.convert_to_tensor(lengths, dtype=tf.int32),
+        ).numpy()
 
-# 2. The "voiceprint" or "embedding" is the output of the second-to-last layer.
-#    We create a new, specialized model that stops at this layer to extract the features.
-embedding_model = tf.keras.Model(
-    inputs=main_model.inputs,
-    outputs=main_model.layers[4].output # This is the output of the Dense(64) layer
-)
+else:
+    raise ValueError(f"Unknown KEYVOX_EMBEDDING_BACKEND '{EMBEDDING_BACKEND}' (expected 'keras' or 'numpy').")
+
+
+def length_bucket(n_frames):
+    """Smallest LENGTH_BUCKETS entry that fits n_frames."""
+    for bucket in LENGTH_BUCKETS:
+        if n_frames <= bucket:
+            return bucket
+    return LENGTH_BUCKETS[-1]
+
+def _collate_variable(samples):
+    """Pad a list of (frames, N_MFCC) arrays to their bucket width and return (batch, lengths)."""
+    lengths = np.array([len(sample) for sample in samples], dtype=np.int32)
+    width = length_bucket(int(lengths.max()))
+    batch = np.zeros((len(samples), width, N_MFCC), dtype=np.float32)
+    for i, sample in enumerate(samples):
+        batch[i, :len(sample)] = sample
+    return batch, lengths
+
+# 4. All callers share one batcher, so concurrent /api/verify_voice and
+#    /api/enroll_voice requests are served by a single model call.
+if VARIABLE_LENGTH:
+    embedding_batcher = EmbeddingBatcher(
+        _predict_embeddings_variable,
+        max_batch_size=BATCH_MAX_SIZE,
+        max_wait_ms=BATCH_MAX_WAIT_MS,
+        name="lstm_embedding",
+        collate_fn=_collate_variable,
+        bucket_fn=lambda sample: length_bucket(len(sample)),
+    )
+else:
+    embedding_batcher = EmbeddingBatcher(
+        _predict_embeddings,
+        max_batch_size=BATCH_MAX_SIZE,
+        max_wait_ms=BATCH_MAX_WAIT_MS,
+        name="lstm_embedding",
+    )
 print("✅ Custom model and embedding extractor created successfully.")
 
+# --- Out-of-process Inference (serve.py) ---
+# When a pool is installed, get_voice_embedding_from_signal hands the CPU-bound
+# part (MFCC + forward pass) to it instead of running it in the request thread.
+_inference_pool = None
+
+class InferenceUnavailable(RuntimeError):
+    """
+    The inference pool can't serve the request right now (saturated, or
+    restarting after a worker died). Not a property of the audio: it is
+    re-raised, never turned into None, and the server answers 503.
+    """
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def set_inference_pool(pool):
+    """Route in-memory embeddings through `pool.embed(audio)` / `pool.embed_mfccs(mfccs)` (None = compute in-process)."""
+    global _inference_pool
+    _inference_pool = pool
+
+
+def pad_or_truncate(mfccs):
+    """Pad with zero frames or truncate to the fixed MAX_LEN the model was trained on."""
+    return mfcc_frontend.pad_or_truncate(mfccs, MAX_LEN)
+
+
+def _extract_mfccs(audio_filepath):
+    """Load, trim and compute (frames, N_MFCC) MFCCs, truncated to MAX_LEN but not padded."""
+    # 1. Load and Standardize Audio
+    audio = mfcc_frontend.load_audio(audio_filepath, SAMPLE_RATE)
+    return _mfccs_from_signal(audio)
+
+
+def _mfccs_from_signal(audio):
+    """Same as _extract_mfccs for a mono float32 signal already at SAMPLE_RATE."""
+    # 2. Trim Silence (Voice Activity Detection)
+    audio_trimmed = mfcc_frontend.trim_silence(audio, top_db=20, sr=SAMPLE_RATE)
+
+    # 3. Extract MFCCs, already (time, features) with cached mel/DCT bases
+    mfccs = mfcc_frontend.mfcc(audio_trimmed, SAMPLE_RATE, n_mfcc=N_MFCC)
+    return mfccs[:MAX_LEN, :]
+
+
+def _embed_mfccs(mfccs):
+    # 4. Pad to the fixed length the model expects, unless running variable-length
+    if not VARIABLE_LENGTH:
+        mfccs = pad_or_truncate(mfccs)
+
+    # 5. Hand the sample to the shared batcher; it is stacked with any other
+    #    requests arriving within the wait window and run in one pass.
+    try:
+        embedding = embedding_batcher.predict(mfccs, timeout=BATCH_TIMEOUT_S)
+    except FutureTimeoutError:
+        raise InferenceUnavailable(f"No embedding within {BATCH_TIMEOUT_S:.0f}s; the model is overloaded.")
+
+    # Each caller gets back its own row of the batch as a simple 1D array
+    return embedding.flatten()
+
+
+def embed_signal_direct(audio):
+    """
+    MFCC + one forward pass on the calling thread, bypassing the batcher. Used
+    inside serve.py's worker processes, where each process runs one request at a time.
+    """
+    return embed_mfccs_direct(_mfccs_from_signal(audio))
+
+
+def embed_mfccs_direct(mfccs):
+    """embed_signal_direct for (frames, N_MFCC) features that are already computed."""
+    mfccs = mfccs[:MAX_LEN]
+    if VARIABLE_LENGTH:
+        batch = _collate_variable([mfccs])
+        return _predict_embeddings_variable(batch)[0].flatten()
+    return _predict_embeddings(pad_or_truncate(mfccs)[np.newaxis])[0].flatten()
+
 
 def get_voice_embedding(audio_filepath):
     """
@@ -32,54 +224,64 @@ def get_voice_embedding(audio_filepath):
     and returns a 64-dimension numerical voiceprint (embedding).
     """
     try:
-        # 1. Load and Standardize Audio
-        audio, sr = librosa.load(audio_filepath, sr=SAMPLE_RATE, mono=True)
-        
-        # 2. Trim Silence (Voice Activity Detection)
-        audio_trimmed, _ = librosa.effects.trim(audio, top_db=20)
-
-        # 3. Extract MFCCs
-        mfccs = librosa.feature.mfcc(y=audio_trimmed, sr=SAMPLE_RATE, n_mfcc=N_MFCC)
-        mfccs = mfccs.T # Transpose to (time, features)
-        
-        # 4. Pad or Truncate to the fixed length the model expects
-        if mfccs.shape[0] > MAX_LEN:
-            mfccs = mfccs[:MAX_LEN, :]
-        else:
-            padding = np.zeros((MAX_LEN - mfccs.shape[0], N_MFCC))
-            mfccs = np.vstack((mfccs, padding))
-
-        # 5. Add a "batch" dimension because the model expects it
-        mfccs = np.expand_dims(mfccs, axis=0)
-
-        # 6. Use our specialized embedding model to get the voiceprint
-        embedding = embedding_model.predict(mfccs)
-        
-        # The output is a batch of 1, so we squeeze it to a simple 1D array
-        return embedding.flatten()
-
+        return _embed_mfccs(_extract_mfccs(audio_filepath))
     except Exception as e:
         print(f"Error processing audio file {audio_filepath}: {e}")
         return None
 
 
-def preprocess_single_audio_file(audio_filepath):
+def get_voice_embedding_from_signal(audio):
+    """
+    get_voice_embedding for audio that is already decoded in memory
+    (mono float32 at SAMPLE_RATE, e.g. from audio_io.decode_upload).
+    """
+    try:
+        if _inference_pool is not None:
+            return _inference_pool.embed(audio)
+        return _embed_mfccs(_mfccs_from_signal(audio))
+    except InferenceUnavailable:
+        raise
+    except Exception as e:
+        print(f"Error processing in-memory audio: {e}")
+        return None
+
+
+def get_voice_embedding_from_mfccs(mfccs):
+    """
+    The embedding step alone, for (frames, N_MFCC) features computed elsewhere
+    (streaming_verify builds them incrementally from its running log-mel frames).
+    """
+    try:
+        if _inference_pool is not None:
+            return _inference_pool.embed_mfccs(mfccs)
+        return _embed_mfccs(mfccs[:MAX_LEN])
+    except InferenceUnavailable:
+        raise
+    except Exception as e:
+        print(f"Error embedding MFCC features: {e}")
+        return None
+
+
+def preprocess_single_audio_file(audio_filepath, pad=True):
     """
     Takes a single audio file path and processes it into a single,
     correctly shaped MFCC array for model input.
+    With pad=False only the real frames (at most MAX_LEN) are returned.
     """
     try:
         # This logic is the same as in get_voice_embedding
-        audio, sr = librosa.load(audio_filepath, sr=SAMPLE_RATE, mono=True)
-        audio_trimmed, _ = librosa.effects.trim(audio, top_db=20)
-        mfccs = librosa.feature.mfcc(y=audio_trimmed, sr=SAMPLE_RATE, n_mfcc=N_MFCC)
-        mfccs = mfccs.T
-        if mfccs.shape[0] > MAX_LEN:
-            mfccs = mfccs[:MAX_LEN, :]
-        else:
-            padding = np.zeros((MAX_LEN - mfccs.shape[0], N_MFCC))
-            mfccs = np.vstack((mfccs, padding))
-        return mfccs
+        mfccs = _extract_mfccs(audio_filepath)
+        return pad_or_truncate(mfccs) if pad else mfccs
     except Exception as e:
         print(f"Error in preprocess_single_audio_file: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+def preprocess_signal(audio, pad=True):
+    """preprocess_single_audio_file for a mono float32 signal already at SAMPLE_RATE."""
+    try:
+        mfccs = _mfccs_from_signal(audio)
+        return pad_or_truncate(mfccs) if pad else mfccs
+    except Exception as e:
+        print(f"Error in preprocess_signal: {e}")
+        return None
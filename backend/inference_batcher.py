@@ -0,0 +1,204 @@
+# backend/inference_batcher.py
+# Collects concurrent embedding requests into micro-batches so the model runs
+# one forward pass per batch instead of one per HTTP request.
+import threading
+import time
+import queue
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batching scheduler in front of a batch predict function.
+
+    Callers submit one feature tensor each (e.g. a (MAX_LEN, N_MFCC) MFCC
+    matrix). A single worker thread waits for the first request, then keeps
+    collecting more for at most `max_wait_ms` (or until `max_batch_size` is
+    reached), stacks them, runs `predict_fn` once and hands every caller its
+    own row of the output.
+
+    `collate_fn` turns the list of queued samples into whatever `predict_fn`
+    takes (default: np.stack). With `bucket_fn`, samples collected in the same
+    window are split by bucket key (e.g. a length bucket) and each bucket is run
+    as its own batch, so short and long inputs are never padded to each other.
+    """
+
+    def __init__(self,
+                 predict_fn: Callable[[Any], np.ndarray],
+                 max_batch_size: int = 16,
+                 max_wait_ms: float = 5.0,
+                 name: str = "embedding",
+                 collate_fn: Optional[Callable[[List[np.ndarray]], Any]] = None,
+                 bucket_fn: Optional[Callable[[np.ndarray], Any]] = None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        self.predict_fn = predict_fn
+        self.collate_fn = collate_fn or _stack
+        self.bucket_fn = bucket_fn
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait_s = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+
+        self._queue: "queue.Queue[Optional[Tuple[np.ndarray, Future, float]]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+        # --- Occupancy / latency statistics ---
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._size_histogram = [0] * (self.max_batch_size + 1)
+        self._recent = deque(maxlen=100)  # (batch_size, occupancy, forward_ms, wait_ms)
+
+    # =========================
+    # Public API
+    # =========================
+    def submit(self, features: np.ndarray) -> Future:
+        """Queue one sample and return a Future resolving to its model output row."""
+        if self._closed:
+            raise RuntimeError(f"{self.name} batcher is closed")
+        self._ensure_worker()
+        fut: Future = Future()
+        self._queue.put((np.asarray(features, dtype=np.float32), fut, time.perf_counter()))
+        return fut
+
+    def predict(self, features: np.ndarray, timeout: Optional[float] = None) -> np.ndarray:
+        """
+        Blocking convenience wrapper around submit(). On timeout the request is
+        cancelled (dropped if it hasn't reached the model yet) and
+        concurrent.futures.TimeoutError is raised.
+        """
+        fut = self.submit(features)
+        try:
+            return fut.result(timeout=timeout)
+        except FutureTimeoutError:
+            fut.cancel()
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of per-batch occupancy so max_batch_size / max_wait_ms can be tuned."""
+        with self._stats_lock:
+            recent = list(self._recent)
+            batches, items = self._batches, self._items
+            histogram = list(self._size_histogram)
+        return {
+            "name": self.name,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_s * 1000.0,
+            "batches": batches,
+            "items": items,
+            "mean_batch_size": (items / batches) if batches else 0.0,
+            "mean_occupancy": (items / (batches * self.max_batch_size)) if batches else 0.0,
+            "batch_size_histogram": {str(k): v for k, v in enumerate(histogram) if v},
+            "recent_batches": [
+                {"size": s, "occupancy": round(o, 3), "forward_ms": round(f, 3), "max_queue_wait_ms": round(w, 3)}
+                for s, o, f, w in recent
+            ],
+            "queued": self._queue.qsize(),
+        }
+
+    def close(self) -> None:
+        """Stop accepting work; the worker drains what is already queued and exits."""
+        self._closed = True
+        self._queue.put(None)
+
+    # =========================
+    # Worker
+    # =========================
+    def _ensure_worker(self) -> None:
+        # Started lazily so that importing the module (or forking after import)
+        # never leaves a dangling thread behind.
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name=f"{self.name}-batcher", daemon=True)
+                self._worker.start()
+
+    def _collect(self) -> Optional[List[Tuple[np.ndarray, Future, float]]]:
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Put the sentinel back so the loop exits after this batch.
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                for bucket in self._buckets(batch):
+                    self._run_batch(bucket)
+            except Exception as e:
+                # Never let the worker die holding running futures: their callers would wait forever.
+                _fail([fut for _, fut, _ in batch if not fut.done()], e)
+
+    def _buckets(self, batch: List[Tuple[np.ndarray, Future, float]]) -> List[list]:
+        """Split a window by bucket_fn; a sample whose key can't be computed fails alone."""
+        if self.bucket_fn is None:
+            return [batch]
+        buckets: Dict[Any, list] = {}
+        for item in batch:
+            try:
+                key = self.bucket_fn(item[0])
+            except Exception as e:
+                item[1].set_exception(e)
+                continue
+            buckets.setdefault(key, []).append(item)
+        return list(buckets.values())
+
+    def _run_batch(self, batch: List[Tuple[np.ndarray, Future, float]]) -> None:
+        started = time.perf_counter()
+        try:
+            inputs = self.collate_fn([features for features, _, _ in batch])
+            outputs = np.asarray(self.predict_fn(inputs))
+        except Exception as e:
+            _fail([fut for _, fut, _ in batch], e)
+            return
+        forward_ms = (time.perf_counter() - started) * 1000.0
+        if len(outputs) != len(batch):
+            _fail([fut for _, fut, _ in batch],
+                  RuntimeError(f"{self.name} predict_fn returned {len(outputs)} rows for a batch of {len(batch)}"))
+            return
+
+        for row, (_, fut, _) in zip(outputs, batch):
+            fut.set_result(row)
+
+        max_wait_ms = max((started - enqueued) * 1000.0 for _, _, enqueued in batch)
+        self._record(len(batch), forward_ms, max_wait_ms)
+
+    def _record(self, size: int, forward_ms: float, wait_ms: float) -> None:
+        with self._stats_lock:
+            self._batches += 1
+            self._items += size
+            self._size_histogram[size] += 1
+            self._recent.append((size, size / self.max_batch_size, forward_ms, wait_ms))
+
+
+def _fail(futures: List[Future], error: BaseException) -> None:
+    for fut in futures:
+        fut.set_exception(error)
+
+def _stack(samples: List[np.ndarray]) -> np.ndarray:
+    return np.stack(samples, axis=0)
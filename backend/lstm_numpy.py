@@ -0,0 +1,292 @@
+# backend/lstm_numpy.py
+# Minimal NumPy inference engine for the Keras LSTM speaker model.
+# Reads the layer weights straight from models/lstm_voice_model.h5 so the
+# server can produce embeddings without importing TensorFlow.
+import os
+import json
+from typing import Any, Callable, Dict, List, Optional
+
+import h5py
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODEL_PATH = os.path.join(BASE_DIR, "models", "lstm_voice_model.h5")
+
+# Index (in model.layers, InputLayer excluded) of the Dense(64) embedding layer.
+EMBEDDING_LAYER_INDEX = 4
+
+
+# =========================
+# Activations
+# =========================
+def sigmoid(x: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Overflow-free logistic function: sigmoid(x) == 0.5 * (1 + tanh(x / 2))."""
+    out = np.multiply(x, 0.5, out=out)
+    np.tanh(out, out=out)
+    out += 1.0
+    out *= 0.5
+    return out
+
+def relu(x: np.ndarray) -> np.ndarray:
+    return np.maximum(x, 0.0)
+
+def softmax(x: np.ndarray) -> np.ndarray:
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+def linear(x: np.ndarray) -> np.ndarray:
+    return x
+
+_ACTIVATIONS = {
+    "sigmoid": sigmoid,
+    "tanh": np.tanh,
+    "relu": relu,
+    "softmax": softmax,
+    "linear": linear,
+    None: linear,
+}
+
+
+# =========================
+# Layers
+# =========================
+class _Layer:
+    """Shared surface with Keras layers: `.name` and `.get_weights()`."""
+    def __init__(self, name: str, config: Dict[str, Any]):
+        self.name = name
+        self.config = config
+
+    def get_weights(self) -> List[np.ndarray]:
+        return []
+
+    def __call__(self, x: np.ndarray, lengths: Optional[np.ndarray] = None) -> np.ndarray:
+        raise NotImplementedError
+
+
+class DropoutLayer(_Layer):
+    """Identity at inference time."""
+    def __call__(self, x, lengths=None):
+        return x
+
+
+class DenseLayer(_Layer):
+    def __init__(self, name, config, kernel, bias):
+        super().__init__(name, config)
+        self.kernel = kernel
+        self.bias = bias
+        self.activation = _ACTIVATIONS[config.get("activation")]
+
+    def get_weights(self):
+        return [self.kernel, self.bias]
+
+    def __call__(self, x, lengths=None):
+        return self.activation(x @ self.kernel + self.bias)
+
+
+class LSTMLayer(_Layer):
+    """
+    Keras-compatible LSTM (gate order i, f, c, o; sigmoid recurrent activation,
+    tanh cell activation). The input projection for every timestep is done in a
+    single matmul; only the recurrent h @ U term stays inside the time loop.
+
+    With `lengths`, samples are processed as packed sequences: rows are sorted
+    by length and at step t only the rows still inside their sequence are
+    updated, so padded frames cost nothing and finished rows keep their last
+    state (the same result as Keras masking).
+
+    `hook(t, gates, c, h)`, if given, is called after every step with that
+    step's activations: gates (batch, 4H) in gate order (i, f, c, o), the cell
+    state and the hidden state (batch, H). The arrays are reused by the next
+    step, so copy what you keep (gate_tracer.trace_lstm_layer).
+    """
+    def __init__(self, name, config, kernel, recurrent_kernel, bias):
+        super().__init__(name, config)
+        if config.get("activation", "tanh") != "tanh" or config.get("recurrent_activation", "sigmoid") != "sigmoid":
+            raise ValueError(f"LSTM layer '{name}' uses unsupported activations.")
+        if config.get("go_backwards") or config.get("stateful"):
+            raise ValueError(f"LSTM layer '{name}': go_backwards/stateful are not supported.")
+        self.kernel = kernel
+        self.recurrent_kernel = recurrent_kernel
+        self.bias = bias
+        self.units = recurrent_kernel.shape[0]
+        self.return_sequences = bool(config.get("return_sequences", False))
+
+    def get_weights(self):
+        return [self.kernel, self.recurrent_kernel, self.bias]
+
+    def __call__(self, x, lengths=None, hook: Optional[Callable] = None):
+        if lengths is not None and np.min(lengths) < x.shape[1]:
+            if hook is not None:
+                raise ValueError("The gate hook needs unpadded input (no packed lengths).")
+            return self._call_packed(x, np.asarray(lengths))
+        batch, steps, _ = x.shape
+        H = self.units
+        # (B, T, 4H): input contribution + bias for all timesteps at once.
+        xw = x @ self.kernel
+        xw += self.bias
+
+        h = np.zeros((batch, H), dtype=x.dtype)
+        c = np.zeros((batch, H), dtype=x.dtype)
+        z = np.empty((batch, 4 * H), dtype=x.dtype)
+        outputs = np.empty((batch, steps, H), dtype=x.dtype) if self.return_sequences else None
+
+        for t in range(steps):
+            np.matmul(h, self.recurrent_kernel, out=z)
+            z += xw[:, t]
+            sigmoid(z[:, :2 * H], out=z[:, :2 * H])       # input, forget
+            np.tanh(z[:, 2 * H:3 * H], out=z[:, 2 * H:3 * H])  # candidate
+            sigmoid(z[:, 3 * H:], out=z[:, 3 * H:])       # output
+            c *= z[:, H:2 * H]
+            c += z[:, :H] * z[:, 2 * H:3 * H]
+            np.multiply(z[:, 3 * H:], np.tanh(c), out=h)
+            if outputs is not None:
+                outputs[:, t] = h
+            if hook is not None:
+                hook(t, z, c, h)
+
+        return outputs if outputs is not None else h
+
+    def _call_packed(self, x, lengths):
+        batch, steps, _ = x.shape
+        H = self.units
+        lengths = np.minimum(lengths.astype(np.int64), steps)
+
+        # Longest first, so the rows still active at step t are always a prefix.
+        order = np.argsort(-lengths, kind="stable")
+        sorted_lengths = lengths[order]
+        max_len = int(sorted_lengths[0]) if batch else 0
+        # active[t] = number of rows with length > t
+        active = np.searchsorted(-sorted_lengths, -np.arange(max_len), side="left")
+
+        xs = x[order, :max_len]
+        xw = xs @ self.kernel
+        xw += self.bias
+
+        h = np.zeros((batch, H), dtype=x.dtype)
+        c = np.zeros((batch, H), dtype=x.dtype)
+        z = np.empty((batch, 4 * H), dtype=x.dtype)
+        outputs = np.zeros((batch, steps, H), dtype=x.dtype) if self.return_sequences else None
+
+        for t in range(max_len):
+            n = int(active[t])
+            zt, ht, ct = z[:n], h[:n], c[:n]
+            np.matmul(ht, self.recurrent_kernel, out=zt)
+            zt += xw[:n, t]
+            sigmoid(zt[:, :2 * H], out=zt[:, :2 * H])
+            np.tanh(zt[:, 2 * H:3 * H], out=zt[:, 2 * H:3 * H])
+            sigmoid(zt[:, 3 * H:], out=zt[:, 3 * H:])
+            ct *= zt[:, H:2 * H]
+            ct += zt[:, :H] * zt[:, 2 * H:3 * H]
+            np.multiply(zt[:, 3 * H:], np.tanh(ct), out=ht)
+            if outputs is not None:
+                outputs[:n, t] = h[:n]
+
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(batch)
+        return outputs[inverse] if outputs is not None else h[inverse]
+
+
+# =========================
+# Model
+# =========================
+class NumpyLSTMModel:
+    """
+    Sequential stack of LSTM / Dropout / Dense layers loaded from a Keras .h5
+    file. `layers` is indexed like `keras_model.layers`, so code written
+    against `main_model.layers[i].get_weights()` works with either.
+    """
+    def __init__(self, layers: List[_Layer], input_shape=None, dtype=np.float32):
+        self.layers = layers
+        self.input_shape = input_shape
+        self.dtype = dtype
+
+    @classmethod
+    def from_h5(cls, path: str = DEFAULT_MODEL_PATH, dtype=np.float32) -> "NumpyLSTMModel":
+        with h5py.File(path, "r") as f:
+            model_config = json.loads(_as_str(f.attrs["model_config"]))
+            if model_config.get("class_name") != "Sequential":
+                raise ValueError(f"Only Sequential models are supported, got {model_config.get('class_name')}.")
+            weights_root = f["model_weights"] if "model_weights" in f else f
+
+            input_shape = None
+            layers: List[_Layer] = []
+            for layer_cfg in model_config["config"]["layers"]:
+                kind = layer_cfg["class_name"]
+                cfg = layer_cfg["config"]
+                if kind == "InputLayer":
+                    input_shape = cfg.get("batch_shape") or cfg.get("batch_input_shape")
+                    continue
+                name = cfg["name"]
+                weights = _read_layer_weights(weights_root, name, dtype)
+                if kind == "LSTM":
+                    layers.append(LSTMLayer(name, cfg, *weights))
+                elif kind == "Dense":
+                    layers.append(DenseLayer(name, cfg, *weights))
+                elif kind == "Dropout":
+                    layers.append(DropoutLayer(name, cfg))
+                else:
+                    raise ValueError(f"Unsupported layer type '{kind}' ({name}).")
+        return cls(layers, input_shape=input_shape, dtype=dtype)
+
+    def truncated(self, last_layer_index: int) -> "NumpyLSTMModel":
+        """Sub-model that stops after layers[last_layer_index] (shares weights)."""
+        return NumpyLSTMModel(self.layers[:last_layer_index + 1], self.input_shape, self.dtype)
+
+    def predict(self, x: np.ndarray, lengths: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Run a (batch, time, features) array through every layer.
+        `lengths` (one int per sample) marks how many leading frames are real;
+        the rest is treated as padding and skipped.
+        """
+        out = np.asarray(x, dtype=self.dtype)
+        if out.ndim == 2:
+            out = out[np.newaxis]
+        for layer in self.layers:
+            out = layer(out, lengths)
+        return out
+
+    __call__ = predict
+
+
+def _as_str(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+def _read_layer_weights(weights_root, layer_name: str, dtype) -> List[np.ndarray]:
+    """Weights of one layer in Keras get_weights() order, as listed in the h5 'weight_names' attr."""
+    if layer_name not in weights_root:
+        return []
+    group = weights_root[layer_name]
+    names = [_as_str(n) for n in group.attrs.get("weight_names", [])]
+    return [np.asarray(group[n], dtype=dtype) for n in names]
+
+
+# =========================
+# Parity check against Keras
+# =========================
+def check_parity(model_path: str = DEFAULT_MODEL_PATH, batch_size: int = 8, atol: float = 1e-4, seed: int = 0) -> float:
+    """
+    Compare NumPy embeddings with the Keras embedding sub-model on random
+    MFCC-like inputs. Returns the max absolute difference; raises
+    AssertionError if it exceeds `atol`. Needs TensorFlow installed.
+    """
+    import tensorflow as tf
+
+    keras_model = tf.keras.models.load_model(model_path)
+    keras_embedding = tf.keras.Model(inputs=keras_model.inputs, outputs=keras_model.layers[EMBEDDING_LAYER_INDEX].output)
+    numpy_embedding = NumpyLSTMModel.from_h5(model_path).truncated(EMBEDDING_LAYER_INDEX)
+
+    _, steps, n_features = keras_model.input_shape
+    rng = np.random.default_rng(seed)
+    x = (rng.standard_normal((batch_size, steps, n_features)) * 50.0).astype(np.float32)
+    x[batch_size // 2:, steps // 3:] = 0.0  # include zero-padded samples like short clips
+
+    expected = keras_embedding.predict(x, verbose=0)
+    actual = numpy_embedding.predict(x)
+    max_diff = float(np.max(np.abs(expected - actual)))
+    assert max_diff <= atol, f"NumPy engine deviates from Keras by {max_diff:.3g} (atol={atol})"
+    return max_diff
+
+
+if __name__ == "__main__":
+    diff = check_parity()
+    print(f"✅ NumPy LSTM engine matches Keras (max abs diff {diff:.2e}).")
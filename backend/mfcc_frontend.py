@@ -0,0 +1,248 @@
+# backend/mfcc_frontend.py
+# One MFCC front end for helpers.py and extract_features.py.
+#
+# Numerically equivalent to librosa.feature.mfcc with its defaults (centered
+# Hann STFT, Slaney mel filterbank, power_to_db with top_db=80, orthonormal
+# DCT-II), but the window, mel filterbank and DCT basis are built once per
+# configuration and cached, and a whole batch of clips goes through a single
+# FFT / matmul pipeline.
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+import numpy as np
+import librosa
+
+import vad
+
+# --- Defaults (librosa.feature.mfcc defaults) ---
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 128
+TOP_DB = 80.0
+AMIN = 1e-10
+
+
+# =========================
+# Cached bases
+# =========================
+def _hz_to_mel(freqs: np.ndarray) -> np.ndarray:
+    """Slaney mel scale (linear below 1 kHz, logarithmic above)."""
+    freqs = np.asanyarray(freqs, dtype=np.float64)
+    f_sp = 200.0 / 3
+    mels = freqs / f_sp
+    min_log_hz = 1000.0
+    min_log_mel = min_log_hz / f_sp
+    logstep = np.log(6.4) / 27.0
+    log_t = freqs >= min_log_hz
+    mels[log_t] = min_log_mel + np.log(freqs[log_t] / min_log_hz) / logstep
+    return mels
+
+def _mel_to_hz(mels: np.ndarray) -> np.ndarray:
+    mels = np.asanyarray(mels, dtype=np.float64)
+    f_sp = 200.0 / 3
+    freqs = f_sp * mels
+    min_log_hz = 1000.0
+    min_log_mel = min_log_hz / f_sp
+    logstep = np.log(6.4) / 27.0
+    log_t = mels >= min_log_mel
+    freqs[log_t] = min_log_hz * np.exp(logstep * (mels[log_t] - min_log_mel))
+    return freqs
+
+@lru_cache(maxsize=16)
+def hann_window(n_fft: int) -> np.ndarray:
+    """Periodic Hann window (what scipy.signal.get_window('hann', n) returns)."""
+    n = np.arange(n_fft, dtype=np.float64)
+    return (0.5 - 0.5 * np.cos(2.0 * np.pi * n / n_fft)).astype(np.float32)
+
+@lru_cache(maxsize=16)
+def mel_filterbank(sr: int, n_fft: int, n_mels: int = N_MELS,
+                   fmin: float = 0.0, fmax: Optional[float] = None) -> np.ndarray:
+    """(n_fft // 2 + 1, n_mels) Slaney-normalised mel filterbank, ready for `power @ basis`."""
+    fmax = sr / 2.0 if fmax is None else fmax
+    fftfreqs = np.fft.rfftfreq(n_fft, d=1.0 / sr)
+    mel_f = _mel_to_hz(np.linspace(_hz_to_mel(np.array([fmin]))[0], _hz_to_mel(np.array([fmax]))[0], n_mels + 2))
+
+    fdiff = np.diff(mel_f)
+    ramps = mel_f[:, np.newaxis] - fftfreqs[np.newaxis, :]
+    lower = -ramps[:-2] / fdiff[:-1, np.newaxis]
+    upper = ramps[2:] / fdiff[1:, np.newaxis]
+    weights = np.maximum(0.0, np.minimum(lower, upper))
+
+    enorm = 2.0 / (mel_f[2:n_mels + 2] - mel_f[:n_mels])
+    weights *= enorm[:, np.newaxis]
+    basis = np.ascontiguousarray(weights.T.astype(np.float32))
+    basis.flags.writeable = False
+    return basis
+
+@lru_cache(maxsize=16)
+def dct_basis(n_mels: int, n_mfcc: int) -> np.ndarray:
+    """(n_mels, n_mfcc) orthonormal DCT-II matrix, truncated to the first n_mfcc coefficients."""
+    n = np.arange(n_mels, dtype=np.float64)
+    k = np.arange(n_mfcc, dtype=np.float64)[:, np.newaxis]
+    basis = np.cos(np.pi * k * (2.0 * n + 1.0) / (2.0 * n_mels)) * np.sqrt(2.0 / n_mels)
+    basis[0] *= 1.0 / np.sqrt(2.0)
+    basis = np.ascontiguousarray(basis.T.astype(np.float32))
+    basis.flags.writeable = False
+    return basis
+
+
+# =========================
+# Feature computation
+# =========================
+def _frames(signal: np.ndarray, n_fft: int, hop_length: int) -> np.ndarray:
+    """Centered (zero-padded) frames of one clip as a strided view: (n_frames, n_fft)."""
+    padded = np.pad(signal, n_fft // 2, mode="constant")
+    if len(padded) < n_fft:
+        padded = np.pad(padded, (0, n_fft - len(padded)), mode="constant")
+    return np.lib.stride_tricks.sliding_window_view(padded, n_fft)[::hop_length]
+
+def mfcc_batch(signals: Sequence[np.ndarray], sr: int, n_mfcc: int = 13,
+               n_fft: int = N_FFT, hop_length: int = HOP_LENGTH, n_mels: int = N_MELS,
+               top_db: Optional[float] = TOP_DB) -> List[np.ndarray]:
+    """
+    MFCCs for a batch of mono clips of any lengths.
+    Returns one (n_frames, n_mfcc) float32 array per clip (time-major, as the
+    models expect, i.e. already transposed compared to librosa).
+    """
+    if len(signals) == 0:
+        return []
+    window = hann_window(n_fft)
+    mel_basis = mel_filterbank(sr, n_fft, n_mels)
+    dct = dct_basis(n_mels, n_mfcc)
+
+    # 1. Frame every clip and stack all frames so the rest runs as one batch.
+    views = [_frames(np.asarray(s, dtype=np.float32), n_fft, hop_length) for s in signals]
+    counts = np.array([len(v) for v in views])
+    frames = np.concatenate(views, axis=0) if len(views) > 1 else np.array(views[0])
+    frames *= window
+
+    # 2. STFT -> power -> mel.
+    spectrum = np.fft.rfft(frames, axis=1)
+    power = spectrum.real ** 2
+    power += spectrum.imag ** 2
+    mel = power.astype(np.float32, copy=False) @ mel_basis
+
+    # 3. power_to_db (ref=1.0), with the top_db floor taken per clip.
+    log_mel = 10.0 * np.log10(np.maximum(mel, AMIN))
+    if top_db is not None:
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        clip_max = np.maximum.reduceat(log_mel.max(axis=1), offsets)
+        np.maximum(log_mel, np.repeat(clip_max - top_db, counts)[:, np.newaxis], out=log_mel)
+
+    # 4. DCT-II (orthonormal), keeping the first n_mfcc coefficients.
+    mfccs = log_mel @ dct
+    return np.split(mfccs, np.cumsum(counts)[:-1], axis=0)
+
+def mfcc(signal: np.ndarray, sr: int, n_mfcc: int = 13, n_fft: int = N_FFT,
+         hop_length: int = HOP_LENGTH, n_mels: int = N_MELS,
+         top_db: Optional[float] = TOP_DB) -> np.ndarray:
+    """(n_frames, n_mfcc) MFCCs of one clip."""
+    return mfcc_batch([signal], sr, n_mfcc, n_fft, hop_length, n_mels, top_db)[0]
+
+
+# =========================
+# Streaming
+# =========================
+def log_mel_to_mfcc(log_mel: np.ndarray, n_mfcc: int = 13, top_db: Optional[float] = TOP_DB) -> np.ndarray:
+    """Steps 3-4 of mfcc_batch for one clip's (n_frames, n_mels) dB mel rows: top_db floor, then DCT."""
+    if top_db is not None and len(log_mel):
+        log_mel = np.maximum(log_mel, log_mel.max() - top_db)
+    return log_mel @ dct_basis(log_mel.shape[1], n_mfcc)
+
+class StreamingMFCC:
+    """
+    The log-mel rows of mfcc() for audio that arrives in chunks. Each centered
+    frame goes through window -> FFT -> mel -> dB exactly once, as soon as its
+    last sample has arrived, and only the samples later frames still overlap
+    are kept. log_mel_to_mfcc turns any run of rows into MFCCs (taking the
+    top_db floor over just those rows); over all rows after finish() that is
+    exactly mfcc() of the whole signal.
+    """
+
+    def __init__(self, sr: int, n_fft: int = N_FFT, hop_length: int = HOP_LENGTH, n_mels: int = N_MELS):
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_mels = n_mels
+        self.n_samples = 0
+        self.finished = False
+        # Padded signal from the next frame's first sample on (centered framing
+        # starts with n_fft // 2 zeros).
+        self._tail = np.zeros(n_fft // 2, dtype=np.float32)
+        self._log_mel = np.zeros((0, n_mels), dtype=np.float32)
+
+    @property
+    def n_frames(self) -> int:
+        return len(self._log_mel)
+
+    @property
+    def log_mel(self) -> np.ndarray:
+        """(n_frames, n_mels) dB mel rows of every completed frame."""
+        return self._log_mel
+
+    def feed(self, samples: np.ndarray) -> int:
+        """Add samples; returns how many frames became complete."""
+        if len(samples) == 0 or self.finished:
+            return 0
+        self._tail = np.concatenate((self._tail, np.asarray(samples, dtype=np.float32)))
+        self.n_samples += len(samples)
+        complete = (self.n_frames * self.hop_length + len(self._tail) - self.n_fft) // self.hop_length + 1
+        return self._extend(min(complete, 1 + self.n_samples // self.hop_length))
+
+    def finish(self) -> int:
+        """End of stream: the trailing frames (zero-padded past the end) are completed."""
+        self._tail = np.concatenate((self._tail, np.zeros(self.n_fft - self.n_fft // 2, dtype=np.float32)))
+        added = self._extend(1 + self.n_samples // self.hop_length)
+        self.finished = True
+        return added
+
+    def _extend(self, n_frames: int) -> int:
+        added = n_frames - self.n_frames
+        if added <= 0:
+            return 0
+        frames = np.lib.stride_tricks.sliding_window_view(self._tail, self.n_fft)[::self.hop_length][:added]
+        frames = frames * hann_window(self.n_fft)
+        spectrum = np.fft.rfft(frames, axis=1)
+        power = spectrum.real ** 2
+        power += spectrum.imag ** 2
+        mel = power.astype(np.float32, copy=False) @ mel_filterbank(self.sr, self.n_fft, self.n_mels)
+        self._log_mel = np.concatenate((self._log_mel, 10.0 * np.log10(np.maximum(mel, AMIN))))
+        self._tail = self._tail[added * self.hop_length:]
+        return added
+
+
+# =========================
+# Pipeline helpers
+# =========================
+def load_audio(audio_filepath: str, sr: int) -> np.ndarray:
+    """Decode, downmix and resample a file to `sr`."""
+    signal, _ = librosa.load(audio_filepath, sr=sr, mono=True)
+    return signal
+
+def trim_silence(signal: np.ndarray, top_db: float, sr: int) -> np.ndarray:
+    """
+    Drop audio quieter than `top_db` below the loudest frame with the shared VAD
+    (vad.py): leading/trailing only (same endpoints as librosa.effects.trim), or
+    internal pauses too with KEYVOX_VAD_MODE=segments.
+    """
+    return vad.remove_silence(signal, sr, top_db=top_db)
+
+def pad_or_truncate(mfccs: np.ndarray, max_len: int) -> np.ndarray:
+    """Zero-pad or cut (frames, n_mfcc) features to exactly max_len frames."""
+    if mfccs.shape[0] >= max_len:
+        return mfccs[:max_len]
+    out = np.zeros((max_len, mfccs.shape[1]), dtype=mfccs.dtype)
+    out[:mfccs.shape[0]] = mfccs
+    return out
+
+def extract_mfccs(audio_filepath: str, sr: int, n_mfcc: int = 13, top_db: float = 20,
+                  n_fft: int = N_FFT, hop_length: int = HOP_LENGTH) -> np.ndarray:
+    """Load -> trim -> MFCC for one file; returns (n_frames, n_mfcc)."""
+    signal = trim_silence(load_audio(audio_filepath, sr), top_db, sr)
+    return mfcc(signal, sr, n_mfcc=n_mfcc, n_fft=n_fft, hop_length=hop_length)
+
+def extract_mfccs_batch(audio_filepaths: Sequence[str], sr: int, n_mfcc: int = 13, top_db: float = 20,
+                        n_fft: int = N_FFT, hop_length: int = HOP_LENGTH) -> List[np.ndarray]:
+    """extract_mfccs for many files, with the spectral part done as one batch."""
+    signals = [trim_silence(load_audio(p, sr), top_db, sr) for p in audio_filepaths]
+    return mfcc_batch(signals, sr, n_mfcc=n_mfcc, n_fft=n_fft, hop_length=hop_length)
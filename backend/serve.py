@@ -0,0 +1,198 @@
+# backend/serve.py
+# Production entry point (server.py's `app.run(debug=True)` is for development):
+#
+#   python serve.py
+#
+# The embedding model is loaded once here, then KEYVOX_WORKERS inference
+# processes are forked from this parent so they share the weights
+# copy-on-write. HTTP is served by a threaded WSGI server; request threads
+# only decode audio and score voiceprints, while MFCC + forward pass run in
+# the process pool, so one slow inference never stalls the other requests.
+import os
+
+# One BLAS thread per process: the parallelism comes from the worker processes.
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+# The pure-NumPy engine is fork-safe; TensorFlow must not be initialised before
+# a fork, so with KEYVOX_EMBEDDING_BACKEND=keras the workers are spawned instead
+# (each loads its own copy of the model).
+os.environ.setdefault("KEYVOX_EMBEDDING_BACKEND", "numpy")
+
+import sys
+import math
+import time
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import helpers
+
+# =========================
+# Public constants / knobs
+# =========================
+WORKERS = int(os.environ.get("KEYVOX_WORKERS", str(os.cpu_count() or 1)))
+# Inference requests allowed in flight (running + queued) before callers block.
+MAX_PENDING = int(os.environ.get("KEYVOX_INFERENCE_QUEUE", str(4 * WORKERS)))
+# How long a request thread waits for a free slot before giving up.
+SUBMIT_TIMEOUT_S = float(os.environ.get("KEYVOX_INFERENCE_TIMEOUT", "30"))
+HTTP_THREADS = int(os.environ.get("KEYVOX_HTTP_THREADS", "16"))
+HOST = os.environ.get("KEYVOX_HOST", "0.0.0.0")
+PORT = int(os.environ.get("KEYVOX_PORT", "5000"))
+
+
+class InferenceBusy(helpers.InferenceUnavailable):
+    """Every inference slot stayed taken for SUBMIT_TIMEOUT_S."""
+
+
+# =========================
+# Worker side
+# =========================
+def _worker_init() -> None:
+    # fork: the model is already in memory (inherited). spawn: importing helpers loads it.
+    import helpers as worker_helpers
+    worker_helpers.set_inference_pool(None)
+
+def _embed(audio: np.ndarray):
+    return helpers.embed_signal_direct(audio)
+
+def _embed_mfccs(mfccs: np.ndarray):
+    return helpers.embed_mfccs_direct(mfccs)
+
+
+# =========================
+# Parent side
+# =========================
+class InferencePool:
+    """
+    Bounded process pool for embeddings. At most `max_pending` requests are
+    submitted at once; further callers wait (up to SUBMIT_TIMEOUT_S) instead
+    of growing an unbounded queue.
+    """
+
+    def __init__(self, workers: int = WORKERS, max_pending: int = MAX_PENDING):
+        self.workers = max(1, workers)
+        self.max_pending = max(self.workers, max_pending)
+        fork_ok = helpers.EMBEDDING_BACKEND == "numpy" and "fork" in mp.get_all_start_methods()
+        self.start_method = "fork" if fork_ok else "spawn"
+        if not fork_ok:
+            print(f"⚠️ Inference workers use '{self.start_method}': each loads its own model (no shared weights).")
+        self._executor = self._new_executor()
+        self._executor_lock = threading.Lock()
+        self._restarts = 0
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._busy_ms = 0.0
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=mp.get_context(self.start_method),
+                                   initializer=_worker_init)
+
+    def _restart(self, broken: ProcessPoolExecutor) -> None:
+        """Replace a pool whose worker died (once, however many requests saw it break)."""
+        with self._executor_lock:
+            if self._executor is not broken:
+                return
+            print("⚠️ An inference worker died; restarting the pool.")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._new_executor()
+            self._restarts += 1
+
+    def _retry_after(self) -> int:
+        """Seconds until a slot should be free: the queue drained at the mean service time."""
+        with self._stats_lock:
+            mean_s = self._busy_ms / self._completed / 1000.0 if self._completed else 1.0
+        return max(1, math.ceil(mean_s * self.max_pending / self.workers))
+
+    def warm_up(self) -> None:
+        """Start every worker and run one forward pass in each before traffic arrives."""
+        started = time.perf_counter()
+        noise = (0.1 * np.random.default_rng(0).standard_normal(helpers.SAMPLE_RATE)).astype(np.float32)
+        for future in [self._executor.submit(_embed, noise) for _ in range(self.workers)]:
+            future.result()
+        print(f"✅ {self.workers} inference worker(s) ready ({self.start_method}, "
+              f"{(time.perf_counter() - started) * 1000:.0f} ms).")
+
+    def embed(self, audio: np.ndarray):
+        return self._submit(_embed, audio)
+
+    def embed_mfccs(self, mfccs: np.ndarray):
+        return self._submit(_embed_mfccs, mfccs)
+
+    def _submit(self, fn, array: np.ndarray):
+        if not self._slots.acquire(timeout=SUBMIT_TIMEOUT_S):
+            with self._stats_lock:
+                self._rejected += 1
+            raise InferenceBusy(f"All {self.max_pending} inference slots busy for {SUBMIT_TIMEOUT_S:.0f}s.",
+                                self._retry_after())
+        started = time.perf_counter()
+        with self._stats_lock:
+            self._in_flight += 1
+        executor = self._executor
+        try:
+            return executor.submit(fn, np.ascontiguousarray(array, dtype=np.float32)).result()
+        except BrokenProcessPool as e:
+            self._restart(executor)
+            raise helpers.InferenceUnavailable(f"Inference worker died ({e}); the pool is restarting.") from e
+        finally:
+            self._slots.release()
+            with self._stats_lock:
+                self._in_flight -= 1
+                self._completed += 1
+                self._busy_ms += (time.perf_counter() - started) * 1000.0
+
+    def stats(self) -> Dict[str, object]:
+        with self._stats_lock:
+            return {
+                "workers": self.workers,
+                "start_method": self.start_method,
+                "max_pending": self.max_pending,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "restarts": self._restarts,
+                "mean_ms": round(self._busy_ms / self._completed, 2) if self._completed else None,
+            }
+
+    def shutdown(self) -> None:
+        with self._executor_lock:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def serve_http(app) -> None:
+    """waitress if installed (multi-threaded, production grade), else werkzeug's threaded server."""
+    try:
+        from waitress import serve
+    except ImportError:
+        from werkzeug.serving import make_server
+        print("⚠️ waitress not installed; falling back to werkzeug's threaded server.")
+        make_server(HOST, PORT, app, threaded=True).serve_forever()
+    else:
+        serve(app, host=HOST, port=PORT, threads=HTTP_THREADS)
+
+
+def main() -> None:
+    pool = InferencePool()
+    # Workers are forked before server.py is imported, so they carry only the
+    # model, not the voiceprint store, indexes or HTTP state.
+    pool.warm_up()
+    helpers.set_inference_pool(pool)
+
+    import server
+    server.app.add_url_rule("/api/inference_pool", "inference_pool", lambda: server.jsonify(pool.stats()))
+    print(f"--- KeyVox serving on http://{HOST}:{PORT} ({pool.workers} inference workers, {HTTP_THREADS} HTTP threads) ---")
+    try:
+        serve_http(server.app)
+    finally:
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,12 @@
 import os
 import sys
 import json
-import shutil
 import hashlib
 from datetime import datetime
 
 # --- Third-Party Libraries ---
 import numpy as np
-from flask import Flask, request, jsonify
+from flask import Flask, Response, abort, request, jsonify
 from flask_cors import CORS
 from scipy.spatial.distance import cosine
 import speech_recognition as sr
@@ -18,14 +17,25 @@ import soundfile as sf
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # --- Import our custom helpers ---
-from helpers import get_voice_embedding
+from helpers import (get_voice_embedding_from_signal, get_voice_embedding_from_mfccs, embedding_batcher,
+                     preprocess_signal, InferenceUnavailable)
+from audio_io import (AUDIO_FORMATS, MAX_UPLOAD_BYTES, decode_upload, save_upload_as_wav, upload_decode_key,
+                      upload_size)
 from config import VOICEPRINTS_DIR
-from extract_features import preprocess_and_extract_features, save_data_to_json
-from visualizer import analyze_lstm_gates
+from voiceprint_store import VoiceprintStore, legacy_voiceprint_files, migrate_legacy_files, resolve_legacy_path
+from speaker_index import SpeakerIndex
+from streaming_verify import StreamingVerifier, MAX_STREAM_SECONDS
+from admission import AdmissionController, AdmissionRejected, rejection_response
+from user_registry import get_registry
+from feature_store import FeatureStore
+from gate_tracer import (GateTracer, RESPONSE_TYPES, NEURON_MODES, DEFAULT_TOP_K, MIME_JSON, MIME_NDJSON, MIME_NPZ,
+                         MSGPACK_TYPES, content_hash, summarize, to_json, iter_ndjson, to_npz, to_msgpack)
 
 # --- Flask App Initialization ---
 app = Flask(__name__)
 CORS(app)
+# Request bodies are refused (413) past one maximum-size upload plus the multipart framing.
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + 64 * 1024
 
 # --- Global Path and Configuration Setup ---
 USER_DB_PATH = os.path.join(os.path.dirname(__file__), 'users.json')
@@ -47,108 +57,154 @@ ACCEPTED_PASSPHRASES = [
     "my voice is my password"
 ]
 
+# --- Voiceprint Store ---
+# All voiceprints live in one memory-mapped matrix (voiceprints/voiceprints.index.json
+# + voiceprints.<gen>.f32). The old per-user .npy files are imported once.
+voiceprint_store = VoiceprintStore(VOICEPRINTS_DIR)
+# 1:N search over the same store (brute force, or IVF for large populations).
+speaker_index = SpeakerIndex(voiceprint_store)
+
+# Bounded, prioritised admission for the inference endpoints (admission.py):
+# verifications go first, excess load gets 429/503 + Retry-After.
+admission = AdmissionController()
+
+# Open /api/verify_stream sessions (audio arrives in chunks while the user speaks).
+# Each one holds a verify_voice admission slot from start until it is decided,
+# cancelled or expired, so its chunks never queue behind other requests.
+streaming_verifier = StreamingVerifier(get_voice_embedding_from_signal, SECURITY_THRESHOLD,
+                                       segment_embed_fn=get_voice_embedding_from_mfccs,
+                                       admission=admission)
+
+# Per-neuron gate traces of every LSTM layer, cached by upload content hash.
+gate_tracer = GateTracer(preprocess_signal)
+
+# MFCCs of the enrollment recordings, one file per recording content hash
+# (features/). Enrolling extracts only the new recording.
+feature_store = FeatureStore()
+
 # --- User Data Helper Functions ---
-def read_users():
-    if not os.path.exists(USER_DB_PATH): return {}
-    with open(USER_DB_PATH, 'r') as f:
-        try: return json.load(f)
-        except json.JSONDecodeError: return {}
-def write_users(data):
-    with open(USER_DB_PATH, 'w') as f:
-        json.dump(data, f, indent=4)
+# Accounts live in SQLite (users.db, WAL); users.json is imported on first start.
+user_registry = get_registry(USER_DB_PATH)
+
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
+def migrate_voiceprint_files():
+    """First start with the store: import voiceprints/<user>.npy and the files users.json points to."""
+    if os.path.exists(voiceprint_store.index_path):
+        return
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    referenced = {
+        username: resolve_legacy_path(user.get('voiceprint_path'), backend_dir, VOICEPRINTS_DIR)
+        for username, user in user_registry.items() if user.get('voiceprint_path')
+    }
+    migrate_legacy_files(voiceprint_store, legacy_voiceprint_files(VOICEPRINTS_DIR, ".npy", referenced))
+
+migrate_voiceprint_files()
+
 # ==============================================================================
 # === API ENDPOINTS ===
 # ==============================================================================
 
+@app.errorhandler(InferenceUnavailable)
+def inference_unavailable(e):
+    # Inference pool saturated or restarting (serve.py): a server condition,
+    # not a bad recording or a failed match, so answer like admission.py does.
+    response = jsonify({"status": "error", "message": str(e), "retry_after": e.retry_after})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({"status": "error", "message": f"Upload too large (limit {MAX_UPLOAD_BYTES} bytes)."}), 413
+
 @app.route('/api/status', methods=['GET'])
 def status():
-    return jsonify({"status": "ok"})
+    # audio_formats: upload transports accepted by the audio endpoints (see audio_io.py).
+    return jsonify({"status": "ok", "audio_formats": list(AUDIO_FORMATS)})
+
+@app.route('/api/inference_stats', methods=['GET'])
+def inference_stats():
+    # Per-batch occupancy of the embedding micro-batcher, used to tune
+    # KEYVOX_BATCH_MAX_SIZE / KEYVOX_BATCH_MAX_WAIT_MS.
+    return jsonify(embedding_batcher.stats())
+
+@app.route('/api/admission_stats', methods=['GET'])
+def admission_stats():
+    # Queue depth, wait times and 429/503 counts per inference endpoint.
+    return jsonify(admission.metrics())
 
 @app.route('/api/register', methods=['POST'])
 def register():
     data = request.get_json()
-    users = read_users()
     username = data['username'].lower()
-    if username in users:
-        return jsonify({"status": "error", "message": "Username already exists."}), 409
-    users[username] = {
+    created = user_registry.create(username, {
         "full_name": data['full_name'],
         "email": data['email'],
         "password_hash": hash_password(data['password']),
         "voiceprint_path": None
-    }
-    write_users(users)
+    })
+    if not created:
+        return jsonify({"status": "error", "message": "Username already exists."}), 409
     return jsonify({"status": "success", "message": "User registered. Proceed to voice enrollment."})
 
 @app.route('/api/enroll_voice', methods=['POST'])
+@admission.limit('enroll_voice')
 def enroll_voice():
     username = request.form['username'].lower()
     audio_file = request.files['audio_file']
-    users = read_users()
-    if username not in users:
+    if username not in user_registry:
         return jsonify({"status": "error", "message": "User not found."}), 404
-    temp_filepath = os.path.join(TEMP_AUDIO_DIR, f"enroll_{username}.wav")
-    audio_file.save(temp_filepath)
     try:
-        voice_embedding = get_voice_embedding(temp_filepath)
+        # Decoded straight from the upload stream; no temp file on the hot path.
+        try:
+            signal = decode_upload(audio_file)
+        except Exception as e:
+            return jsonify({"status": "error", "message": f"Could not decode audio file: {e}"}), 400
+        voice_embedding = get_voice_embedding_from_signal(signal)
         if voice_embedding is None:
             return jsonify({"status": "error", "message": "Could not process audio file. It might be too short or silent."}), 400
-        voiceprint_filename = f"{username}.npy"
-        absolute_voiceprint_path = os.path.join(VOICEPRINTS_DIR, voiceprint_filename)
-        np.save(absolute_voiceprint_path, voice_embedding)
-        relative_voiceprint_path = os.path.join("voiceprints", voiceprint_filename)
-        users[username]['voiceprint_path'] = relative_voiceprint_path
-        write_users(users)
+        voiceprint_store.put(username, voice_embedding)
+        # Kept so clients can still tell enrolled users apart; it now names the shared store.
+        user_registry.set_voiceprint_path(username, os.path.join("voiceprints", os.path.basename(voiceprint_store.index_path)))
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         permanent_audio_path = os.path.join(RECORDINGS_DIR, f"{username}_enroll_{timestamp}.wav")
-        shutil.copy(temp_filepath, permanent_audio_path)
-        json_path = os.path.join(os.path.dirname(__file__), "data_features.json")
-        extracted_data = preprocess_and_extract_features(RECORDINGS_DIR)
-        save_data_to_json(extracted_data, json_path)
+        save_upload_as_wav(audio_file, signal, permanent_audio_path)
+        # Only this recording is extracted; `python feature_store.py --export` writes the training dataset.
+        feature_store.add(permanent_audio_path)
         return jsonify({"status": "success", "message": "Voice enrolled and data collected."})
+    except InferenceUnavailable:
+        raise
     except Exception as e:
         return jsonify({"status": "error", "message": f"Enrollment failed: {str(e)}"}), 500
-    finally:
-        if os.path.exists(temp_filepath):
-            os.remove(temp_filepath)
 
 @app.route('/api/check_enrollment', methods=['POST'])
 def check_enrollment():
     username = request.get_json()['username'].lower()
-    user = read_users().get(username)
-    if user and user.get('voiceprint_path') and os.path.exists(user['voiceprint_path']):
+    if username in user_registry and username in voiceprint_store:
         return jsonify({"enrolled": True})
     return jsonify({"enrolled": False, "message": "User not found or voice not enrolled."})
 
 @app.route('/api/verify_voice', methods=['POST'])
+@admission.limit('verify_voice')
 def verify_voice():
     username = request.form['username'].lower()
     audio_file = request.files['audio_file']
-    user = read_users().get(username)
-    
-    temp_filepath = None
-    cleaned_filepath = None
-
-    if not user or not user.get('voiceprint_path'):
+    stored_embedding = voiceprint_store.get(username) if username in user_registry else None
+    if stored_embedding is None:
         return jsonify({"verified": False, "message": "User or voiceprint not found."})
-    
-    stored_voiceprint_path = user['voiceprint_path']
-    if not os.path.exists(stored_voiceprint_path):
-        return jsonify({"verified": False, "message": "Stored voiceprint file is missing."})
         
     try:
-        temp_filepath = os.path.join(TEMP_AUDIO_DIR, f"verify_{username}.wav")
-        audio_file.save(temp_filepath)
+        # Decoded in memory per request, so concurrent verifies for the same
+        # user can no longer overwrite each other's upload.
+        signal = decode_upload(audio_file)
         
         print(f"--- [VERIFY CHECK 1] Running Speaker Verification for {username} ---")
-        live_embedding = get_voice_embedding(temp_filepath)
+        live_embedding = get_voice_embedding_from_signal(signal)
         if live_embedding is None:
             return jsonify({"verified": False, "message": "Could not process live audio for speaker verification."})
-        stored_embedding = np.load(stored_voiceprint_path)
         distance = cosine(stored_embedding, live_embedding)
         print(f"Voice similarity distance: {distance:.4f} (Threshold: < {SECURITY_THRESHOLD})")
         if distance >= SECURITY_THRESHOLD:
@@ -194,39 +250,163 @@ def verify_voice():
         #     return jsonify({"verified": False, "message": "Speech recognition service error."})
         # # --- END OF CORRECTED BLOCK ---
             
+    except InferenceUnavailable:
+        raise
     except Exception as e:
         return jsonify({"verified": False, "message": f"An unexpected error occurred: {str(e)}"})
-    finally:
-        if temp_filepath and os.path.exists(temp_filepath):
-            os.remove(temp_filepath)
-        if cleaned_filepath and os.path.exists(cleaned_filepath):
-            os.remove(cleaned_filepath)
             
+@app.route('/api/verify_stream/start', methods=['POST'])
+def verify_stream_start():
+    data = request.get_json()
+    username = data['username'].lower()
+    sample_rate = int(data.get('sample_rate', 16000))
+    stored_embedding = voiceprint_store.get(username) if username in user_registry else None
+    if stored_embedding is None:
+        return jsonify({"status": "error", "message": "User or voiceprint not found."}), 404
+    if not 8000 <= sample_rate <= 96000:
+        return jsonify({"status": "error", "message": f"Unsupported sample rate {sample_rate}."}), 400
+    try:
+        session = streaming_verifier.start(username, stored_embedding, sample_rate)
+    except AdmissionRejected as e:
+        return rejection_response(e)
+    print(f"--- [VERIFY STREAM] Session {session.session_id} started for {username} @ {sample_rate} Hz ---")
+    return jsonify({
+        "status": "pending",
+        "session_id": session.session_id,
+        "format": "pcm_s16le",
+        "sample_rate": sample_rate,
+        "max_seconds": MAX_STREAM_SECONDS,
+    })
+
+@app.route('/api/verify_stream/<session_id>', methods=['POST'])
+def verify_stream_chunk(session_id):
+    # Body: raw little-endian int16 mono PCM; ?final=1 on the last chunk.
+    final = request.args.get('final', '0') == '1'
+    try:
+        result = streaming_verifier.feed(session_id, request.get_data(), final=final)
+    except AdmissionRejected as e:
+        return rejection_response(e)
+    except InferenceUnavailable:
+        streaming_verifier.close(session_id)
+        raise
+    except Exception as e:
+        streaming_verifier.close(session_id)
+        return jsonify({"status": "reject", "verified": False, "message": f"An unexpected error occurred: {str(e)}"})
+    if result is None:
+        return jsonify({"status": "error", "message": "Unknown or expired session."}), 404
+    if result["status"] != "pending":
+        print(f"--- [VERIFY STREAM] {session_id}: {result['status']} after {result['seconds']:.2f}s "
+              f"(distance {result['distance']}, threshold < {SECURITY_THRESHOLD}) ---")
+    return jsonify(result)
+
+@app.route('/api/verify_stream/<session_id>', methods=['DELETE'])
+def verify_stream_cancel(session_id):
+    return jsonify({"closed": streaming_verifier.close(session_id)})
+
+def identify_speaker(signal, top_k=5):
+    """
+    Embed a decoded signal once and return the top_k enrolled users, best
+    first: [{"username", "score", "distance", "match"}]. `match` applies the
+    same cosine-distance threshold as /api/verify_voice. None if the audio
+    could not be embedded.
+    """
+    live_embedding = get_voice_embedding_from_signal(signal)
+    if live_embedding is None:
+        return None
+    matches = speaker_index.identify(live_embedding, k=top_k)
+    for m in matches:
+        m["distance"] = 1.0 - m["score"]
+        m["match"] = m["distance"] < SECURITY_THRESHOLD
+    return matches
+
+@app.route('/api/identify_voice', methods=['POST'])
+@admission.limit('identify_voice')
+def identify_voice():
+    if 'audio_file' not in request.files: return jsonify({"error": "No audio file provided."}), 400
+    top_k = max(1, min(request.form.get('top_k', 5, type=int), 100))
+    try:
+        signal = decode_upload(request.files['audio_file'])
+    except Exception as e:
+        return jsonify({"error": f"Could not decode audio file: {e}"}), 400
+    try:
+        matches = identify_speaker(signal, top_k=top_k)
+        if matches is None:
+            return jsonify({"error": "Could not process audio for identification."}), 400
+        identified = matches[0]["username"] if matches and matches[0]["match"] else None
+        print(f"--- [IDENTIFY] best={matches[0] if matches else None} ---")
+        return jsonify({"identified": identified, "matches": matches, "index": speaker_index.stats()})
+    except InferenceUnavailable:
+        raise
+    except Exception as e:
+        return jsonify({"error": f"Identification failed: {str(e)}"}), 500
+
 @app.route('/api/login', methods=['POST'])
 def login():
     data = request.get_json()
     username, password = data['username'].lower(), data['password']
-    user = read_users().get(username)
+    user = user_registry.get(username)
     if user and user['password_hash'] == hash_password(password):
         user_details = {k: v for k, v in user.items() if k != 'password_hash'}
         return jsonify({"login_success": True, "user_details": user_details})
     return jsonify({"login_success": False, "message": "Invalid credentials."})
 
 @app.route('/api/visualize_gates', methods=['POST'])
+@admission.limit('visualize_gates')
 def visualize_gates():
+    # Form options: neurons=mean|all|top_k, top_k=<k>, max_steps=<time bins>.
+    # Encoding follows the Accept header: JSON (default), NDJSON (streamed), npz or msgpack.
     if 'audio_file' not in request.files: return jsonify({"error": "No audio file provided."}), 400
     audio_file = request.files['audio_file']
-    temp_filepath = os.path.join(TEMP_AUDIO_DIR, "live_demo.wav")
-    audio_file.save(temp_filepath)
+    neurons = request.form.get('neurons', 'mean')
+    if neurons not in NEURON_MODES:
+        return jsonify({"error": f"neurons must be one of: {', '.join(NEURON_MODES)}."}), 400
+    try:
+        top_k = int(request.form.get('top_k', DEFAULT_TOP_K))
+        max_steps = int(request.form['max_steps']) if request.form.get('max_steps') else None
+    except ValueError:
+        return jsonify({"error": "top_k and max_steps must be integers."}), 400
+
+    # Size check first, then hash the file in blocks (never the whole upload in memory).
+    # The key also covers how the bytes are decoded (pcm16 rate/channels).
+    if upload_size(audio_file) > MAX_UPLOAD_BYTES:
+        abort(413)
     try:
-        gate_data = analyze_lstm_gates(temp_filepath)
-        if "error" in gate_data: return jsonify(gate_data), 400
-        return jsonify(gate_data)
+        decode_key = upload_decode_key(audio_file)
+    except ValueError as e:
+        return jsonify({"error": f"Could not decode audio file: {e}"}), 400
+    try:
+        key = content_hash(audio_file.stream, max_bytes=MAX_UPLOAD_BYTES, context=decode_key)
+    except ValueError:
+        abort(413)
+    finally:
+        audio_file.stream.seek(0)
+    traces = gate_tracer.cached(key)
+    cache_status = "hit" if traces is not None else "miss"
+    try:
+        if traces is None:
+            try:
+                signal = decode_upload(audio_file)
+            except Exception as e:
+                return jsonify({"error": f"Could not decode audio file: {e}"}), 400
+            traces = gate_tracer.trace(key, signal)
+            if traces is None:
+                return jsonify({"error": "Could not process audio file."}), 400
+        summary = summarize(traces, neurons=neurons, top_k=top_k, max_steps=max_steps)
     except Exception as e:
         return jsonify({"error": f"Visualization failed: {str(e)}"}), 500
-    finally:
-        if os.path.exists(temp_filepath):
-            os.remove(temp_filepath)
+
+    mimetype = request.accept_mimetypes.best_match(RESPONSE_TYPES, default=MIME_JSON)
+    if mimetype == MIME_NDJSON:
+        response = Response(iter_ndjson(summary), mimetype=MIME_NDJSON)
+    elif mimetype == MIME_NPZ:
+        response = Response(to_npz(summary), mimetype=MIME_NPZ)
+    elif mimetype in MSGPACK_TYPES:
+        response = Response(to_msgpack(summary), mimetype=mimetype)
+    else:
+        response = jsonify(to_json(summary))
+    response.headers["Vary"] = "Accept"
+    response.headers["X-Gate-Trace-Cache"] = cache_status
+    return response
 
 # --- Main Execution Block ---
 if __name__ == '__main__':
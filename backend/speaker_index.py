@@ -0,0 +1,348 @@
+# backend/speaker_index.py
+# 1:N speaker identification over every enrolled voiceprint.
+#
+# Small populations are searched exactly with one BLAS matmul + argpartition.
+# Large ones use an inverted-file (IVF) index built in-repo: voiceprints are
+# clustered with spherical k-means, each list is stored contiguously, and a
+# query only scans the `nprobe` lists whose centroids are closest to it.
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from voiceprint_codec import EncodedMatrix, VoiceprintCodec, load_codec
+
+# =========================
+# Public constants / knobs
+# =========================
+# At or above this many enrolled users the IVF index is used instead of brute force.
+ANN_MIN_USERS = int(os.environ.get("KEYVOX_ANN_MIN_USERS", "20000"))
+# Inverted lists scanned per query (more = better recall, slower).
+IVF_NPROBE = int(os.environ.get("KEYVOX_IVF_NPROBE", "16"))
+# Rebuild (and retrain) the IVF index once more than this fraction of its
+# trained size has been added since; until then new rows are only assigned.
+IVF_RETRAIN_DRIFT = 0.2
+
+DTYPE = np.float32
+
+
+# =========================
+# Helpers
+# =========================
+def normalize_rows(x: np.ndarray) -> np.ndarray:
+    """L2-normalize each row (cosine similarity becomes a dot product)."""
+    x = np.asarray(x, dtype=DTYPE)
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Indices and values of the k largest entries of each row of `scores`
+    (Q, N), best first. argpartition keeps this O(N) per query.
+    """
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.zeros((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(DTYPE)
+    if k < scores.shape[1]:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    vals = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-vals, axis=1, kind="stable")
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(vals, order, axis=1)
+
+def spherical_kmeans(x: np.ndarray, n_clusters: int, n_iter: int = 10,
+                     max_train: Optional[int] = None, seed: int = 0) -> np.ndarray:
+    """
+    Unit-norm centroids of normalized rows `x`. Assignment is one matmul per
+    iteration; training uses at most `max_train` rows (default 64 per cluster).
+    """
+    rng = np.random.default_rng(seed)
+    n = len(x)
+    n_clusters = max(1, min(n_clusters, n))
+    max_train = max_train or 64 * n_clusters
+    train = x[rng.choice(n, size=max_train, replace=False)] if n > max_train else x
+    centroids = train[rng.choice(len(train), size=n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assign = np.argmax(train @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, train)
+        counts = np.bincount(assign, minlength=n_clusters)
+        empty = counts == 0
+        if np.any(empty):
+            # Re-seed empty clusters with random training points.
+            sums[empty] = train[rng.choice(len(train), size=int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+# =========================
+# Indexes
+# =========================
+def _grow(buffer: EncodedMatrix, size: int, new: EncodedMatrix) -> EncodedMatrix:
+    """Write `new` after the first `size` rows of `buffer`, doubling its capacity when full."""
+    needed = size + len(new)
+    if needed > len(buffer):
+        capacity = max(needed, 2 * len(buffer), 64)
+        codes = np.empty((capacity,) + new.codes.shape[1:], dtype=new.codes.dtype)
+        codes[:size] = buffer.codes[:size]
+        scales = None
+        if new.scales is not None:
+            scales = np.empty(capacity, dtype=new.scales.dtype)
+            scales[:size] = buffer.scales[:size]
+        buffer = EncodedMatrix(codes, scales)
+    buffer.codes[size:needed] = new.codes
+    if new.scales is not None:
+        buffer.scales[size:needed] = new.scales
+    return buffer
+
+def _grow_ids(ids: np.ndarray, size: int, new: np.ndarray) -> np.ndarray:
+    needed = size + len(new)
+    if needed > len(ids):
+        grown = np.empty(max(needed, 2 * len(ids), 64), dtype=ids.dtype)
+        grown[:size] = ids[:size]
+        ids = grown
+    ids[size:needed] = new
+    return ids
+
+def _mask_dead(scores: np.ndarray, ids: np.ndarray, live: Optional[np.ndarray]) -> np.ndarray:
+    """-inf for the columns whose id is not live (tombstoned or re-enrolled rows)."""
+    if live is not None:
+        scores[:, ~live[ids]] = -np.inf
+    return scores
+
+
+class BruteForceIndex:
+    """
+    Exact search: one (Q, D) @ (D, N) matmul (on the codec's codes if
+    compressed). `ids` are the caller's row numbers (default 0..N-1); add()
+    encodes only the new rows.
+    """
+    kind = "brute_force"
+
+    def __init__(self, vectors: np.ndarray, codec: Optional[VoiceprintCodec] = None,
+                 ids: Optional[np.ndarray] = None):
+        self.codec = codec or VoiceprintCodec("float32")
+        self._buffer = self.codec.encode(vectors)
+        self._size = len(self._buffer)
+        self._ids = np.arange(self._size, dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+
+    @property
+    def encoded(self) -> EncodedMatrix:
+        return self.codec.slice(self._buffer, 0, self._size)
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:self._size]
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        return self.encoded.nbytes
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray) -> None:
+        self._buffer = _grow(self._buffer, self._size, self.codec.encode(vectors))
+        self._ids = _grow_ids(self._ids, self._size, np.asarray(ids, dtype=np.int64))
+        self._size += len(ids)
+
+    def search(self, queries: np.ndarray, k: int,
+               live: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(ids, scores) of the k best rows per query; rows with live[id] False are skipped (score -inf)."""
+        ids = self.ids
+        idx, val = top_k(_mask_dead(self.codec.score(self.encoded, queries), ids, live), k)
+        return ids[idx], val
+
+
+class IVFIndex:
+    """
+    Inverted-file index. Rows are reordered so each list is one contiguous
+    slice of `encoded` (offsets[l]:offsets[l + 1]); `ids` maps back to the
+    caller's row numbers. Clustering happens in the codec's scoring space.
+    Rows added later are assigned to the existing centroids and kept in a
+    tail (`added`) that queries filter by list, until the next full build.
+    """
+    kind = "ivf"
+
+    def __init__(self, vectors: np.ndarray, n_lists: Optional[int] = None, nprobe: int = IVF_NPROBE,
+                 centroids: Optional[np.ndarray] = None, seed: int = 0,
+                 codec: Optional[VoiceprintCodec] = None, ids: Optional[np.ndarray] = None):
+        self.codec = codec or VoiceprintCodec("float32")
+        x = self.codec.project(vectors)
+        n = len(x)
+        if centroids is None:
+            n_lists = n_lists or max(1, int(4 * np.sqrt(n)))
+            centroids = spherical_kmeans(x, n_lists, seed=seed)
+        self.centroids = np.ascontiguousarray(centroids, dtype=DTYPE)
+        self.n_lists = len(self.centroids)
+        self.nprobe = nprobe
+        self.trained_size = n
+
+        assign = self._assign(x)
+        order = np.argsort(assign, kind="stable")
+        ids = np.arange(n, dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+        self.ids = ids[order]
+        self.encoded = self.codec.encode(x[order])
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=self.n_lists))))
+
+        self.added = 0
+        self._tail = self.codec.encode(np.zeros((0, x.shape[1]), dtype=DTYPE))
+        self._tail_ids = np.zeros(0, dtype=np.int64)
+        self._tail_lists = np.zeros(0, dtype=np.int64)
+
+    def _assign(self, x: np.ndarray, chunk: int = 8192) -> np.ndarray:
+        out = np.empty(len(x), dtype=np.int64)
+        for start in range(0, len(x), chunk):
+            out[start:start + chunk] = np.argmax(x[start:start + chunk] @ self.centroids.T, axis=1)
+        return out
+
+    def __len__(self) -> int:
+        return len(self.encoded) + self.added
+
+    @property
+    def nbytes(self) -> int:
+        return self.encoded.nbytes + self.codec.slice(self._tail, 0, self.added).nbytes + self.ids.nbytes
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray) -> None:
+        """Assign and encode only the new rows (the centroids stay as trained)."""
+        x = self.codec.project(vectors)
+        self._tail = _grow(self._tail, self.added, self.codec.encode(x))
+        self._tail_ids = _grow_ids(self._tail_ids, self.added, np.asarray(ids, dtype=np.int64))
+        self._tail_lists = _grow_ids(self._tail_lists, self.added, self._assign(x))
+        self.added += len(x)
+
+    def search(self, queries: np.ndarray, k: int, nprobe: Optional[int] = None,
+               live: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(ids, scores) of the k best rows per query (-1 / -inf where fewer); see BruteForceIndex.search."""
+        q = self.codec.project(queries)
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        probe_lists, _ = top_k(q @ self.centroids.T, nprobe)
+        tail = self.codec.slice(self._tail, 0, self.added)
+        tail_ids, tail_lists = self._tail_ids[:self.added], self._tail_lists[:self.added]
+
+        all_idx = np.full((len(q), k), -1, dtype=np.int64)
+        all_val = np.full((len(q), k), -np.inf, dtype=DTYPE)
+        for i, lists in enumerate(probe_lists):
+            # Each list is a contiguous slice of `encoded`, scored in place.
+            spans = [(self.offsets[l], self.offsets[l + 1]) for l in lists]
+            ids = [self.ids[a:b] for a, b in spans]
+            scores = [self.codec.score(self.codec.slice(self.encoded, a, b), q[i], projected=True)[0]
+                      for a, b in spans]
+            if self.added:
+                # The tail is small; its rows in the probed lists are gathered.
+                in_probe = np.flatnonzero(np.isin(tail_lists, lists))
+                ids.append(tail_ids[in_probe])
+                scores.append(self.codec.score(EncodedMatrix(tail.codes[in_probe],
+                                                             tail.scales[in_probe] if tail.scales is not None else None),
+                                               q[i], projected=True)[0])
+            ids = np.concatenate(ids)
+            if len(ids) == 0:
+                continue
+            scores = _mask_dead(np.concatenate(scores)[np.newaxis], ids, live)
+            idx, val = top_k(scores, k)
+            all_idx[i, :idx.shape[1]] = ids[idx[0]]
+            all_val[i, :val.shape[1]] = val[0]
+        return all_idx, all_val
+
+
+# =========================
+# Identification over the voiceprint store
+# =========================
+class SpeakerIndex:
+    """
+    Keeps a search index in sync with a VoiceprintStore. Indexes hold store
+    rows (tombstones included, masked out at query time), so after an
+    enrollment only the appended rows are encoded and assigned. A full build
+    happens on compaction (the store's rows are renumbered), when the
+    population crosses ann_min_users, and when it has grown by more than
+    IVF_RETRAIN_DRIFT since the IVF centroids were trained.
+    """
+    def __init__(self, store, ann_min_users: int = ANN_MIN_USERS, nprobe: int = IVF_NPROBE,
+                 codec: Optional[VoiceprintCodec] = None):
+        self.store = store
+        # Compressed scoring only if voiceprint_codec.py approved it for this store.
+        self.codec = codec or load_codec(store.directory)
+        self.ann_min_users = ann_min_users
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        self._view = None
+        self._index = None
+        self._indexed_rows = 0                      # store rows [0, _indexed_rows) are in _index
+        self._row_users = np.empty(0, dtype=object)  # store row -> username, None for dead rows
+        self._live = np.zeros(0, dtype=bool)
+
+    def _current(self):
+        view = self.store.view()
+        with self._lock:
+            if view is not self._view:
+                self._update(view)
+            return self._index, self._row_users, self._live
+
+    def _update(self, view) -> None:
+        n_rows = len(view.matrix)
+        previous = self._index
+        ivf = len(view.rows) >= self.ann_min_users
+        stale = (previous is None or self._view is None or view.generation != self._view.generation
+                 or n_rows < self._indexed_rows or ivf != isinstance(previous, IVFIndex)
+                 or (ivf and previous.added + n_rows - self._indexed_rows > IVF_RETRAIN_DRIFT * previous.trained_size))
+        if stale:
+            self._build(view, ivf)
+        elif n_rows > self._indexed_rows:
+            new_rows = np.arange(self._indexed_rows, n_rows, dtype=np.int64)
+            previous.add(np.asarray(view.matrix[self._indexed_rows:n_rows], dtype=DTYPE), new_rows)
+            self._indexed_rows = n_rows
+        self._row_users = np.empty(n_rows, dtype=object)
+        self._row_users[view.rows] = view.usernames
+        self._live = np.zeros(n_rows, dtype=bool)
+        self._live[view.rows] = True
+        self._view = view
+
+    def _build(self, view, ivf: bool) -> None:
+        """Index only the live rows; later appends go through add()."""
+        rows = np.asarray(view.rows, dtype=np.int64)
+        vectors = np.asarray(view.matrix[rows], dtype=DTYPE) if len(rows) else np.zeros((0, 1), DTYPE)
+        previous = self._index
+        if ivf:
+            # Compaction alone doesn't move the centroids: reuse them unless the population drifted.
+            centroids = None
+            if isinstance(previous, IVFIndex) and abs(len(rows) - previous.trained_size) <= IVF_RETRAIN_DRIFT * previous.trained_size:
+                centroids = previous.centroids
+            self._index = IVFIndex(vectors, nprobe=self.nprobe, centroids=centroids, codec=self.codec, ids=rows)
+            if centroids is not None:
+                self._index.trained_size = previous.trained_size
+        else:
+            self._index = BruteForceIndex(vectors, codec=self.codec, ids=rows)
+        self._indexed_rows = len(view.matrix)
+
+    def identify(self, embedding: np.ndarray, k: int = 5) -> List[Dict[str, float]]:
+        """Top-k enrolled users for one embedding: [{"username", "score"}], best first (cosine)."""
+        index, row_users, live = self._current()
+        if not live.any():
+            return []
+        idx, val = index.search(np.asarray(embedding, dtype=DTYPE).reshape(1, -1), k, live=live)
+        return [{"username": row_users[i], "score": float(s)}
+                for i, s in zip(idx[0], val[0]) if i >= 0 and np.isfinite(s)]
+
+    def stats(self) -> Dict[str, object]:
+        index, _, live = self._current()
+        out = {"kind": index.kind, "users": int(live.sum()), "codec": self.codec.name,
+               "index_bytes": int(index.nbytes)}
+        if isinstance(index, IVFIndex):
+            out.update({"n_lists": index.n_lists, "nprobe": index.nprobe, "added": index.added})
+        return out
+
+
+__all__ = [
+    "ANN_MIN_USERS",
+    "IVF_NPROBE",
+    "normalize_rows",
+    "top_k",
+    "spherical_kmeans",
+    "BruteForceIndex",
+    "IVFIndex",
+    "SpeakerIndex",
+]
@@ -0,0 +1,292 @@
+# backend/streaming_verify.py
+# Streaming voice verification: the client posts raw PCM chunks while it is
+# still recording, and the server keeps voice-activity tracking and the
+# running score up to date as audio arrives. A decision is returned as soon as
+# the score is clearly past the threshold, instead of after a fixed 4-5 s
+# recording plus upload.
+#
+# Nothing is recomputed per chunk: one running resampler brings the chunk to
+# SAMPLE_RATE, each completed frame gets its VAD features (vad.StreamingVAD)
+# and log-mel row (mfcc_frontend.StreamingMFCC) once, and speech frames are
+# grouped into SEGMENT_SECONDS segments that are embedded once each. The
+# segment score is the cosine distance from the enrolled voiceprint to the
+# frame-weighted mean of the unit-length segment embeddings.
+#
+# The segment score is only a cheap running estimate: it isn't on the scale
+# SECURITY_THRESHOLD was calibrated for, so it may only end a session early
+# with a reject. Every accept, and the final decision, is made on one
+# embedding of all the audio received so far through the same pipeline as a
+# one-shot /api/verify_voice upload (embed_fn = get_voice_embedding_from_signal).
+#
+# Decision rule, evaluated each time a segment is embedded:
+#   reject  once >= MIN_REJECT_SECONDS of speech and the segment score is
+#           > threshold + REJECT_MARGIN for STABLE_EVALS evaluations in a row
+#   check   once >= MIN_ACCEPT_SECONDS of speech and the segment score is
+#           < threshold - ACCEPT_MARGIN for STABLE_EVALS evaluations in a row:
+#           the full-pipeline distance is computed, and accepts if it is
+#           < threshold - ACCEPT_MARGIN (otherwise streaming continues)
+# At MAX_STREAM_SECONDS (or when the client marks its last chunk) the plain
+# threshold decides on the full-pipeline distance.
+import os
+import time
+import uuid
+import threading
+from typing import Callable, Dict, Optional
+
+import numpy as np
+from scipy.spatial.distance import cosine
+
+from admission import AdmissionRejected
+from audio_io import SAMPLE_RATE, StreamResampler, pcm16_to_float32
+from mfcc_frontend import HOP_LENGTH, StreamingMFCC, log_mel_to_mfcc
+import vad
+
+# =========================
+# Public constants / knobs
+# =========================
+SEGMENT_SECONDS = float(os.environ.get("KEYVOX_STREAM_SEGMENT_SECONDS", "1.0"))
+MIN_ACCEPT_SECONDS = float(os.environ.get("KEYVOX_STREAM_MIN_ACCEPT", "1.5"))
+MIN_REJECT_SECONDS = float(os.environ.get("KEYVOX_STREAM_MIN_REJECT", "2.5"))
+MAX_STREAM_SECONDS = float(os.environ.get("KEYVOX_STREAM_MAX_SECONDS", "5"))
+ACCEPT_MARGIN = 0.05
+REJECT_MARGIN = 0.10
+STABLE_EVALS = 2
+SESSION_TTL_S = 30.0
+
+PENDING, ACCEPT, REJECT = "pending", "accept", "reject"
+
+# Admission policy (admission.ENDPOINT_POLICIES) a session's slot is held under.
+ADMISSION_ENDPOINT = "verify_voice"
+
+N_MFCC = 13  # helpers.N_MFCC: segment_embed_fn takes (frames, N_MFCC) MFCCs
+SEGMENT_FRAMES = max(1, int(round(SEGMENT_SECONDS * SAMPLE_RATE / HOP_LENGTH)))
+# A frame's speech/silence label can still flip until the VAD has seen the
+# pause-bridging window (and padding) after it.
+SETTLE_FRAMES = int(np.ceil((vad.MIN_SILENCE_S + vad.PAD_S) * SAMPLE_RATE / HOP_LENGTH)) + 1
+
+
+class VerifySession:
+    """One in-flight streaming verification."""
+
+    def __init__(self, session_id: str, username: str, reference: np.ndarray, threshold: float,
+                 embed_fn: Callable[[np.ndarray], Optional[np.ndarray]], sample_rate: int = SAMPLE_RATE,
+                 segment_embed_fn: Optional[Callable[[np.ndarray], Optional[np.ndarray]]] = None):
+        self.session_id = session_id
+        self.username = username
+        self.reference = np.asarray(reference, dtype=np.float32)
+        self.threshold = threshold
+        self.embed_fn = embed_fn
+        self.segment_embed_fn = segment_embed_fn
+        self.sample_rate = int(sample_rate)
+        self.lock = threading.Lock()
+        self.started = self.last_activity = time.monotonic()
+
+        self._max_samples = int(MAX_STREAM_SECONDS * self.sample_rate)
+        self._n = 0                      # samples received, at the client's rate
+        # Running front end at SAMPLE_RATE (vad.py frames and MFCC frames share
+        # the same 2048/512 centered geometry, so frame i is the same audio in both).
+        self._resampler = StreamResampler(self.sample_rate, SAMPLE_RATE)
+        self._vad = vad.StreamingVAD(SAMPLE_RATE)
+        self._mfcc = StreamingMFCC(SAMPLE_RATE)
+        # The resampled audio, kept for the full-pipeline embedding.
+        self._signal = np.zeros(int(np.ceil(MAX_STREAM_SECONDS * SAMPLE_RATE)) + SAMPLE_RATE // 10, dtype=np.float32)
+        self._m = 0
+        self._settled = 0                # frames already sorted into speech / silence
+        self._pending = np.zeros((0, self._mfcc.n_mels), dtype=np.float32)  # speech rows not embedded yet
+        self._pooled = np.zeros_like(self.reference)
+        self.segments = 0
+        self.full_distance: Optional[float] = None
+
+        self.distances = []
+        self.status = PENDING
+        self.message = ""
+
+    # --- Incremental state ---
+    @property
+    def seconds(self) -> float:
+        return self._n / self.sample_rate
+
+    @property
+    def voiced_seconds(self) -> float:
+        return self._vad.voiced_seconds
+
+    def _append(self, samples: np.ndarray, final: bool) -> bool:
+        """Push one chunk through the running front end; True once the stream has ended."""
+        samples = samples[:self._max_samples - self._n]
+        self._n += len(samples)
+        last = final or self._n >= self._max_samples
+        signal = self._resampler.feed(samples, last=last)
+        signal = signal[:len(self._signal) - self._m]
+        self._signal[self._m:self._m + len(signal)] = signal
+        self._m += len(signal)
+        self._vad.feed(signal)
+        self._mfcc.feed(signal)
+        if last:
+            self._vad.finish()
+            self._mfcc.finish()
+
+        # Move the speech frames whose label can no longer change to _pending.
+        stop = self._mfcc.n_frames if last else max(self._settled, self._mfcc.n_frames - SETTLE_FRAMES)
+        if stop > self._settled:
+            seg = self._vad.segments()
+            centers = np.arange(self._settled, stop)[:, np.newaxis] * HOP_LENGTH
+            speech = ((centers >= seg[:, 0]) & (centers < seg[:, 1])).any(axis=1)
+            self._pending = np.concatenate((self._pending, self._mfcc.log_mel[self._settled:stop][speech]))
+            self._settled = stop
+        return last
+
+    def _embed_segments(self, flush: bool) -> bool:
+        """Embed every full segment in _pending (and the remainder if flush); True if any was added."""
+        added = False
+        while len(self._pending) >= SEGMENT_FRAMES or (flush and len(self._pending)):
+            rows, self._pending = self._pending[:SEGMENT_FRAMES], self._pending[SEGMENT_FRAMES:]
+            embedding = self.segment_embed_fn(log_mel_to_mfcc(rows, n_mfcc=N_MFCC))
+            norm = np.linalg.norm(embedding) if embedding is not None else 0.0
+            if norm > 0:
+                self._pooled += len(rows) * np.asarray(embedding, dtype=np.float32) / norm
+                self.segments += 1
+                added = True
+        return added
+
+    def _score(self) -> Optional[float]:
+        """Segment score (running estimate; see the header)."""
+        if not self.segments:
+            return None
+        distance = float(cosine(self.reference, self._pooled))
+        self.distances.append(distance)
+        return distance
+
+    def _full_score(self) -> Optional[float]:
+        """Distance of one embedding of everything received so far, as /api/verify_voice computes it."""
+        embedding = self.embed_fn(self._signal[:self._m])
+        if embedding is None:
+            return None
+        self.full_distance = float(cosine(self.reference, embedding))
+        return self.full_distance
+
+    def _stable(self, predicate) -> bool:
+        recent = self.distances[-STABLE_EVALS:]
+        return len(recent) == STABLE_EVALS and all(predicate(d) for d in recent)
+
+    # --- Public ---
+    def feed(self, pcm: bytes, final: bool = False, channels: int = 1) -> Dict[str, object]:
+        """Add one chunk of little-endian int16 PCM and return the current decision."""
+        # The session runs on one admission slot, so one chunk at a time: an
+        # overlapping post is turned away rather than queued (and reordered).
+        if not self.lock.acquire(blocking=False):
+            raise AdmissionRejected(429, 1, "Server is busy: previous chunk of this session still running.")
+        try:
+            self.last_activity = time.monotonic()
+            if self.status != PENDING:
+                return self.result()
+            last = self._append(pcm16_to_float32(pcm, channels), final)
+
+            if last:
+                distance = self._full_score()
+                if distance is None:
+                    self.status, self.message = REJECT, "Could not process live audio for speaker verification."
+                else:
+                    self.status = ACCEPT if distance < self.threshold else REJECT
+                return self.result()
+
+            if self.segment_embed_fn is None or not self._embed_segments(flush=False):
+                return self.result()
+            if self.voiced_seconds >= MIN_ACCEPT_SECONDS and self._score() is not None:
+                if self.voiced_seconds >= MIN_REJECT_SECONDS and \
+                        self._stable(lambda d: d > self.threshold + REJECT_MARGIN):
+                    self.status = REJECT
+                elif self._stable(lambda d: d < self.threshold - ACCEPT_MARGIN):
+                    distance = self._full_score()
+                    if distance is not None and distance < self.threshold - ACCEPT_MARGIN:
+                        self.status = ACCEPT
+            return self.result()
+        finally:
+            self.lock.release()
+
+    def result(self) -> Dict[str, object]:
+        out = {
+            "session_id": self.session_id,
+            "status": self.status,
+            "seconds": round(self.seconds, 3),
+            "voiced_seconds": round(self.voiced_seconds, 3),
+            "distance": self.full_distance,
+            "segment_distance": self.distances[-1] if self.distances else None,
+        }
+        if self.status != PENDING:
+            out["verified"] = self.status == ACCEPT
+            out["message"] = self.message or ("Voice matched." if self.status == ACCEPT else "Voice does not match.")
+        return out
+
+
+class StreamingVerifier:
+    """
+    Registry of open sessions; idle ones are dropped after SESSION_TTL_S.
+    With an `admission` controller each session is admitted at start() under
+    ADMISSION_ENDPOINT's policy (AdmissionRejected if it isn't) and holds that
+    slot until it is decided, closed or expired.
+    """
+
+    def __init__(self, embed_fn: Callable[[np.ndarray], Optional[np.ndarray]], threshold: float,
+                 segment_embed_fn: Optional[Callable[[np.ndarray], Optional[np.ndarray]]] = None,
+                 admission=None):
+        self.embed_fn = embed_fn
+        self.segment_embed_fn = segment_embed_fn
+        self.threshold = threshold
+        self.admission = admission
+        self._sessions: Dict[str, VerifySession] = {}
+        self._lock = threading.Lock()
+
+    def start(self, username: str, reference: np.ndarray, sample_rate: int = SAMPLE_RATE) -> VerifySession:
+        self._expire()
+        if self.admission is not None:
+            self.admission.acquire(ADMISSION_ENDPOINT)
+        try:
+            session = VerifySession(uuid.uuid4().hex, username, reference, self.threshold, self.embed_fn,
+                                    sample_rate, self.segment_embed_fn)
+        except Exception:
+            if self.admission is not None:
+                self.admission.release(ADMISSION_ENDPOINT, 0.0)
+            raise
+        with self._lock:
+            self._sessions[session.session_id] = session
+        return session
+
+    def _release(self, session: VerifySession) -> None:
+        # Waits out a chunk still running on the slot before handing it back.
+        if self.admission is not None:
+            with session.lock:
+                self.admission.release(ADMISSION_ENDPOINT, time.monotonic() - session.started)
+
+    def get(self, session_id: str) -> Optional[VerifySession]:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def feed(self, session_id: str, pcm: bytes, final: bool = False) -> Optional[Dict[str, object]]:
+        """feed() on a session; decided sessions are closed. None if the id is unknown/expired."""
+        self._expire()
+        session = self.get(session_id)
+        if session is None:
+            return None
+        result = session.feed(pcm, final=final)
+        if result["status"] != PENDING:
+            self.close(session_id)
+        return result
+
+    def close(self, session_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        self._release(session)
+        return True
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            expired = [self._sessions.pop(sid) for sid, s in list(self._sessions.items())
+                       if now - s.last_activity > SESSION_TTL_S]
+        for session in expired:
+            self._release(session)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
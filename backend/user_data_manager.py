@@ -1,72 +1,49 @@
 from pathlib import Path
-import json
 import hashlib
 
+from user_registry import get_registry, get_user_index
 
-# users.json in the same folder as this script
+
+# users.json in the same folder as this script. Users now live in the SQLite
+# registry (user_registry.py); this file is only imported into it once.
+# Lookups are served from the in-memory UserIndex (O(1), no row reads);
+# writes go to the registry, and the index picks them up on the next lookup.
 USER_FILE = Path(__file__).parent / "users.json"
 
 def update_email(old_email, new_email, user_file=USER_FILE):
     """
-    Updates a user's email from old_email to new_email in users.json.
+    Updates a user's email from old_email to new_email.
     """
-    with open(user_file, "r") as f:
-        users = json.load(f)
-
-    for user in users.values():
-        if user.get("email") == old_email:
-            user["email"] = new_email
-            with open(user_file, "w") as f:
-                json.dump(users, f, indent=4)
-            return
-
-    raise ValueError(f"No user with email '{old_email}' found.")
+    if not get_registry(user_file).update_email(old_email, new_email):
+        raise ValueError(f"No user with email '{old_email}' found.")
 
 def load_users(user_file=USER_FILE):
-    """Load all users from users.json"""
-    with open(user_file, "r") as f:
-        return json.load(f)
+    """Load all users as a {username: user} dict (reads every row: prefer the lookups below)."""
+    return dict(get_registry(user_file).items())
 
 def get_user_by_username(username, user_file=USER_FILE):
     """Find user data by username"""
-    users = load_users(user_file)
-    for user in users.values():
-        if user.get("username", "").lower() == username.lower():
-            return user
-    return None
+    return get_user_index(user_file).get(username or "")
 
 def get_user_by_email(email, user_file=USER_FILE):
     """Find user data by email"""
-    users = load_users(user_file)
-    for user in users.values():
-        if user.get("email", "").lower() == email.lower():
-            return user
-    return None
+    _, user = get_user_index(user_file).find_by_email(email or "")
+    return user
 
 def update_email_by_name_and_blank_email(full_name, new_email, user_file=USER_FILE):
     """
     Updates a user's email using their full name, only if their email is blank.
     """
-    with open(user_file, "r") as f:
-        users = json.load(f)
-
-    for user in users.values():
-        if user.get("full_name") == full_name and user.get("email") == "":
-            user["email"] = new_email
-            with open(user_file, "w") as f:
-                json.dump(users, f, indent=4)
-            return
-
-    raise ValueError(f"No user with full_name '{full_name}' and blank email found.")
+    if not get_registry(user_file).update_email_if_blank(full_name, new_email):
+        raise ValueError(f"No user with full_name '{full_name}' and blank email found.")
 
 
 def get_user_by_key(key, user_file=USER_FILE):
     """
-    Find a user by their dictionary key in users.json.
+    Find a user by their username (the users.json key).
     Example keys: 'jc', 'user102'
     """
-    users = load_users(user_file)
-    return users.get(key)
+    return get_user_index(user_file).get(key or "")
 
 
 def hash_password(password: str) -> str:
@@ -75,77 +52,31 @@ def hash_password(password: str) -> str:
 
 def change_password(user_key: str, new_password: str, user_file=USER_FILE):
     """
-    Updates the password_hash for the specified user in users.json.
-    
+    Updates the password_hash for the specified user.
+
     Args:
-        user_key: The key in users.json (e.g., 'jc', 'user102').
+        user_key: The username (e.g., 'jc', 'user102').
         new_password: The new plaintext password to set.
     """
-    with open(user_file, "r") as f:
-        users = json.load(f)
-
-    if user_key not in users:
+    if not get_registry(user_file).set_password_hash(user_key, hash_password(new_password)):
         raise KeyError(f"User '{user_key}' not found in {user_file}.")
 
-    users[user_key]['password_hash'] = hash_password(new_password)
-
-    with open(user_file, "w") as f:
-        json.dump(users, f, indent=4)
-
     print(f"Password for user '{user_key}' updated successfully.")
 
 def get_user_key_by_email_or_name(email: str = "", full_name: str = "", user_file=USER_FILE):
-    users = load_users(user_file)
-    email = email.strip().lower()
-    full_name = full_name.strip().lower()
-
-    for key, user in users.items():
-        user_email = user.get("email", "").lower()
-        user_name = user.get("full_name", "").lower()
-
-        # If both provided, require both to match
-        if email and full_name:
-            if user_email == email and user_name == full_name:
-                return key
-        # If only one provided, match on that
-        elif email and user_email == email:
-            return key
-        elif full_name and user_name == full_name:
-            return key
-
-    return None
-
-def _norm(s):
-    return s.strip().lower() if isinstance(s, str) else ""
+    # If both provided, both must match; if only one is provided, match on that.
+    key, _ = get_user_index(user_file).find_by_email_or_name(email or "", full_name or "")
+    return key
 
 def find_user_by_username(username, user_file=USER_FILE):
     """
-    Robust lookup that works whether the username is the DICT KEY
-    or stored in user['username'] (future-proof).
+    Case-insensitive lookup by username.
     Returns (exact_key, user_dict) or (None, None).
     """
-    uname = _norm(username)
-    if not uname:
-        return None, None
-
-    users = load_users(user_file)
-    if not isinstance(users, dict):
-        return None, None
-
-    for key, user in users.items():
-        # Case 1: username is the dict key (your current JSON layout)
-        if _norm(key) == uname:
-            return key, user
-
-        # Case 2: username lives inside the object (future compatibility)
-        if isinstance(user, dict) and _norm(user.get("username")) == uname:
-            return key, user
-
-    return None, None
+    return get_user_index(user_file).find(username or "")
 
 def username_exists(username, user_file=USER_FILE):
     """
     Convenience boolean check.
     """
-    key, user = find_user_by_username(username, user_file=user_file)
-    return user is not None
+    return get_user_index(user_file).exists(username or "")
@@ -0,0 +1,362 @@
+# backend/user_registry.py
+# User accounts in SQLite (WAL mode) instead of users.json.
+#
+# Lookups go through indexed, case-insensitive username / email / full-name
+# columns and every mutation is a single-row UPDATE or INSERT, so a login no
+# longer reads the whole user base and concurrent writers (server threads,
+# the desktop app's settings screens) can't overwrite each other's changes.
+# users.json is imported once, the first time the database is opened; the
+# returned user dicts keep the users.json shape
+# ({"full_name", "email", "password_hash", "voiceprint_path", ...}).
+import os
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+# =========================
+# Public constants / knobs
+# =========================
+BACKEND_DIR = Path(__file__).parent
+LEGACY_USER_FILE = BACKEND_DIR / "users.json"
+DB_PATH = Path(os.environ.get("KEYVOX_USER_DB", str(BACKEND_DIR / "users.db")))
+BUSY_TIMEOUT_MS = 5000
+
+# Columns with a users.json field of the same name; anything else a user dict
+# carries is kept in the `extra` JSON column.
+FIELDS = ("full_name", "email", "password_hash", "voiceprint_path")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username        TEXT PRIMARY KEY,   -- users.json key, as written
+    username_norm   TEXT NOT NULL UNIQUE,
+    full_name       TEXT NOT NULL DEFAULT '',
+    full_name_norm  TEXT NOT NULL DEFAULT '',
+    email           TEXT NOT NULL DEFAULT '',
+    email_norm      TEXT NOT NULL DEFAULT '',
+    password_hash   TEXT,
+    voiceprint_path TEXT,
+    extra           TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS users_email_norm ON users(email_norm);
+CREATE INDEX IF NOT EXISTS users_full_name_norm ON users(full_name_norm);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# Fixed statement texts: sqlite3 caches the compiled statement per connection.
+_COLUMNS = "username, full_name, email, password_hash, voiceprint_path, extra"
+_SQL_BY_USERNAME = f"SELECT {_COLUMNS} FROM users WHERE username_norm = ?"
+_SQL_BY_EMAIL = f"SELECT {_COLUMNS} FROM users WHERE email_norm = ? ORDER BY rowid LIMIT 1"
+_SQL_BY_FULL_NAME = f"SELECT {_COLUMNS} FROM users WHERE full_name_norm = ? ORDER BY rowid LIMIT 1"
+_SQL_BY_EMAIL_AND_NAME = f"SELECT {_COLUMNS} FROM users WHERE email_norm = ? AND full_name_norm = ? ORDER BY rowid LIMIT 1"
+_SQL_ALL = f"SELECT {_COLUMNS} FROM users ORDER BY rowid"
+_SQL_EXISTS = "SELECT 1 FROM users WHERE username_norm = ?"
+_SQL_INSERT = """INSERT INTO users (username, username_norm, full_name, full_name_norm, email, email_norm,
+                                    password_hash, voiceprint_path, extra)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+_SQL_IMPORT = _SQL_INSERT.replace("INSERT INTO", "INSERT OR IGNORE INTO", 1)
+_SQL_SET_PASSWORD = "UPDATE users SET password_hash = ? WHERE username_norm = ?"
+_SQL_SET_VOICEPRINT = "UPDATE users SET voiceprint_path = ? WHERE username_norm = ?"
+_SQL_SET_EMAIL = """UPDATE users SET email = ?, email_norm = ?
+                    WHERE rowid = (SELECT rowid FROM users WHERE email = ? ORDER BY rowid LIMIT 1)"""
+_SQL_SET_EMAIL_IF_BLANK = """UPDATE users SET email = ?, email_norm = ?
+                             WHERE rowid = (SELECT rowid FROM users WHERE full_name = ? AND email = ''
+                                            ORDER BY rowid LIMIT 1)"""
+
+
+def normalize(value) -> str:
+    """Lookup key for usernames, emails and names: stripped and lowercased."""
+    return value.strip().lower() if isinstance(value, str) else ""
+
+def _row_to_user(row) -> Tuple[str, Dict[str, object]]:
+    username, full_name, email, password_hash, voiceprint_path, extra = row
+    user = {"full_name": full_name, "email": email, "password_hash": password_hash, "voiceprint_path": voiceprint_path}
+    user.update(json.loads(extra or "{}"))
+    return username, user
+
+def _insert_params(username: str, user: Dict[str, object]) -> tuple:
+    full_name = user.get("full_name") or ""
+    email = user.get("email") or ""
+    extra = {k: v for k, v in user.items() if k not in FIELDS}
+    return (username, normalize(username), full_name, normalize(full_name), email, normalize(email),
+            user.get("password_hash"), user.get("voiceprint_path"), json.dumps(extra))
+
+
+class UserRegistry:
+    """
+    SQLite-backed user store. One connection per thread (sqlite3 connections
+    are not shared across threads); WAL lets readers run alongside a writer,
+    also across processes.
+    """
+
+    def __init__(self, db_path=DB_PATH, legacy_json=LEGACY_USER_FILE):
+        self.db_path = str(db_path)
+        self.legacy_json = str(legacy_json) if legacy_json else None
+        self._local = threading.local()
+        self._connect().executescript(_SCHEMA)
+        self._migrate_legacy_json()
+
+    # --- Connections ---
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            # Autocommit: each statement is its own transaction unless BEGIN is issued.
+            conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000.0, isolation_level=None,
+                                   cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+            self._local.conn = conn
+        return conn
+
+    def _migrate_legacy_json(self) -> None:
+        """Import users.json once (recorded in `meta`, so deleted users don't come back)."""
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_json_imported'").fetchone():
+            return
+        users = {}
+        if self.legacy_json and os.path.exists(self.legacy_json):
+            with open(self.legacy_json, "r") as f:
+                users = json.load(f)
+            if isinstance(users, list) and users and isinstance(users[0], dict):
+                users = users[0]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_json_imported'").fetchone() is None:
+                imported = 0
+                for username, user in (users or {}).items():
+                    if isinstance(user, dict):
+                        cur = conn.execute(_SQL_IMPORT, _insert_params(username, user))
+                        imported += cur.rowcount
+                conn.execute("INSERT INTO meta (key, value) VALUES ('legacy_json_imported', ?)",
+                             (self.legacy_json or "",))
+                if imported:
+                    print(f"✅ Imported {imported} user(s) from {self.legacy_json} into {self.db_path}.")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # --- Reads ---
+    def _one(self, sql: str, *params) -> Tuple[Optional[str], Optional[Dict[str, object]]]:
+        row = self._connect().execute(sql, params).fetchone()
+        return _row_to_user(row) if row else (None, None)
+
+    def get(self, username: str) -> Optional[Dict[str, object]]:
+        """User dict for a (case-insensitive) username, or None."""
+        return self._one(_SQL_BY_USERNAME, normalize(username))[1]
+
+    def find(self, username: str) -> Tuple[Optional[str], Optional[Dict[str, object]]]:
+        """(stored username, user dict), or (None, None)."""
+        return self._one(_SQL_BY_USERNAME, normalize(username))
+
+    def find_by_email(self, email: str) -> Tuple[Optional[str], Optional[Dict[str, object]]]:
+        return self._one(_SQL_BY_EMAIL, normalize(email))
+
+    def find_by_email_or_name(self, email: str = "", full_name: str = "") -> Tuple[Optional[str], Optional[Dict[str, object]]]:
+        """Both given: both must match; otherwise whichever is given."""
+        email, full_name = normalize(email), normalize(full_name)
+        if email and full_name:
+            return self._one(_SQL_BY_EMAIL_AND_NAME, email, full_name)
+        if email:
+            return self._one(_SQL_BY_EMAIL, email)
+        if full_name:
+            return self._one(_SQL_BY_FULL_NAME, full_name)
+        return None, None
+
+    def exists(self, username: str) -> bool:
+        return self._connect().execute(_SQL_EXISTS, (normalize(username),)).fetchone() is not None
+
+    def __contains__(self, username: str) -> bool:
+        return self.exists(username)
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, object]]]:
+        for row in self._connect().execute(_SQL_ALL).fetchall():
+            yield _row_to_user(row)
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    # --- Single-row writes ---
+    def create(self, username: str, user: Dict[str, object]) -> bool:
+        """Insert a new user; False if the (case-insensitive) username is taken."""
+        try:
+            self._connect().execute(_SQL_INSERT, _insert_params(username, user))
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def set_password_hash(self, username: str, password_hash: str) -> bool:
+        return self._connect().execute(_SQL_SET_PASSWORD, (password_hash, normalize(username))).rowcount == 1
+
+    def set_voiceprint_path(self, username: str, voiceprint_path: Optional[str]) -> bool:
+        return self._connect().execute(_SQL_SET_VOICEPRINT, (voiceprint_path, normalize(username))).rowcount == 1
+
+    def update_email(self, old_email: str, new_email: str) -> bool:
+        """Change the email of the (first) user whose email is exactly old_email."""
+        return self._connect().execute(_SQL_SET_EMAIL, (new_email, normalize(new_email), old_email)).rowcount == 1
+
+    def update_email_if_blank(self, full_name: str, new_email: str) -> bool:
+        """Set the email of the (first) user with this exact full_name and no email yet."""
+        return self._connect().execute(_SQL_SET_EMAIL_IF_BLANK,
+                                       (new_email, normalize(new_email), full_name)).rowcount == 1
+
+
+# =========================
+# In-memory index
+# =========================
+class UserRecord:
+    """One user, compactly (no per-instance __dict__)."""
+    __slots__ = ("username", "full_name", "email", "password_hash", "voiceprint_path", "extra")
+
+    def __init__(self, username, full_name, email, password_hash, voiceprint_path, extra):
+        self.username = username
+        self.full_name = full_name
+        self.email = email
+        self.password_hash = password_hash
+        self.voiceprint_path = voiceprint_path
+        self.extra = extra
+
+    def to_dict(self) -> Dict[str, object]:
+        """A fresh users.json-shaped dict (callers may modify it)."""
+        user = {"full_name": self.full_name, "email": self.email,
+                "password_hash": self.password_hash, "voiceprint_path": self.voiceprint_path}
+        if self.extra:
+            user.update(json.loads(self.extra))
+        return user
+
+
+class UserIndex:
+    """
+    Process-wide hash maps over a UserRegistry, keyed by normalized username,
+    email, full name and (email, full name); lookups are O(1) and read no
+    rows. Before each lookup `PRAGMA data_version` is checked on a dedicated
+    connection: it changes whenever any other connection (another thread's,
+    or another process such as the desktop app) commits, and only then are
+    the maps rebuilt. Where several users share an email or name, the first
+    one (by insertion order) wins, as the users.json scans did.
+    """
+
+    def __init__(self, registry: UserRegistry):
+        self.registry = registry
+        self._lock = threading.Lock()
+        self._monitor = sqlite3.connect(registry.db_path, timeout=BUSY_TIMEOUT_MS / 1000.0,
+                                        isolation_level=None, check_same_thread=False)
+        self._version = None
+        self._by_username: Dict[str, UserRecord] = {}
+        self._by_email: Dict[str, UserRecord] = {}
+        self._by_full_name: Dict[str, UserRecord] = {}
+        self._by_email_and_name: Dict[Tuple[str, str], UserRecord] = {}
+        self.reloads = 0
+
+    def _current(self) -> "UserIndex":
+        with self._lock:
+            version = self._monitor.execute("PRAGMA data_version").fetchone()[0]
+            if version != self._version:
+                self._rebuild()
+                self._version = version
+        return self
+
+    def _rebuild(self) -> None:
+        by_username, by_email, by_full_name, by_email_and_name = {}, {}, {}, {}
+        for row in self._monitor.execute(_SQL_ALL):
+            record = UserRecord(*row)
+            email, full_name = normalize(record.email), normalize(record.full_name)
+            by_username[normalize(record.username)] = record
+            if email:
+                by_email.setdefault(email, record)
+            if full_name:
+                by_full_name.setdefault(full_name, record)
+            by_email_and_name.setdefault((email, full_name), record)
+        self._by_username, self._by_email = by_username, by_email
+        self._by_full_name, self._by_email_and_name = by_full_name, by_email_and_name
+        self.reloads += 1
+
+    @staticmethod
+    def _result(record: Optional[UserRecord]) -> Tuple[Optional[str], Optional[Dict[str, object]]]:
+        return (record.username, record.to_dict()) if record else (None, None)
+
+    def get(self, username: str) -> Optional[Dict[str, object]]:
+        return self._result(self._current()._by_username.get(normalize(username)))[1]
+
+    def find(self, username: str) -> Tuple[Optional[str], Optional[Dict[str, object]]]:
+        return self._result(self._current()._by_username.get(normalize(username)))
+
+    def find_by_email(self, email: str) -> Tuple[Optional[str], Optional[Dict[str, object]]]:
+        return self._result(self._current()._by_email.get(normalize(email)))
+
+    def find_by_email_or_name(self, email: str = "", full_name: str = "") -> Tuple[Optional[str], Optional[Dict[str, object]]]:
+        email, full_name = normalize(email), normalize(full_name)
+        index = self._current()
+        if email and full_name:
+            return self._result(index._by_email_and_name.get((email, full_name)))
+        if email:
+            return self._result(index._by_email.get(email))
+        if full_name:
+            return self._result(index._by_full_name.get(full_name))
+        return None, None
+
+    def exists(self, username: str) -> bool:
+        return normalize(username) in self._current()._by_username
+
+    def __contains__(self, username: str) -> bool:
+        return self.exists(username)
+
+    def __len__(self) -> int:
+        return len(self._current()._by_username)
+
+    def close(self) -> None:
+        with self._lock:
+            self._monitor.close()
+
+
+# =========================
+# Shared instances
+# =========================
+_registries: Dict[str, UserRegistry] = {}
+_registries_lock = threading.Lock()
+
+def get_registry(legacy_json=LEGACY_USER_FILE) -> UserRegistry:
+    """
+    Process-wide registry. The default one lives at DB_PATH (KEYVOX_USER_DB);
+    for any other users.json the database sits next to it (<name>.db).
+    """
+    key = os.path.abspath(str(legacy_json))
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            same_as_default = key == os.path.abspath(str(LEGACY_USER_FILE))
+            db_path = DB_PATH if same_as_default else Path(key).with_suffix(".db")
+            registry = _registries[key] = UserRegistry(db_path, legacy_json)
+        return registry
+
+_indexes: Dict[str, UserIndex] = {}
+
+def get_user_index(legacy_json=LEGACY_USER_FILE) -> UserIndex:
+    """Process-wide UserIndex over get_registry(legacy_json)."""
+    registry = get_registry(legacy_json)
+    with _registries_lock:
+        index = _indexes.get(registry.db_path)
+        if index is None:
+            index = _indexes[registry.db_path] = UserIndex(registry)
+        return index
+
+
+__all__ = [
+    "DB_PATH",
+    "LEGACY_USER_FILE",
+    "normalize",
+    "UserRegistry",
+    "UserRecord",
+    "UserIndex",
+    "get_registry",
+    "get_user_index",
+]
@@ -0,0 +1,278 @@
+# backend/vad.py
+# Frame-level energy / zero-crossing voice activity detection shared by the
+# enrollment, verification and feature-extraction paths.
+#
+# Per-frame energy and zero-crossing counts come from running sums, so the
+# cost is O(n) in the number of samples whatever the frame length/overlap, and
+# frames are never materialised. With the default frame/hop (2048/512,
+# centered, dB relative to the loudest frame) `trim` finds the same endpoints
+# as librosa.effects.trim, so it is a drop-in replacement; `speech_segments` /
+# `keep_speech` additionally cut internal pauses.
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+# =========================
+# Public constants / knobs
+# =========================
+# "trim":     strip leading/trailing silence only (same endpoints as librosa.effects.trim).
+# "segments": keep only the detected speech segments (internal pauses removed too).
+# Enrollment and verification must use the same mode.
+VAD_MODE = os.environ.get("KEYVOX_VAD_MODE", "trim").lower()
+
+FRAME_LENGTH = 2048
+HOP_LENGTH = 512
+AMIN = 1e-10
+
+# speech_segments() smoothing (seconds)
+MIN_SILENCE_S = 0.25   # shorter pauses are bridged
+MIN_SPEECH_S = 0.10    # shorter bursts are dropped
+PAD_S = 0.05           # kept around each segment
+
+# Low-energy frames with this many zero crossings per sample are unvoiced
+# consonants (s, f, sh), kept if within FRICATIVE_EXTRA_DB of the speech floor.
+FRICATIVE_ZCR = 0.25
+FRICATIVE_EXTRA_DB = 10.0
+
+
+# =========================
+# Frame statistics
+# =========================
+def _frame_bounds(n: int, frame_length: int, hop_length: int) -> Tuple[np.ndarray, np.ndarray]:
+    """[start, end) sample range of each centered frame (zero padding outside the signal)."""
+    centers = np.arange(1 + n // hop_length) * hop_length
+    starts = np.clip(centers - frame_length // 2, 0, n)
+    ends = np.clip(centers + frame_length - frame_length // 2, 0, n)
+    return starts, ends
+
+def _windowed_sum(values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    csum = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    return csum[ends] - csum[starts]
+
+def frame_energy(y: np.ndarray, frame_length: int = FRAME_LENGTH, hop_length: int = HOP_LENGTH) -> np.ndarray:
+    """Mean square per centered frame (== librosa.feature.rms(...) ** 2)."""
+    y = np.asarray(y)
+    starts, ends = _frame_bounds(len(y), frame_length, hop_length)
+    return _windowed_sum(np.square(y, dtype=np.float64), starts, ends) / frame_length
+
+def zero_crossing_rate(y: np.ndarray, frame_length: int = FRAME_LENGTH, hop_length: int = HOP_LENGTH) -> np.ndarray:
+    """Sign changes per sample in each centered frame."""
+    y = np.asarray(y)
+    starts, ends = _frame_bounds(len(y), frame_length, hop_length)
+    if len(y) < 2:
+        return np.zeros(len(starts))
+    signs = np.signbit(y)
+    crossings = np.not_equal(signs[1:], signs[:-1])
+    # crossing k sits between samples k and k+1: count those with start <= k < end - 1
+    counts = _windowed_sum(crossings, np.minimum(starts, len(crossings)), np.clip(ends - 1, 0, len(crossings)))
+    return counts / frame_length
+
+def _energy_db(energy: np.ndarray, threshold: Optional[float]) -> Tuple[np.ndarray, float]:
+    """Frame level in dB and the 'speech' floor: relative to the loudest frame, or an absolute RMS threshold."""
+    db = 10.0 * np.log10(np.maximum(energy, AMIN))
+    if threshold is not None:
+        return db, 20.0 * np.log10(max(threshold, np.sqrt(AMIN)))
+    return db, 10.0 * np.log10(max(float(energy.max(initial=AMIN)), AMIN))
+
+def nonsilent_frames(y: np.ndarray, top_db: float = 20.0, threshold: Optional[float] = None,
+                     frame_length: int = FRAME_LENGTH, hop_length: int = HOP_LENGTH) -> np.ndarray:
+    """
+    Boolean mask of frames louder than `top_db` below the loudest frame (librosa
+    semantics), or, if `threshold` is given, whose RMS exceeds that absolute level.
+    """
+    db, ref = _energy_db(frame_energy(y, frame_length, hop_length), threshold)
+    floor = ref if threshold is not None else ref - top_db
+    return db > floor
+
+
+# =========================
+# Trimming / segmentation
+# =========================
+def trim_bounds(y: np.ndarray, top_db: float = 20.0, threshold: Optional[float] = None,
+                frame_length: int = FRAME_LENGTH, hop_length: int = HOP_LENGTH) -> Tuple[int, int]:
+    """[start, end) of the audio between the first and last non-silent frame."""
+    voiced = np.flatnonzero(nonsilent_frames(y, top_db, threshold, frame_length, hop_length))
+    if len(voiced) == 0:
+        return 0, 0
+    return int(voiced[0] * hop_length), int(min(len(y), (voiced[-1] + 1) * hop_length))
+
+def trim(y: np.ndarray, top_db: float = 20.0, threshold: Optional[float] = None,
+         frame_length: int = FRAME_LENGTH, hop_length: int = HOP_LENGTH) -> np.ndarray:
+    """Leading/trailing silence removed (a view, no copy)."""
+    start, end = trim_bounds(y, top_db, threshold, frame_length, hop_length)
+    return y[start:end]
+
+def segments_from_features(energy: np.ndarray, zcr: np.ndarray, n_samples: int, sr: int,
+                           top_db: float = 20.0, threshold: Optional[float] = None,
+                           hop_length: int = HOP_LENGTH, min_silence: float = MIN_SILENCE_S,
+                           min_speech: float = MIN_SPEECH_S, pad: float = PAD_S) -> np.ndarray:
+    """
+    speech_segments() from precomputed per-frame energy and zero-crossing rate
+    (frame_energy / zero_crossing_rate, or StreamingVAD's running copies).
+    """
+    db, ref = _energy_db(energy, threshold)
+    floor = ref if threshold is not None else ref - top_db
+    speech = db > floor
+    speech |= (db > floor - FRICATIVE_EXTRA_DB) & (zcr > FRICATIVE_ZCR)
+    if not speech.any():
+        return np.zeros((0, 2), dtype=np.int64)
+
+    # Runs of speech frames as [first, last + 1) frame indices.
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    # Bridge short pauses.
+    gap_frames = int(round(min_silence * sr / hop_length))
+    keep = np.concatenate(([True], starts[1:] - ends[:-1] > gap_frames))
+    starts = starts[keep]
+    ends = ends[np.concatenate((keep[1:], [True]))]
+
+    # Drop short bursts.
+    long_enough = (ends - starts) * hop_length >= min_speech * sr
+    starts, ends = starts[long_enough], ends[long_enough]
+
+    pad_samples = int(pad * sr)
+    seg = np.stack([starts * hop_length - pad_samples, ends * hop_length + pad_samples], axis=1)
+    np.clip(seg, 0, n_samples, out=seg)
+    # Padding can make neighbours overlap: merge them.
+    if len(seg) > 1:
+        overlap = np.concatenate(([False], seg[1:, 0] <= seg[:-1, 1]))
+        group = np.cumsum(~overlap) - 1
+        merged = np.zeros((group[-1] + 1, 2), dtype=seg.dtype)
+        merged[:, 0] = seg[~overlap, 0]
+        np.maximum.at(merged[:, 1], group, seg[:, 1])
+        seg = merged
+    return seg.astype(np.int64)
+
+def speech_segments(y: np.ndarray, sr: int, top_db: float = 20.0, threshold: Optional[float] = None,
+                    frame_length: int = FRAME_LENGTH, hop_length: int = HOP_LENGTH,
+                    min_silence: float = MIN_SILENCE_S, min_speech: float = MIN_SPEECH_S,
+                    pad: float = PAD_S) -> np.ndarray:
+    """
+    (k, 2) int array of [start, end) sample ranges of speech. Frames are speech
+    if loud enough (see nonsilent_frames) or fricative-like (high zero-crossing
+    rate, at most FRICATIVE_EXTRA_DB quieter); pauses shorter than min_silence
+    are bridged, bursts shorter than min_speech dropped, and `pad` seconds kept
+    around each segment.
+    """
+    return segments_from_features(frame_energy(y, frame_length, hop_length),
+                                  zero_crossing_rate(y, frame_length, hop_length),
+                                  len(y), sr, top_db, threshold, hop_length, min_silence, min_speech, pad)
+
+def keep_speech(y: np.ndarray, sr: int, top_db: float = 20.0, threshold: Optional[float] = None, **kwargs) -> np.ndarray:
+    """Only the speech segments of `y`, concatenated (internal pauses removed)."""
+    seg = speech_segments(y, sr, top_db=top_db, threshold=threshold, **kwargs)
+    if len(seg) == 0:
+        return y[:0]
+    if len(seg) == 1:
+        return y[seg[0, 0]:seg[0, 1]]
+    return np.concatenate([y[a:b] for a, b in seg])
+
+def remove_silence(y: np.ndarray, sr: int, top_db: float = 20.0, threshold: Optional[float] = None,
+                   mode: Optional[str] = None) -> np.ndarray:
+    """The one entry point the pipelines call: `trim` or `keep_speech` depending on VAD_MODE."""
+    mode = mode or VAD_MODE
+    if mode == "segments":
+        return keep_speech(y, sr, top_db=top_db, threshold=threshold)
+    if mode == "trim":
+        return trim(y, top_db=top_db, threshold=threshold)
+    raise ValueError(f"Unknown KEYVOX_VAD_MODE '{mode}' (expected 'trim' or 'segments').")
+
+
+# =========================
+# Streaming
+# =========================
+class StreamingVAD:
+    """
+    speech_segments() for audio that arrives in chunks. Each centered frame's
+    energy and zero-crossing rate are computed once, as soon as the frame is
+    complete, from running sums; segmentation then runs on those per-frame
+    features with the same rule as the offline path (loudness relative to the
+    loudest frame so far, or to the absolute `threshold`). After finish() the
+    features, and so the segments, are exactly the offline ones.
+    """
+
+    def __init__(self, sr: int, top_db: float = 20.0, threshold: Optional[float] = None,
+                 frame_length: int = FRAME_LENGTH, hop_length: int = HOP_LENGTH):
+        self.sr = sr
+        self.top_db = top_db
+        self.threshold = threshold
+        self.frame_length = frame_length
+        self.hop_length = hop_length
+        self.n_samples = 0
+        self.finished = False
+        self._last_sample_negative: Optional[bool] = None
+        # Running sums: squares up to sample i, sign changes up to crossing i.
+        self._csum_sq = np.zeros(1)
+        self._csum_zc = np.zeros(1)
+        self._energy = np.zeros(0)
+        self._zcr = np.zeros(0)
+
+    @property
+    def n_frames(self) -> int:
+        return len(self._energy)
+
+    @property
+    def energy(self) -> np.ndarray:
+        return self._energy
+
+    @property
+    def zcr(self) -> np.ndarray:
+        return self._zcr
+
+    def feed(self, samples: np.ndarray) -> int:
+        """Add samples; returns how many frames became complete."""
+        samples = np.asarray(samples)
+        if len(samples) == 0 or self.finished:
+            return 0
+        squares = np.cumsum(np.square(samples, dtype=np.float64)) + self._csum_sq[-1]
+        signs = np.signbit(samples)
+        if self._last_sample_negative is not None:
+            signs_prev = np.concatenate(([self._last_sample_negative], signs))
+        else:
+            signs_prev = signs
+        crossings = np.cumsum(np.not_equal(signs_prev[1:], signs_prev[:-1])) + self._csum_zc[-1]
+        self._csum_sq = np.concatenate((self._csum_sq, squares))
+        self._csum_zc = np.concatenate((self._csum_zc, crossings))
+        self._last_sample_negative = bool(signs[-1])
+        self.n_samples += len(samples)
+        # Frame j is complete once its right edge (j * hop + frame - frame // 2) has arrived.
+        right = self.frame_length - self.frame_length // 2
+        complete = max(0, (self.n_samples - right) // self.hop_length + 1)
+        return self._extend(min(complete, 1 + self.n_samples // self.hop_length))
+
+    def finish(self) -> int:
+        """End of stream: the trailing frames (zero-padded past the end) are completed."""
+        added = self._extend(1 + self.n_samples // self.hop_length)
+        self.finished = True
+        return added
+
+    def _extend(self, n_frames: int) -> int:
+        first = self.n_frames
+        if n_frames <= first:
+            return 0
+        centers = np.arange(first, n_frames) * self.hop_length
+        starts = np.clip(centers - self.frame_length // 2, 0, self.n_samples)
+        ends = np.clip(centers + self.frame_length - self.frame_length // 2, 0, self.n_samples)
+        energy = (self._csum_sq[ends] - self._csum_sq[starts]) / self.frame_length
+        n_crossings = len(self._csum_zc) - 1
+        zc_starts = np.minimum(starts, n_crossings)
+        zc_ends = np.clip(ends - 1, 0, n_crossings)
+        zcr = (self._csum_zc[zc_ends] - self._csum_zc[zc_starts]) / self.frame_length
+        self._energy = np.concatenate((self._energy, energy))
+        self._zcr = np.concatenate((self._zcr, zcr))
+        return n_frames - first
+
+    def segments(self, **kwargs) -> np.ndarray:
+        """Speech segments (sample ranges) among the frames completed so far."""
+        if self.n_frames == 0:
+            return np.zeros((0, 2), dtype=np.int64)
+        return segments_from_features(self._energy, self._zcr, self.n_samples, self.sr, self.top_db,
+                                      self.threshold, self.hop_length, **kwargs)
+
+    @property
+    def voiced_seconds(self) -> float:
+        seg = self.segments()
+        return float((seg[:, 1] - seg[:, 0]).sum()) / self.sr
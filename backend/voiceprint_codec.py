@@ -0,0 +1,313 @@
+# backend/voiceprint_codec.py
+# Compressed in-memory representation of voiceprint matrices for scoring:
+#   float16                  2 bytes / dim
+#   int8 (per-vector scale)  1 byte / dim + one float32 scale per voiceprint
+# optionally after a learned PCA projection to fewer dims. Cosine scores are
+# computed directly on the codes (the query stays full precision), so the
+# float32 matrix never has to be resident.
+#
+# A codec is only switched on after `evaluate` has shown, on labelled
+# embeddings, that EER and scores stay within MAX_EER_DELTA / MAX_SCORE_DRIFT
+# of full precision. A PCA is fitted on some speakers and evaluated on the
+# held-out rest. The passing report (and the fitted PCA) are written next to
+# the voiceprints and checked by load_codec() at startup.
+#
+#   python voiceprint_codec.py --mode int8 --pca-dim 32 --npz embeddings.npz
+#   python voiceprint_codec.py --mode float16 --audio-dir recordings/
+import os
+import json
+import argparse
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# =========================
+# Public constants / knobs
+# =========================
+CODEC_MODES = ("float32", "float16", "int8")
+CODEC_MODE = os.environ.get("KEYVOX_VOICEPRINT_CODEC", "float32").lower()
+CODEC_PCA_DIM = int(os.environ.get("KEYVOX_VOICEPRINT_PCA_DIM", "0"))  # 0 = no projection
+
+# Guardrails: a codec is rejected if it moves EER or trial scores by more than this.
+MAX_EER_DELTA = 0.005    # absolute (0.5 percentage points)
+MAX_SCORE_DRIFT = 0.02   # mean |cosine(full) - cosine(codec)|
+
+REPORT_FILENAME = "codec_report.json"
+PCA_FILENAME = "codec_pca.npz"
+
+SCORE_CHUNK_ROWS = 16384  # codes are widened to float32 this many rows at a time
+
+
+class EncodedMatrix(NamedTuple):
+    codes: np.ndarray              # (N, d) float32 / float16 / int8
+    scales: Optional[np.ndarray]   # (N,) float32 for int8, else None
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+
+def _normalize_rows(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+
+# =========================
+# Codec
+# =========================
+class VoiceprintCodec:
+    def __init__(self, mode: str = "float32", pca_mean: Optional[np.ndarray] = None,
+                 pca_components: Optional[np.ndarray] = None):
+        if mode not in CODEC_MODES:
+            raise ValueError(f"Unknown voiceprint codec '{mode}' (expected one of {CODEC_MODES}).")
+        self.mode = mode
+        self.pca_mean = None if pca_mean is None else np.asarray(pca_mean, dtype=np.float32)
+        self.pca_components = None if pca_components is None else np.asarray(pca_components, dtype=np.float32)
+
+    @property
+    def name(self) -> str:
+        if self.pca_components is None:
+            return self.mode
+        return f"{self.mode}+pca{self.pca_components.shape[0]}"
+
+    # --- PCA ---
+    @staticmethod
+    def fit_pca(vectors: np.ndarray, dim: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Mean and top-`dim` principal axes (dim, D) of L2-normalized voiceprints."""
+        x = _normalize_rows(vectors)
+        mean = x.mean(axis=0)
+        _, _, vt = np.linalg.svd(x - mean, full_matrices=False)
+        return mean, np.ascontiguousarray(vt[:dim])
+
+    def with_pca(self, vectors: np.ndarray, dim: int) -> "VoiceprintCodec":
+        mean, components = self.fit_pca(vectors, dim)
+        return VoiceprintCodec(self.mode, mean, components)
+
+    def save_pca(self, path: str) -> None:
+        np.savez(path, mean=self.pca_mean, components=self.pca_components)
+
+    # --- Encoding ---
+    def project(self, vectors: np.ndarray) -> np.ndarray:
+        """Normalized rows in the (optionally PCA-reduced) scoring space."""
+        x = _normalize_rows(np.atleast_2d(vectors))
+        if self.pca_components is not None:
+            x = _normalize_rows((x - self.pca_mean) @ self.pca_components.T)
+        return x
+
+    def encode(self, vectors: np.ndarray) -> EncodedMatrix:
+        x = self.project(vectors)
+        if self.mode == "float16":
+            return EncodedMatrix(x.astype(np.float16), None)
+        if self.mode == "int8":
+            scales = np.maximum(np.abs(x).max(axis=1), 1e-12) / 127.0
+            codes = np.clip(np.rint(x / scales[:, np.newaxis]), -127, 127).astype(np.int8)
+            return EncodedMatrix(codes, scales.astype(np.float32))
+        return EncodedMatrix(np.ascontiguousarray(x), None)
+
+    def slice(self, encoded: EncodedMatrix, start: int, stop: int) -> EncodedMatrix:
+        scales = encoded.scales[start:stop] if encoded.scales is not None else None
+        return EncodedMatrix(encoded.codes[start:stop], scales)
+
+    def decode(self, encoded: EncodedMatrix) -> np.ndarray:
+        codes = encoded.codes.astype(np.float32)
+        return codes * encoded.scales[:, np.newaxis] if encoded.scales is not None else codes
+
+    def score(self, encoded: EncodedMatrix, queries: np.ndarray, projected: bool = False) -> np.ndarray:
+        """
+        (Q, N) cosine scores of full-precision queries against encoded
+        voiceprints. Pass projected=True if `queries` already went through project().
+        """
+        q = np.atleast_2d(queries) if projected else self.project(queries)
+        if encoded.codes.dtype == np.float32:
+            return q @ encoded.codes.T
+        out = np.empty((len(q), len(encoded)), dtype=np.float32)
+        for start in range(0, len(encoded), SCORE_CHUNK_ROWS):
+            block = encoded.codes[start:start + SCORE_CHUNK_ROWS].astype(np.float32)
+            out[:, start:start + len(block)] = q @ block.T
+        if encoded.scales is not None:
+            out *= encoded.scales
+        return out
+
+
+# =========================
+# Evaluation / guardrail
+# =========================
+def equal_error_rate(genuine: np.ndarray, impostor: np.ndarray) -> float:
+    """EER of score arrays where higher means 'same speaker'."""
+    scores = np.concatenate([genuine, impostor])
+    is_genuine = np.concatenate([np.ones(len(genuine), bool), np.zeros(len(impostor), bool)])
+    order = np.argsort(-scores, kind="stable")
+    is_genuine = is_genuine[order]
+    # Threshold just below each sorted score: accepted = prefix.
+    far = np.cumsum(~is_genuine) / max(1, len(impostor))
+    frr = 1.0 - np.cumsum(is_genuine) / max(1, len(genuine))
+    i = int(np.argmin(np.abs(far - frr)))
+    return float((far[i] + frr[i]) / 2.0)
+
+def _trial_split(scores: np.ndarray, labels: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Genuine / impostor scores over all unordered pairs of a square score matrix."""
+    iu = np.triu_indices(len(labels), k=1)
+    same = labels[iu[0]] == labels[iu[1]]
+    s = scores[iu]
+    return s[same], s[~same]
+
+def split_speakers(labels: np.ndarray, holdout: float = 0.5, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Boolean (fit, held_out) masks that put every speaker entirely on one side,
+    so a fitted projection is evaluated on voices it has never seen. At least
+    two speakers with two or more embeddings are held out (evaluate needs
+    genuine and impostor trials), and at least one speaker is left to fit on.
+    """
+    labels = np.asarray(labels)
+    speakers, counts = np.unique(labels, return_counts=True)
+    order = np.random.default_rng(seed).permutation(len(speakers))
+    # Speakers with repeats first, so the held-out side has genuine trials.
+    order = order[np.argsort(counts[order] < 2, kind="stable")]
+    if len(speakers) < 3 or (counts >= 2).sum() < 2:
+        raise ValueError("Need at least three speakers, two of them with two or more embeddings.")
+    n_held = int(np.clip(round(holdout * len(speakers)), 2, len(speakers) - 1))
+    held_out = np.isin(labels, speakers[order[:n_held]])
+    return ~held_out, held_out
+
+def evaluate(embeddings: np.ndarray, labels: np.ndarray, codec: VoiceprintCodec) -> Dict[str, object]:
+    """
+    Score every pair of labelled embeddings at full precision and through
+    `codec` (one side encoded, like enrolled voiceprint vs live probe) and
+    compare. `passed` is what load_codec() requires before enabling it.
+    """
+    labels = np.asarray(labels)
+    full = VoiceprintCodec("float32")
+    full_scores = full.score(full.encode(embeddings), embeddings)
+    codec_scores = codec.score(codec.encode(embeddings), embeddings)
+
+    g_full, i_full = _trial_split(full_scores, labels)
+    g_codec, i_codec = _trial_split(codec_scores, labels)
+    if len(g_full) == 0 or len(i_full) == 0:
+        raise ValueError("Need at least two speakers with two or more embeddings each.")
+    eer_full = equal_error_rate(g_full, i_full)
+    eer_codec = equal_error_rate(g_codec, i_codec)
+    drift = np.abs(np.concatenate([g_full, i_full]) - np.concatenate([g_codec, i_codec]))
+    dim = embeddings.shape[1]
+    code_dim = codec.pca_components.shape[0] if codec.pca_components is not None else dim
+    bytes_per_dim = {"float32": 4, "float16": 2, "int8": 1}[codec.mode]
+
+    report = {
+        "codec": codec.name,
+        "embeddings": int(len(embeddings)),
+        "speakers": int(len(np.unique(labels))),
+        "eer_full": eer_full,
+        "eer_codec": eer_codec,
+        "eer_delta": eer_codec - eer_full,
+        "score_drift_mean": float(drift.mean()),
+        "score_drift_max": float(drift.max()),
+        "bytes_per_voiceprint": int(code_dim * bytes_per_dim + (4 if codec.mode == "int8" else 0)),
+        "bytes_per_voiceprint_full": int(dim * 4),
+    }
+    report["passed"] = bool(report["eer_delta"] <= MAX_EER_DELTA and report["score_drift_mean"] <= MAX_SCORE_DRIFT)
+    return report
+
+def load_codec(directory: str, mode: str = CODEC_MODE, pca_dim: int = CODEC_PCA_DIM) -> VoiceprintCodec:
+    """
+    The configured codec, but only if a passing evaluation report for exactly
+    that configuration exists in `directory`; otherwise full precision.
+    """
+    if mode == "float32" and not pca_dim:
+        return VoiceprintCodec("float32")
+    requested = mode + (f"+pca{pca_dim}" if pca_dim else "")
+    report_path = os.path.join(directory, REPORT_FILENAME)
+    try:
+        with open(report_path, "r") as f:
+            report = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        report = {}
+    if report.get("codec") != requested or not report.get("passed"):
+        print(f"⚠️ Voiceprint codec '{requested}' has no passing evaluation in {report_path}; "
+              f"using float32. Run voiceprint_codec.py first.")
+        return VoiceprintCodec("float32")
+    if pca_dim and not report.get("pca_held_out"):
+        print(f"⚠️ The PCA in {report_path} was evaluated on the speakers it was fitted on; "
+              f"using float32. Re-run voiceprint_codec.py.")
+        return VoiceprintCodec("float32")
+    if pca_dim:
+        pca = np.load(os.path.join(directory, PCA_FILENAME))
+        return VoiceprintCodec(mode, pca["mean"], pca["components"])
+    return VoiceprintCodec(mode)
+
+
+# =========================
+# CLI
+# =========================
+def _embeddings_from_audio_dir(audio_dir: str) -> Tuple[np.ndarray, np.ndarray]:
+    """LSTM embeddings of <audio_dir>/<speaker>/*.wav, or <audio_dir>/<speaker>_*.wav."""
+    from helpers import get_voice_embedding
+
+    items = []
+    for entry in sorted(os.listdir(audio_dir)):
+        path = os.path.join(audio_dir, entry)
+        if os.path.isdir(path):
+            items += [(entry, os.path.join(path, f)) for f in sorted(os.listdir(path)) if f.endswith(".wav")]
+        elif entry.endswith(".wav"):
+            items.append((entry.split("_")[0], path))
+    embeddings, labels = [], []
+    for speaker, path in items:
+        emb = get_voice_embedding(path)
+        if emb is not None:
+            embeddings.append(emb)
+            labels.append(speaker)
+    return np.asarray(embeddings, dtype=np.float32), np.asarray(labels)
+
+def main():
+    from config import VOICEPRINTS_DIR
+
+    parser = argparse.ArgumentParser(description="Evaluate (and approve) a compressed voiceprint codec.")
+    parser.add_argument("--mode", choices=CODEC_MODES, default="int8")
+    parser.add_argument("--pca-dim", type=int, default=0)
+    parser.add_argument("--npz", help="file with 'embeddings' (N, D) and 'labels' (N,) arrays")
+    parser.add_argument("--audio-dir", help="labelled recordings to embed with the LSTM model")
+    parser.add_argument("--out-dir", default=VOICEPRINTS_DIR)
+    parser.add_argument("--holdout", type=float, default=0.5,
+                        help="with --pca-dim: fraction of speakers kept out of the PCA fit and evaluated on")
+    parser.add_argument("--seed", type=int, default=0, help="speaker split seed")
+    args = parser.parse_args()
+
+    if args.npz:
+        data = np.load(args.npz)
+        embeddings, labels = data["embeddings"], data["labels"]
+    elif args.audio_dir:
+        embeddings, labels = _embeddings_from_audio_dir(args.audio_dir)
+    else:
+        parser.error("one of --npz / --audio-dir is required")
+
+    codec = VoiceprintCodec(args.mode)
+    if args.pca_dim:
+        # Fit on some speakers, evaluate on the others: scoring the embeddings
+        # the projection was fitted on would understate EER and drift.
+        fit, held_out = split_speakers(labels, args.holdout, args.seed)
+        codec = codec.with_pca(embeddings[fit], args.pca_dim)
+        report = evaluate(embeddings[held_out], labels[held_out], codec)
+        report["pca_held_out"] = True
+        report["pca_fit_embeddings"] = int(fit.sum())
+        report["pca_fit_speakers"] = int(len(np.unique(labels[fit])))
+    else:
+        report = evaluate(embeddings, labels, codec)
+    for key, value in report.items():
+        print(f"  {key:<28}{value}")
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    if report["passed"]:
+        if args.pca_dim:
+            codec.save_pca(os.path.join(args.out_dir, PCA_FILENAME))
+        with open(os.path.join(args.out_dir, REPORT_FILENAME), "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ '{codec.name}' is within guardrails. Enable with KEYVOX_VOICEPRINT_CODEC={args.mode}"
+              + (f" KEYVOX_VOICEPRINT_PCA_DIM={args.pca_dim}" if args.pca_dim else ""))
+    else:
+        print(f"❌ '{codec.name}' exceeds guardrails (EER delta <= {MAX_EER_DELTA}, "
+              f"mean score drift <= {MAX_SCORE_DRIFT}); not enabled.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+# backend/voiceprint_store.py
+# Every voiceprint of a deployment in one contiguous float32 matrix file,
+# memory-mapped once, instead of one .npy/.pt file per user that is opened
+# and unpickled on every lookup.
+#
+# On disk (all in one directory):
+#   <name>.index.json     {"dim", "generation", "data_file", "n_rows", "rows": {username: row}}
+#   <name>.<gen>.f32      raw row-major float32 matrix, append-only
+#   <name>.lock           present while a writer holds the store
+#
+# Writers only ever append rows and then atomically replace the index, so a
+# reader sees either the old or the new index and never a half-written row.
+# Re-enrolling appends a new row and repoints the username; deleting just drops
+# the username. The orphaned rows (tombstones) are reclaimed by compact(), which
+# writes the live rows to a new generation file. Readers notice index changes
+# with one os.stat() per lookup and remap (hot reload).
+import os
+import json
+import time
+import ntpath
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# =========================
+# Public constants / knobs
+# =========================
+STORE_NAME = "voiceprints"
+DTYPE = np.float32
+
+LOCK_TIMEOUT_S = 10.0   # give up acquiring the writer lock after this long
+STALE_LOCK_S = 60.0     # a lock file older than this is left over from a crashed writer
+
+# Compact automatically once more than this fraction of rows are tombstones.
+AUTO_COMPACT_DEAD_RATIO = 0.5
+AUTO_COMPACT_MIN_ROWS = 64
+
+
+class StoreView(NamedTuple):
+    """
+    Consistent read-only snapshot of the store.
+      matrix:    (n_rows, dim) memory-mapped rows, including tombstones
+      usernames: live usernames
+      rows:      row of each live username in `matrix` (same order)
+    Score every live voiceprint with `(view.matrix @ q)[view.rows]`.
+    """
+    matrix: np.ndarray
+    usernames: List[str]
+    rows: np.ndarray
+    generation: int
+
+
+# =========================
+# Store
+# =========================
+class VoiceprintStore:
+    def __init__(self, directory: str, name: str = STORE_NAME):
+        self.directory = directory
+        self.name = name
+        self.index_path = os.path.join(directory, f"{name}.index.json")
+        self.lock_path = os.path.join(directory, f"{name}.lock")
+        os.makedirs(directory, exist_ok=True)
+
+        self._mutex = threading.RLock()
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._dim: Optional[int] = None
+        self._generation = 0
+        self._data_file: Optional[str] = None
+        self._n_rows = 0
+        self._rows: Dict[str, int] = {}
+        self._matrix = np.zeros((0, 0), dtype=DTYPE)
+        self._view: Optional[StoreView] = None
+        self.reload(force=True)
+
+    # --- Reading ---
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self._rows)
+
+    def __contains__(self, username: str) -> bool:
+        self._refresh()
+        return username in self._rows
+
+    @property
+    def dim(self) -> Optional[int]:
+        self._refresh()
+        return self._dim
+
+    def usernames(self) -> List[str]:
+        self._refresh()
+        return list(self._rows)
+
+    def get(self, username: str) -> Optional[np.ndarray]:
+        """The user's voiceprint as a (dim,) float32 copy, or None if not enrolled."""
+        with self._mutex:
+            self._refresh()
+            row = self._rows.get(username)
+            if row is None:
+                return None
+            return np.array(self._matrix[row])
+
+    def view(self) -> StoreView:
+        """Snapshot for bulk scoring (cohort z-norm, 1:N identification)."""
+        with self._mutex:
+            self._refresh()
+            if self._view is None:
+                usernames = list(self._rows)
+                rows = np.fromiter((self._rows[u] for u in usernames), dtype=np.int64, count=len(usernames))
+                self._view = StoreView(self._matrix, usernames, rows, self._generation)
+            return self._view
+
+    def stats(self) -> Dict[str, int]:
+        self._refresh()
+        return {
+            "live": len(self._rows),
+            "rows": self._n_rows,
+            "tombstones": self._n_rows - len(self._rows),
+            "dim": self._dim or 0,
+            "generation": self._generation,
+        }
+
+    # --- Hot reload ---
+    def _stat_signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _refresh(self) -> None:
+        """Reload if another process (or another store object) replaced the index."""
+        if self._stat_signature() != self._signature:
+            self.reload()
+
+    def reload(self, force: bool = False) -> None:
+        with self._mutex:
+            signature = self._stat_signature()
+            if not force and signature == self._signature:
+                return
+            index = self._read_index()
+            self._dim = index.get("dim")
+            self._generation = int(index.get("generation", 0))
+            self._data_file = index.get("data_file")
+            self._n_rows = int(index.get("n_rows", 0))
+            self._rows = dict(index.get("rows", {}))
+            self._matrix = self._map_matrix()
+            self._view = None
+            self._signature = signature
+
+    def _read_index(self) -> Dict:
+        if not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _map_matrix(self) -> np.ndarray:
+        if not self._dim or not self._n_rows or not self._data_file:
+            return np.zeros((0, self._dim or 0), dtype=DTYPE)
+        path = os.path.join(self.directory, self._data_file)
+        return np.memmap(path, dtype=DTYPE, mode="r", shape=(self._n_rows, self._dim))
+
+    # --- Writing ---
+    @contextmanager
+    def _writer(self):
+        """Exclusive writer section: thread mutex + cross-process lock file, on a fresh index."""
+        with self._mutex:
+            deadline = time.monotonic() + LOCK_TIMEOUT_S
+            while True:
+                try:
+                    fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                    break
+                except FileExistsError:
+                    try:
+                        if time.time() - os.path.getmtime(self.lock_path) > STALE_LOCK_S:
+                            os.remove(self.lock_path)
+                            continue
+                    except FileNotFoundError:
+                        continue
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"Voiceprint store '{self.lock_path}' is locked by another writer.")
+                    time.sleep(0.01)
+            try:
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                self.reload(force=True)
+                yield
+            finally:
+                try:
+                    os.remove(self.lock_path)
+                except FileNotFoundError:
+                    pass
+
+    def _write_index(self, rows: Dict[str, int], n_rows: int, data_file: str, generation: int) -> None:
+        index = {
+            "version": 1,
+            "dim": self._dim,
+            "generation": generation,
+            "data_file": data_file,
+            "n_rows": n_rows,
+            "rows": rows,
+        }
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.index_path)
+        # Drop our own map before remapping (the old data file may get removed).
+        self._matrix = np.zeros((0, 0), dtype=DTYPE)
+        self.reload(force=True)
+
+    def _check_vector(self, vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=DTYPE).reshape(-1)
+        if self._dim is None:
+            self._dim = int(v.shape[0])
+        elif v.shape[0] != self._dim:
+            raise ValueError(f"Voiceprint has {v.shape[0]} dims, store holds {self._dim}.")
+        if not np.all(np.isfinite(v)):
+            raise ValueError("Voiceprint contains NaN/inf values.")
+        return v
+
+    def put(self, username: str, vector) -> None:
+        """Enroll or re-enroll one user."""
+        self.put_many({username: vector})
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        """Append several voiceprints with one write and one index update."""
+        if not items:
+            return
+        with self._writer():
+            names = list(items)
+            block = np.stack([self._check_vector(items[u]) for u in names])
+            data_file = self._data_file or f"{self.name}.{self._generation}.f32"
+            path = os.path.join(self.directory, data_file)
+
+            # Rows past n_rows can only be leftovers of a crashed writer: overwrite them.
+            with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                f.seek(self._n_rows * self._dim * block.itemsize)
+                f.write(np.ascontiguousarray(block).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            rows = dict(self._rows)
+            for i, u in enumerate(names):
+                rows[u] = self._n_rows + i
+            self._write_index(rows, self._n_rows + len(names), data_file, self._generation)
+        self._maybe_compact()
+
+    def delete(self, username: str) -> bool:
+        """Tombstone a user's row. Returns False if the user was not enrolled."""
+        with self._writer():
+            if username not in self._rows:
+                return False
+            rows = dict(self._rows)
+            del rows[username]
+            self._write_index(rows, self._n_rows, self._data_file, self._generation)
+        self._maybe_compact()
+        return True
+
+    def compact(self) -> int:
+        """Rewrite the live rows into a new generation file. Returns the number of rows reclaimed."""
+        with self._writer():
+            reclaimed = self._n_rows - len(self._rows)
+            if reclaimed == 0 or self._dim is None:
+                return 0
+            generation = self._generation + 1
+            data_file = f"{self.name}.{generation}.f32"
+
+            names = sorted(self._rows, key=self._rows.get)
+            live = np.asarray(self._matrix[[self._rows[u] for u in names]], dtype=DTYPE)
+            with open(os.path.join(self.directory, data_file), "wb") as f:
+                f.write(np.ascontiguousarray(live).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self._write_index({u: i for i, u in enumerate(names)}, len(names), data_file, generation)
+            self._remove_stale_data_files(keep=data_file)
+            return reclaimed
+
+    def _maybe_compact(self) -> None:
+        dead = self._n_rows - len(self._rows)
+        if self._n_rows >= AUTO_COMPACT_MIN_ROWS and dead > AUTO_COMPACT_DEAD_RATIO * self._n_rows:
+            self.compact()
+
+    def _remove_stale_data_files(self, keep: str) -> None:
+        """Best effort: a data file still mapped by another process (Windows) is removed next time."""
+        prefix = f"{self.name}."
+        for fname in os.listdir(self.directory):
+            if fname == keep or not (fname.startswith(prefix) and fname.endswith(".f32")):
+                continue
+            try:
+                os.remove(os.path.join(self.directory, fname))
+            except OSError:
+                pass
+
+
+# =========================
+# Migration from per-user files
+# =========================
+def resolve_legacy_path(path: str, base_dir: str, voiceprints_dir: str) -> Optional[str]:
+    """
+    Find a per-user voiceprint file referenced from users.json. Those paths may
+    be relative ('voiceprints\\koy.npy') or absolute Windows paths from another
+    machine ('D:\\...\\voiceprints\\julsss.npy'); fall back to the file name
+    inside voiceprints_dir.
+    """
+    if not path:
+        return None
+    candidates = [
+        path,
+        os.path.join(base_dir, path.replace("\\", os.sep)),
+        os.path.join(voiceprints_dir, ntpath.basename(path)),
+    ]
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+def legacy_voiceprint_files(directory: str, extension: str,
+                            referenced: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    username -> file for the old one-file-per-user layout: every `<user><extension>`
+    in `directory`, overridden by `referenced` (already-resolved users.json paths).
+    """
+    files: Dict[str, str] = {}
+    if os.path.isdir(directory):
+        for fname in sorted(os.listdir(directory)):
+            if fname.endswith(extension):
+                files[fname[:-len(extension)]] = os.path.join(directory, fname)
+    for username, path in (referenced or {}).items():
+        if path:
+            files[username] = path
+    return files
+
+def migrate_legacy_files(store: VoiceprintStore, files: Dict[str, str],
+                         loader: Callable[[str], np.ndarray] = np.load) -> int:
+    """
+    One-time import of per-user voiceprint files into the store. Users already
+    in the store are skipped, so this is safe to run on every startup.
+    Returns the number of voiceprints imported.
+    """
+    items = {}
+    for username, path in files.items():
+        if username in store:
+            continue
+        try:
+            items[username] = np.asarray(loader(path), dtype=DTYPE).reshape(-1)
+        except Exception as e:
+            print(f"⚠️ Skipping voiceprint {path}: {e}")
+    if items:
+        store.put_many(items)
+        print(f"✅ Migrated {len(items)} voiceprint file(s) into {store.index_path}")
+    return len(items)
+
+
+__all__ = [
+    "STORE_NAME",
+    "StoreView",
+    "VoiceprintStore",
+    "resolve_legacy_path",
+    "legacy_voiceprint_files",
+    "migrate_legacy_files",
+]
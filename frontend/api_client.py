@@ -1,52 +1,264 @@
+import io
+import os
+import time
+import wave
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import json
+from requests.adapters import HTTPAdapter
+from urllib3 import encode_multipart_formdata
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+# Upload transports in order of preference (the server lists what it accepts in /api/status).
+AUDIO_FORMATS = ("flac", "pcm16", "wav")
+PCM16_MIMETYPE = "audio/x-pcm16le"
+
+# --- Connection handling ---
+# (connect, read) timeouts in seconds per endpoint; DEFAULT_TIMEOUT for the rest.
+DEFAULT_TIMEOUT = (3.05, 10)
+TIMEOUTS = {
+    "status": (2, 3),
+    "enroll_voice": (3.05, 30),
+    "verify_voice": (3.05, 30),
+    "identify_voice": (3.05, 30),
+    "verify_stream": (3.05, 15),
+}
+# All retries happen in ApiClient._request (the adapter itself never retries).
+# Idempotent calls are retried this many times on connection errors / 502-504,
+# other calls only when the connection could not be made (nothing reached the
+# server), sleeping RETRY_BACKOFF_S * 2**attempt in between, or the server's
+# Retry-After capped at RETRY_AFTER_MAX_S.
+RETRY_ATTEMPTS = 3
+RETRY_BACKOFF_S = 0.3
+RETRY_AFTER_MAX_S = 5.0
+RETRY_STATUSES = (502, 503, 504)
+POOL_SIZE = 8
+ASYNC_WORKERS = 4
+UPLOAD_BLOCK = 16 * 1024
+
+def _not_sent(error):
+    """True if the request failed before a connection was made, so retrying can't repeat it."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    return isinstance(reason, MaxRetryError) and isinstance(reason.reason, NewConnectionError)
+
+def encode_audio_file(audio_filepath, audio_format):
+    """
+    (filename, payload, content_type) for a 16-bit PCM WAV recording in the
+    given transport: "flac" (lossless, via soundfile), "pcm16" (the raw
+    little-endian samples, rate/channels in the content type) or "wav" (as is).
+    """
+    if audio_format == "pcm16":
+        with wave.open(audio_filepath, 'rb') as wf:
+            rate, channels = wf.getframerate(), wf.getnchannels()
+            pcm = wf.readframes(wf.getnframes())
+        return "audio.pcm", pcm, f"{PCM16_MIMETYPE}; rate={rate}; channels={channels}"
+    if audio_format == "flac":
+        import soundfile as sf
+        samples, rate = sf.read(audio_filepath, dtype='int16')
+        buf = io.BytesIO()
+        sf.write(buf, samples, rate, format='FLAC', subtype='PCM_16')
+        return "audio.flac", buf.getvalue(), "audio/flac"
+    with open(audio_filepath, 'rb') as f:
+        return os.path.basename(audio_filepath), f.read(), "audio/wav"
+
+class _ProgressBody(io.BytesIO):
+    """Request body that reports (bytes_sent, total) as http.client reads it."""
+    def __init__(self, payload, progress):
+        super().__init__(payload)
+        self._total = len(payload)
+        self._progress = progress
+
+    def read(self, size=-1):
+        chunk = super().read(UPLOAD_BLOCK if size is None or size < 0 else min(size, UPLOAD_BLOCK))
+        if chunk:
+            self._progress(self.tell(), self._total)
+        return chunk
+
 
 class APIClient:
-    def __init__(self, base_url="http://127.0.0.1:5000"):
+    """
+    Client for the KeyVox backend. All calls share one pooled keep-alive
+    requests.Session; every method is blocking and returns the server's JSON
+    (or an error dict, never raises). call_async() runs any of them on a
+    worker thread and, when a Tk root is given, delivers results on the Tk
+    thread via root.after().
+    """
+    def __init__(self, base_url="http://127.0.0.1:5000", audio_format="auto", tk_root=None):
         self.base_url = base_url
+        # "auto" = most compact format the server advertises; or force "flac" / "pcm16" / "wav".
+        self.audio_format = audio_format
+        self._negotiated_format = None
+        self.tk_root = tk_root
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = None
+        self._executor_lock = threading.Lock()
 
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+    # --- Plumbing ---
     def _handle_response(self, response):
         try: return response.json()
         except json.JSONDecodeError: return {"status": "error", "message": "Invalid server response."}
 
+    def _request(self, method, path, endpoint, idempotent=False, **kwargs):
+        """One HTTP call on the pooled session, with the endpoint's timeout and, if idempotent, retries."""
+        kwargs.setdefault("timeout", TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT))
+        body_factory = kwargs.pop("body_factory", None)
+        for attempt in range(RETRY_ATTEMPTS + 1):
+            if body_factory is not None:
+                kwargs["data"] = body_factory()  # upload bodies are streams: rebuild them per attempt
+            try:
+                response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == RETRY_ATTEMPTS or not (idempotent or _not_sent(e)):
+                    raise
+                time.sleep(RETRY_BACKOFF_S * 2 ** attempt)
+                continue
+            if response.status_code not in RETRY_STATUSES or not idempotent or attempt == RETRY_ATTEMPTS:
+                return response
+            retry_after = response.headers.get("Retry-After", "")
+            delay = float(retry_after) if retry_after.replace(".", "", 1).isdigit() else RETRY_BACKOFF_S * 2 ** attempt
+            time.sleep(min(delay, RETRY_AFTER_MAX_S))
+        return response
+
+    def _upload(self, path, endpoint, audio_filepath, fields, progress=None, idempotent=False):
+        """
+        Multipart POST of an audio file (in the negotiated transport) plus form
+        fields. The body is encoded once and streamed, so `progress(sent, total)`
+        is called as the bytes actually go out.
+        """
+        filename, payload, content_type = self._audio_part(audio_filepath)
+        body, multipart_type = encode_multipart_formdata(
+            dict(fields, audio_file=(filename, payload, content_type)))
+        if progress is not None:
+            body_factory = lambda: _ProgressBody(body, self._dispatcher(progress))
+        else:
+            body_factory = lambda: body
+        return self._request("POST", path, endpoint, idempotent=idempotent, body_factory=body_factory,
+                             headers={"Content-Type": multipart_type})
+
+    def _upload_format(self):
+        """Negotiated once per client: first of AUDIO_FORMATS the server lists; WAV for older servers."""
+        if self.audio_format != "auto":
+            return self.audio_format
+        if self._negotiated_format is None:
+            try:
+                offered = self._request("GET", "/api/status", "status", idempotent=True).json().get("audio_formats", [])
+            except Exception:
+                return "wav"
+            self._negotiated_format = next((fmt for fmt in AUDIO_FORMATS if fmt in offered), "wav")
+        return self._negotiated_format
+
+    def _audio_part(self, audio_filepath):
+        try:
+            return encode_audio_file(audio_filepath, self._upload_format())
+        except ImportError:
+            # soundfile isn't installed: FLAC unavailable, raw PCM is still compact.
+            self._negotiated_format = "pcm16"
+            return encode_audio_file(audio_filepath, "pcm16")
+
+    # --- Non-blocking use ---
+    def _dispatcher(self, fn):
+        """fn, but run on the Tk thread (root.after) when the client has a Tk root."""
+        if self.tk_root is None:
+            return fn
+        return lambda *args: self.tk_root.after(0, fn, *args)
+
+    def call_async(self, fn, *args, on_done=None, **kwargs):
+        """
+        Run a client method (e.g. api.call_async(api.login, user, pw, on_done=cb))
+        on the worker pool. Returns a concurrent.futures.Future; `on_done(result)`
+        is called with the method's return value, on the Tk thread if tk_root is set.
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=ASYNC_WORKERS, thread_name_prefix="keyvox-api")
+        future = self._executor.submit(fn, *args, **kwargs)
+        if on_done is not None:
+            deliver = self._dispatcher(on_done)
+            def _done(f):
+                try: result = f.result()
+                except Exception as e: result = {"status": "error", "message": f"Connection error: {e}"}
+                deliver(result)
+            future.add_done_callback(_done)
+        return future
+
+    # --- Endpoints ---
     def check_server_status(self):
         try:
-            response = requests.get(f"{self.base_url}/api/status", timeout=3)
+            response = self._request("GET", "/api/status", "status", idempotent=True)
             return response.status_code == 200
         except: return False
 
     def register_user(self, user_data):
         try:
-            response = requests.post(f"{self.base_url}/api/register", json=user_data)
+            response = self._request("POST", "/api/register", "register", json=user_data)
             return self._handle_response(response)
         except Exception as e: return {"status": "error", "message": f"Connection error: {e}"}
 
-    def enroll_voice(self, username, audio_filepath):
+    def enroll_voice(self, username, audio_filepath, progress=None):
         try:
-            with open(audio_filepath, 'rb') as f:
-                files = {'audio_file': f}
-                data = {'username': username}
-                response = requests.post(f"{self.base_url}/api/enroll_voice", files=files, data=data, timeout=30)
+            response = self._upload("/api/enroll_voice", "enroll_voice", audio_filepath, {'username': username}, progress)
             return self._handle_response(response)
         except Exception as e: return {"status": "error", "message": f"Connection error: {e}"}
 
     def check_enrollment(self, username):
         try:
-            response = requests.post(f"{self.base_url}/api/check_enrollment", json={"username": username})
+            response = self._request("POST", "/api/check_enrollment", "check_enrollment", idempotent=True,
+                                     json={"username": username})
             return self._handle_response(response)
         except Exception as e: return {"enrolled": False, "message": f"Connection error: {e}"}
 
-    def verify_voice(self, username, audio_filepath):
+    def verify_voice(self, username, audio_filepath, progress=None):
         try:
-            with open(audio_filepath, 'rb') as f:
-                files = {'audio_file': f}
-                data = {'username': username}
-                response = requests.post(f"{self.base_url}/api/verify_voice", files=files, data=data, timeout=30)
+            response = self._upload("/api/verify_voice", "verify_voice", audio_filepath, {'username': username},
+                                    progress, idempotent=True)
             return self._handle_response(response)
         except Exception as e: return {"verified": False, "message": f"Connection error: {e}"}
 
+    # --- Streaming verification: PCM chunks are posted while the user is still speaking ---
+    def start_verify_stream(self, username, sample_rate):
+        try:
+            response = self._request("POST", "/api/verify_stream/start", "verify_stream",
+                                     json={"username": username, "sample_rate": sample_rate})
+            return self._handle_response(response)
+        except Exception as e: return {"status": "error", "message": f"Connection error: {e}"}
+
+    def send_verify_chunk(self, session_id, pcm_bytes, final=False):
+        """Post raw int16 mono PCM. Returns {"status": "pending" | "accept" | "reject", ...}."""
+        try:
+            response = self._request("POST", f"/api/verify_stream/{session_id}", "verify_stream",
+                                     params={"final": "1" if final else "0"}, data=pcm_bytes,
+                                     headers={"Content-Type": "application/octet-stream"})
+            return self._handle_response(response)
+        except Exception as e: return {"status": "error", "message": f"Connection error: {e}"}
+
+    def cancel_verify_stream(self, session_id):
+        try:
+            response = self._request("DELETE", f"/api/verify_stream/{session_id}", "verify_stream", idempotent=True)
+            return self._handle_response(response)
+        except Exception as e: return {"closed": False, "message": f"Connection error: {e}"}
+
+    def identify_voice(self, audio_filepath, top_k=5, progress=None):
+        """1:N: which enrolled users does this recording sound like? Returns {"identified", "matches"}."""
+        try:
+            response = self._upload("/api/identify_voice", "identify_voice", audio_filepath, {'top_k': str(top_k)},
+                                    progress, idempotent=True)
+            return self._handle_response(response)
+        except Exception as e: return {"identified": None, "matches": [], "message": f"Connection error: {e}"}
+
     def login(self, username, password):
         try:
-            response = requests.post(f"{self.base_url}/api/login", json={"username": username, "password": password})
+            response = self._request("POST", "/api/login", "login", json={"username": username, "password": password})
             return self._handle_response(response)
-        except Exception as e: return {"login_success": False, "message": f"Connection error: {e}"}
\ No newline at end of file
+        except Exception as e: return {"login_success": False, "message": f"Connection error: {e}"}
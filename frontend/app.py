@@ -20,7 +20,7 @@ class KeyVoxApp:
     def __init__(self, root):
         self.temp_new_email = None # JC Temporary email variable for OTP Change
         self.root = root
-        self.api = APIClient()
+        self.api = APIClient(tk_root=root)  # async results are delivered on the Tk thread
         
         # --- Window and App Configuration ---
         self.width, self.height = 900, 600
@@ -142,8 +142,11 @@ class KeyVoxApp:
     # SERVER CHECK AND STARTUP FLOW
     # =========================================================
     def check_server_and_start(self):
-        """Checks backend server status and starts the UI flow."""
-        if not self.api.check_server_status():
+        """Checks backend server status (off the Tk thread) and starts the UI flow."""
+        self.api.call_async(self.api.check_server_status, on_done=self._on_server_status)
+
+    def _on_server_status(self, reachable):
+        if reachable is not True:
             messagebox.showerror("Connection Error", "Could not connect to the backend server.\nPlease ensure the server is running.")
             self.root.destroy()
         else:
@@ -184,6 +187,7 @@ class KeyVoxApp:
     # =========================================================
     def toggle_recording(self, event=None): audio_handler.toggle_recording(self, event)
     def _record_audio_blocking(self, filepath, duration=4): audio_handler.record_audio_blocking(self, filepath, duration)
+    def _record_and_verify_streaming(self, username, max_duration=5, on_status=None): return audio_handler.record_and_verify_streaming(self, username, max_duration, on_status=on_status)
     def _mask_email(self, email): return helpers.mask_email(email)
 
     def _on_closing(self):
@@ -194,6 +198,7 @@ class KeyVoxApp:
             self._shutdown()
 
     def _shutdown(self):
+        self.api.close()
         self.pyaudio_instance.terminate()
         self.root.destroy()
 
@@ -27,4 +27,8 @@ TRANSITION = "all 0.2s cubic-bezier(0.4,0,0.2,1)"
 AUDIO_DIR = "temp_audio"
 CHUNK = 1024
 CHANNELS = 1
-RATE = 44100
\ No newline at end of file
+# Every backend model runs at 16 kHz: capture at that rate when the device allows it.
+RATE = 16000
+# Device rates tried, in order, when it can't capture at RATE; the recording is
+# then resampled to RATE on the client before upload.
+FALLBACK_RATES = (48000, 44100, 32000, 22050)
\ No newline at end of file
@@ -404,9 +404,9 @@ def handle_final_enrollment_upload(app, next_step="otp"):
         return
 
     audio_path = os.path.join(config.AUDIO_DIR, f"{username}_phrase_1.wav")
-    # if not os.path.exists(audio_path):
-    #     messagebox.showerror("Error", "Primary enrollment audio not found. Please record phrase 1 again.")
-    #     return
+    if not os.path.exists(audio_path):
+        messagebox.showerror("Error", "Primary enrollment audio not found. Please record phrase 1 again.")
+        return
 
     # Stash the path for post-OTP voice enrollment
     app.pending_voice_file = audio_path
@@ -495,21 +495,20 @@ def show_enrollment_step3_otp(app):
             # ✅ Enroll voice now that the user exists
             username = app.new_enrollment_data.get("username")
             print("6")
-            # audio_path = app.pending_voice_file
-            audio_path = "TESTTESTEST"
+            audio_path = app.pending_voice_file
             print("7")
-            # if not username or not audio_path or not os.path.exists(audio_path):
-            #     print("8")
-            #     messagebox.showerror("Error", "Voice recording not found for enrollment.")
-            #     return
+            if not username or not audio_path or not os.path.exists(audio_path):
+                print("8")
+                messagebox.showerror("Error", "Voice recording not found for enrollment.")
+                return
             print("9")
-            # resp = app.api.enroll_voice(username, audio_path)
-            # print("10")
-            # if not resp or resp.get("status") != "success":
-            #     print("11")
-            #     messagebox.showerror("Enrollment Failed", resp.get("message", "Voice enrollment failed."))
-            #     return
-            # print("11")
+            # Same endpoint, store and model that login verification (/api/verify_stream) uses.
+            resp = app.api.enroll_voice(username, audio_path)
+            print("10")
+            if not resp or resp.get("status") != "success":
+                print("11")
+                messagebox.showerror("Enrollment Failed", resp.get("message", "Voice enrollment failed."))
+                return
 
             # → Proceed to Step 4 (file upload)
             show_enrollment_step4_file_upload(app)
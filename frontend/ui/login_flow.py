@@ -9,8 +9,6 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../backend")))
 from user_data_manager import get_user_by_key, update_email, get_user_by_email, get_user_by_username, change_password, username_exists
 
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../prototypes")))
-from verify_jovs import verify_user
 
 
 
@@ -198,48 +196,71 @@ def show_login_voice_auth_screen(app):
 
 
 def handle_login_voice_record(app, event=None):
-    """Handles the recording and API verification for voice login (bypassed to always succeed)."""
+    """
+    Voice step of the login. The microphone is streamed to /api/verify_stream so
+    the server can decide while the user is still speaking; if streaming isn't
+    available, a 4 s clip is recorded and uploaded to /api/verify_voice instead.
+    Both run on the API worker pool, never on the Tk thread.
+    """
     username = app.login_attempt_user.get('username')
     if not username:
         messagebox.showerror("Error", "Username missing.")
         return
-    '''
-    JULIAN CODE BLOCK 1
-    app.recording_status_label.config(text="Recording (4s)...")
-    app.root.update_idletasks()
-    
+    if getattr(app, 'login_voice_busy', False):
+        return
+    app.login_voice_busy = True
+    app.recording_status_label.config(text="Listening... please speak now.")
+
+    def on_status(reply):
+        # Called from the upload thread: widget updates go through the Tk event loop.
+        app.root.after(0, _show_stream_status, app, reply)
+
+    app.api.call_async(app._record_and_verify_streaming, username, on_status=on_status,
+                       on_done=lambda result: _on_stream_result(app, username, result))
+
+
+def _voice_screen_active(app):
+    return app.login_flow_state == 'voice_auth' and app.recording_status_label.winfo_exists()
+
+
+def _show_stream_status(app, reply):
+    if reply.get("status") == "pending" and _voice_screen_active(app):
+        app.recording_status_label.config(text=f"Listening... {reply.get('voiced_seconds', 0):.1f}s of speech")
+
+
+def _on_stream_result(app, username, result):
+    if result.get("status") in ("accept", "reject"):
+        _on_voice_verified(app, username, result)
+        return
+    if not _voice_screen_active(app):
+        app.login_voice_busy = False
+        return
+    # Older server, failed session, timeout...: fall back to a one-shot upload.
+    print(f"⚠️ Streaming verification unavailable ({result.get('message')}); falling back to upload.")
+    if _voice_screen_active(app):
+        app.recording_status_label.config(text="Recording (4s)...")
+    app.api.call_async(_record_and_upload, app, username,
+                       on_done=lambda response: _on_voice_verified(app, username, response))
+
+
+def _record_and_upload(app, username):
     filepath = os.path.join(config.AUDIO_DIR, f"verify_{username}.wav")
     app._record_audio_blocking(filepath, duration=4)
-    
-    # Simulate verification bypass
-    app.recording_status_label.config(text="Verifying...")
-    app.root.update_idletasks()
-    
-    # --- Always accept ---
-    messagebox.showinfo("Success", "Voice Authenticated! Please enter your password.")
-    messagebox.showinfo("Success", "FIRST VOICE.")
-    '''
-    # verified = True
-    # if verified:
-        
-    #     messagebox.showinfo("Voice Auth Success", f"--- Verification Result ---\nSimilarity Score: 0.743\n✅ Access Granted. Welcome {username}")
-    #     show_password_screen(app)
-    # else:
-    #     messagebox.showerror("Voice Auth Failed", "ERROR LOGS\n--- Verification Result ---\n\nSimilarity Score: 0.116\n ❌ Access Denied. Voice does not match.")
-    
-    print("handle_login_voice_record logs")
-    success = verify_user(username)
-    if success:
+    return app.api.verify_voice(username, filepath)
+
+
+def _on_voice_verified(app, username, result):
+    app.login_voice_busy = False
+    if not _voice_screen_active(app):
+        return  # the user left the screen while we were listening
+    if result.get("verified"):
         messagebox.showinfo("Verification", f"✅ Access granted for '{username}'.")
         show_password_screen(app)
     else:
-        messagebox.showerror("Verification", f"❌ Voice does not match '{username}'.")
-
-
+        app.recording_status_label.config(text="Click the mic to try again")
+        messagebox.showerror("Verification", f"❌ {result.get('message') or f'Voice does not match {username!r}.'}")
 
 
-    
-
 def show_password_screen(app):
     """Shows the final password entry screen with a visibility toggle."""
     app.login_flow_state = 'password_entry'
@@ -799,8 +820,12 @@ def check_password(app):
         app.error_label.config(text="An error occurred.")
         return
 
-    response = app.api.login(username, password)
+    # The request runs on the API worker pool; the result comes back on the Tk thread.
+    app.api.call_async(app.api.login, username, password,
+                       on_done=lambda response: _on_login_response(app, username, response))
+
 
+def _on_login_response(app, username, response):
     if response.get("login_success") and response.get("user_details"):
         user = response.get("user_details") or {}
         # use the same normalization you used earlier during login
@@ -1,23 +1,81 @@
 import os
 import wave
+import queue
 import pyaudio
 import threading
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+from scipy.signal import firwin, resample_poly
 import frontend_config as config
 from tkinter import messagebox
 
-import sys
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../prototypes")))
-from enroll_jovs import enroll_user
 
 # PyAudio format constant
 FORMAT = pyaudio.paInt16
 
+# =========================
+# Capture rate negotiation / client-side resampling
+# =========================
+_capture_rates = {}
+
+def negotiate_capture_rate(pyaudio_instance):
+    """
+    The rate to open the default input device at: config.RATE if the device
+    supports it, else the first supported config.FALLBACK_RATES entry (else its
+    default rate). Cached per device, since probing can be slow on some hosts.
+    """
+    try:
+        device = pyaudio_instance.get_default_input_device_info()
+    except IOError:
+        return config.RATE
+    index = device["index"]
+    if index in _capture_rates:
+        return _capture_rates[index]
+
+    rate = int(device["defaultSampleRate"])
+    for candidate in (config.RATE,) + tuple(config.FALLBACK_RATES):
+        try:
+            if pyaudio_instance.is_format_supported(candidate, input_device=index,
+                                                    input_channels=config.CHANNELS, input_format=FORMAT):
+                rate = candidate
+                break
+        except ValueError:
+            continue
+    if rate != config.RATE:
+        print(f"[*] Input device can't capture at {config.RATE} Hz; recording at {rate} Hz and resampling.")
+    _capture_rates[index] = rate
+    return rate
+
+@lru_cache(maxsize=8)
+def _polyphase_filter(up, down):
+    """Anti-aliasing FIR for resample_poly(up, down) (the same Kaiser design scipy uses), built once per ratio."""
+    max_rate = max(up, down)
+    return firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+
+def resample_pcm16(pcm, native_rate, target_rate=config.RATE, channels=config.CHANNELS):
+    """Resample interleaved int16 PCM bytes with a cached polyphase filter; unchanged if the rates match."""
+    if native_rate == target_rate:
+        return pcm
+    g = gcd(int(native_rate), int(target_rate))
+    up, down = int(target_rate) // g, int(native_rate) // g
+    samples = np.frombuffer(pcm, dtype="<i2").reshape(-1, channels).astype(np.float32)
+    out = resample_poly(samples, up, down, axis=0, window=_polyphase_filter(up, down))
+    return np.clip(np.round(out), -32768, 32767).astype("<i2").tobytes()
+
+
 def record_audio_blocking(app, filepath, duration=4):
-    """Records audio for a fixed duration, blocking the main thread until complete."""
+    """
+    Records audio for a fixed duration, blocking the main thread until complete.
+    The WAV is always written at config.RATE (16 kHz), resampled here if the
+    device had to record at another rate.
+    """
+    rate = negotiate_capture_rate(app.pyaudio_instance)
     stream = app.pyaudio_instance.open(
         format=FORMAT,
         channels=config.CHANNELS,
-        rate=config.RATE,
+        rate=rate,
         input=True,
         frames_per_buffer=config.CHUNK
     )
@@ -25,7 +83,7 @@ def record_audio_blocking(app, filepath, duration=4):
     frames = []
     print(f"[*] Starting {duration}-second blocking recording...")
     
-    for _ in range(0, int(config.RATE / config.CHUNK * duration)):
+    for _ in range(0, int(rate / config.CHUNK * duration)):
         try:
             data = stream.read(config.CHUNK, exception_on_overflow=False)
             frames.append(data)
@@ -41,30 +99,117 @@ def record_audio_blocking(app, filepath, duration=4):
         wf.setnchannels(config.CHANNELS)
         wf.setsampwidth(app.pyaudio_instance.get_sample_size(FORMAT))
         wf.setframerate(config.RATE)
-        wf.writeframes(b''.join(frames))
+        wf.writeframes(resample_pcm16(b''.join(frames), rate))
+
+def record_and_verify_streaming(app, username, max_duration=5, chunk_seconds=0.25, on_status=None):
+    """
+    Streaming counterpart of record_audio_blocking + verify_voice: microphone
+    chunks are posted to /api/verify_stream while recording continues, and
+    recording stops as soon as the server accepts or rejects.
+    Returns the server's final result dict ({"status", "verified", "distance", ...}).
+    Chunks are sent at the negotiated capture rate; if that isn't 16 kHz the
+    server resamples (per-chunk client resampling would leave seams at every
+    chunk boundary).
+    """
+    rate = negotiate_capture_rate(app.pyaudio_instance)
+    started = app.api.start_verify_stream(username, rate)
+    if started.get("status") != "pending":
+        return {"status": "error", "verified": False, "message": started.get("message", "Could not start verification.")}
+    session_id = started["session_id"]
+    max_duration = min(max_duration, started.get("max_seconds", max_duration))
+
+    stream = app.pyaudio_instance.open(
+        format=FORMAT,
+        channels=config.CHANNELS,
+        rate=rate,
+        input=True,
+        frames_per_buffer=config.CHUNK
+    )
+
+    # Uploads run on their own thread so a slow round trip never stalls the microphone.
+    outbox = queue.Queue()
+    result = {"status": "pending"}
+    decided = threading.Event()
+
+    def _sender():
+        while True:
+            item = outbox.get()
+            if item is None:
+                return
+            pcm, final = item
+            reply = app.api.send_verify_chunk(session_id, pcm, final=final)
+            result.update(reply)
+            if on_status:
+                on_status(reply)
+            if reply.get("status") != "pending":
+                decided.set()
+                return
+
+    sender = threading.Thread(target=_sender, daemon=True)
+    sender.start()
+
+    frames_per_chunk = max(1, int(rate / config.CHUNK * chunk_seconds))
+    total_reads = int(rate / config.CHUNK * max_duration)
+    print(f"[*] Streaming up to {max_duration}s of audio for verification...")
+    pending = []
+    sent_final = False
+    try:
+        for i in range(total_reads):
+            if decided.is_set():
+                break
+            try:
+                pending.append(stream.read(config.CHUNK, exception_on_overflow=False))
+            except IOError as e:
+                print(f"An error occurred during recording: {e}")
+                break
+            sent_final = i == total_reads - 1
+            if len(pending) >= frames_per_chunk or sent_final:
+                outbox.put((b''.join(pending), sent_final))
+                pending = []
+        if not decided.is_set() and not sent_final:
+            outbox.put((b''.join(pending), True))
+    finally:
+        stream.stop_stream()
+        stream.close()
+        outbox.put(None)
+
+    sender.join(timeout=30)
+    if result.get("status") == "pending":
+        app.api.cancel_verify_stream(session_id)
+        result.update({"status": "error", "verified": False, "message": "Verification timed out."})
+    print(f"[*] Streaming verification finished: {result.get('status')}")
+    return result
 
 def toggle_recording(app, event=None):
-    # """Starts or stops the enrollment recording thread."""
-    # if app.is_recording:
-    #     app.is_recording = False
-    #     app.recording_status_label.config(text="Saving...")
-    # else:
-    #     app.is_recording = True
-    #     app.next_btn.config(state="disabled")
-    #     app.recording_status_label.config(text="Recording... Click mic to stop.")
-        # app.recording_thread = threading.Thread(target=_record_audio_thread, args=(app,), daemon=True)
-    #     app.recording_thread.start() 
-    print("toggle_recording")
-    # app.recording_status_label.config(text="Recording... Click mic to stop.")
-    # app.recording_status_label.config(text="Saving...")
-    
-    # messagebox.showinfo("TRIAL 1", "Trial 2 3 4 5 ")
-    username = app.new_enrollment_data.get('username', 'user')
+    """
+    Records the current enrollment phrase (4 s) to
+    <AUDIO_DIR>/<username>_phrase_<n>.wav off the Tk thread. The clip is
+    uploaded to /api/enroll_voice once the account exists (after the OTP step),
+    so enrollment and login use the same backend voiceprint store and model.
+    """
+    username = app.new_enrollment_data.get('username')
     if not username:
         messagebox.showwarning("Missing Input", "Please enter a username.")
         return
+    if app.is_recording:
+        return
+    app.is_recording = True
+    app.next_btn.config(state="disabled")
+    app.recording_status_label.config(text="Recording (4s)... please speak now.")
+    filepath = os.path.join(config.AUDIO_DIR, f"{username}_phrase_{app.current_phrase_index + 1}.wav")
+    app.api.call_async(app._record_audio_blocking, filepath, 4,
+                       on_done=lambda result: _on_recording_finished(app, filepath, result))
+
+def _on_recording_finished(app, filepath, result):
+    """Runs on the Tk thread once the enrollment clip is written (or failed)."""
+    app.is_recording = False
+    if app.enrollment_state != 'step3_voice_record' or not app.recording_status_label.winfo_exists():
+        return
+    if (isinstance(result, dict) and result.get("status") == "error") or not os.path.exists(filepath):
+        app.recording_status_label.config(text="Recording failed. Click the mic to try again.")
+        return
+    app.recording_status_label.config(text="Recording saved!")
     app.next_btn.config(state="normal")
-    enroll_user(username)
 
 # def _record_audio_thread(app):
 #     """The target function for the recording thread."""
@@ -0,0 +1,146 @@
+# cohort_index.py
+# The impostor cohort for z-norm: every enrolled voiceprint, read from the
+# shared memory-mapped VoiceprintStore (backend/voiceprint_store.py). A probe
+# is scored against the whole cohort with a single matrix-vector product, and
+# each user's impostor statistics are precomputed at enrollment.
+
+import os
+import sys
+import json
+import threading
+
+import numpy as np
+import torch
+
+from config_jovs import BASE_DIR, VOICEPRINTS_DIR
+
+# The store module lives in backend/ (shared with the Flask server).
+sys.path.append(os.path.join(os.path.dirname(BASE_DIR), "backend"))
+from voiceprint_store import VoiceprintStore, legacy_voiceprint_files, migrate_legacy_files
+
+STATS_FILENAME = "cohort_stats.json"
+
+# Precomputed impostor stats are reused until the cohort has grown/shrunk by more than this.
+STATS_MAX_DRIFT = 0.2
+
+
+def _normalize(v):
+    v = np.asarray(v, dtype=np.float32).reshape(-1)
+    return v / (np.linalg.norm(v) + 1e-8)
+
+
+def load_voiceprint_pt(path):
+    """Old per-user .pt voiceprint -> L2-normalized (D,) array (multi-row files are averaged)."""
+    v = torch.load(path)
+    if v.ndim == 2:
+        v = v.mean(dim=0)
+    return _normalize(v.detach().cpu().numpy())
+
+
+def robust_stats(scores):
+    """Median and MAD-based sigma of a score vector (what z-norm divides by)."""
+    scores = np.asarray(scores, dtype=np.float32)
+    m = float(np.median(scores))
+    mad = float(np.median(np.abs(scores - m)))
+    sigma = 1.4826 * mad + 1e-6  # MAD->std
+    return m, mad, sigma
+
+
+class CohortIndex:
+    """
+    Voiceprints (L2-normalized rows) come from the VoiceprintStore in
+    voiceprints_dir; cohort_stats.json holds {user: {"median", "mad", "sigma", "cohort_size"}}.
+    """
+
+    def __init__(self, voiceprints_dir=VOICEPRINTS_DIR):
+        self.voiceprints_dir = voiceprints_dir
+        self.stats_path = os.path.join(voiceprints_dir, STATS_FILENAME)
+        self._lock = threading.RLock()
+        self.store = VoiceprintStore(voiceprints_dir)
+        if not os.path.exists(self.store.index_path):
+            # One-time import of the old <user>.pt files.
+            migrate_legacy_files(self.store, legacy_voiceprint_files(voiceprints_dir, ".pt"), loader=load_voiceprint_pt)
+        self._stats = self._load_stats()
+
+    # --- Persistence of precomputed stats ---
+    def _load_stats(self):
+        if not os.path.exists(self.stats_path):
+            return {}
+        try:
+            with open(self.stats_path, "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save_stats(self):
+        tmp = self.stats_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._stats, f, indent=2)
+        os.replace(tmp, self.stats_path)
+
+    # --- Updates ---
+    def upsert(self, username, voiceprint):
+        """Store one user's (normalized) voiceprint, then precompute their impostor stats."""
+        with self._lock:
+            self.store.put(username, _normalize(voiceprint))
+            self._stats = self._load_stats()
+            self._stats[username] = self._impostor_stats(username)
+            self._save_stats()
+
+    # --- Scoring ---
+    def __len__(self):
+        return len(self.store)
+
+    def get(self, username):
+        """The user's stored voiceprint, or None if not enrolled."""
+        return self.store.get(username)
+
+    def cohort_size(self, exclude=None):
+        return len(self.store) - (1 if exclude in self.store else 0)
+
+    def scores(self, probe, exclude=None):
+        """Cosine of `probe` against every cohort member except `exclude` (one matvec)."""
+        view = self.store.view()
+        if not view.usernames:
+            return np.zeros(0, dtype=np.float32)
+        s = np.asarray(view.matrix @ _normalize(probe))[view.rows]
+        if exclude is not None and exclude in view.usernames:
+            s = np.delete(s, view.usernames.index(exclude))
+        return s
+
+    def _impostor_stats(self, username):
+        voiceprint = self.store.get(username)
+        s = self.scores(voiceprint, exclude=username)
+        if len(s) == 0:
+            return None
+        m, mad, sigma = robust_stats(s)
+        return {"median": m, "mad": mad, "sigma": sigma, "cohort_size": int(len(s))}
+
+    def enrolled_stats(self, username):
+        """
+        Z-norm statistics of `username`'s own voiceprint against the cohort,
+        precomputed at enrollment so verification pays O(1). Recomputed (one
+        matvec, not persisted) if the cohort size drifted by more than
+        STATS_MAX_DRIFT since then.
+        """
+        with self._lock:
+            if username not in self.store:
+                return None
+            stats = self._stats.get(username)
+            size = self.cohort_size(exclude=username)
+            if stats is None or abs(size - stats["cohort_size"]) > STATS_MAX_DRIFT * max(1, stats["cohort_size"]):
+                stats = self._impostor_stats(username)
+            return stats
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_cohort_index():
+    """Process-wide CohortIndex (store memory-mapped on first use)."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = CohortIndex(VOICEPRINTS_DIR)
+    return _index
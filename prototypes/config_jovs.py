@@ -24,3 +24,16 @@ DURATION = 5
 
 # --- Verification Configuration ---
 VERIFICATION_THRESHOLD = 0.68
+
+# --- Segment Embedding Configuration ---
+# "batched":      every sliding window is re-encoded by ECAPA (all windows in one encode_batch call).
+# "shared_trunk": Fbank + the convolutional trunk run once over the whole utterance; only
+#                 attentive statistics pooling + the final linear layer run per window.
+# Enrollment and verification must use the same mode.
+SEGMENT_EMBEDDING_MODE = "batched"
+
+# --- Cohort Z-Norm Configuration ---
+# "probe":    score the probe against the cohort matrix at verify time (one matrix-vector product).
+# "enrolled": use the target voiceprint's impostor stats, precomputed at enrollment (O(1) at verify time).
+ZNORM_MODE = "probe"
+ZNORM_MIN_COHORT = 5
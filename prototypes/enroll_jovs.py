@@ -8,8 +8,10 @@ import warnings
 import contextlib
 import sys
 import sounddevice as sd
-from helpers_jovs import get_model, record_audio, save_temp_audio, calibrate_ambient_noise, trim_silence, sliding_windows
-from config_jovs import VOICEPRINTS_DIR, SAMPLE_RATE, DURATION
+from helpers_jovs import (get_model, record_audio, save_temp_audio, calibrate_ambient_noise, trim_silence,
+                          embed_full_and_segments, l2_normalize)
+from config_jovs import SAMPLE_RATE, DURATION
+from cohort_index import get_cohort_index
 
 import tkinter as tk
 from tkinter import messagebox
@@ -41,11 +43,11 @@ def enroll_user(username: str) -> bool:
     root = tk.Tk()
     root.withdraw()  # hide main window
 
-    os.makedirs(VOICEPRINTS_DIR, exist_ok=True)
-    voiceprint_path = os.path.join(VOICEPRINTS_DIR, f"{username}.pt")
+    # Voiceprints go to the shared memory-mapped store (see cohort_index.py).
+    cohort = get_cohort_index()
 
     # --- Check if voiceprint already exists ---
-    if os.path.exists(voiceprint_path):
+    if username in cohort.store:
         overwrite = messagebox.askyesno(
             "Overwrite Existing Voiceprint",
             f"A voiceprint for '{username}' already exists.\nDo you want to overwrite it?"
@@ -187,25 +189,13 @@ def enroll_user(username: str) -> bool:
     signal = trim_silence(signal, threshold=0.005)
 
     # --- Segmented enrollment to MATCH verification ---
-    segments = sliding_windows(signal, SAMPLE_RATE, win_sec=1.5, hop_sec=0.5)
-    embeds = []
-    with torch.no_grad():
-        for seg in segments:
-            # skip very short segments
-            if seg.shape[-1] < int(0.6 * SAMPLE_RATE):
-                continue
-            emb = model.encode_batch(seg)
-            # Remove batch dim if present
-            if emb.ndim == 3:  # [1, frames, dim]
-                emb = emb.squeeze(0)
-            # Average across frames (temporal mean)
-            if emb.ndim == 2:  # [frames, dim]
-                emb = emb.mean(dim=0)
-            # L2 normalize per-segment
-            emb = emb / (emb.norm(p=2) + 1e-8)
-            embeds.append(emb)
-
-    if not embeds:
+    # Same windows and SEGMENT_EMBEDDING_MODE as verification; very short segments are skipped.
+    _, embeds = embed_full_and_segments(
+        model, signal, SAMPLE_RATE, win_sec=1.5, hop_sec=0.5, min_samples=int(0.6 * SAMPLE_RATE),
+        need_full=False
+    )
+
+    if embeds.shape[0] == 0:
         messagebox.showerror("Enrollment Error", "Recording too short/noisy. Please try again.")
         if temp_file and os.path.exists(temp_file):
             os.remove(temp_file)
@@ -213,9 +203,9 @@ def enroll_user(username: str) -> bool:
         return False
 
     # Aggregate segments (mean, matching verify)
-    voiceprint = torch.stack(embeds, dim=0).mean(dim=0)
-    voiceprint = voiceprint / (voiceprint.norm(p=2) + 1e-8)
-    torch.save(voiceprint, voiceprint_path)
+    voiceprint = l2_normalize(embeds.mean(dim=0))
+    # One appended row in the store + this user's precomputed impostor stats
+    cohort.upsert(username, voiceprint.numpy())
 
     print("Temp file path:", temp_file)
     if temp_file and os.path.exists(temp_file):
@@ -224,7 +214,7 @@ def enroll_user(username: str) -> bool:
     # --- Show exact save location to the user ---
     messagebox.showinfo(
         "Enrollment Success",
-        f"✅ Enrollment complete!\nVoiceprint for '{username}' saved at:\n{os.path.abspath(voiceprint_path)}"
+        f"✅ Enrollment complete!\nVoiceprint for '{username}' saved to:\n{os.path.abspath(cohort.store.index_path)}"
     )
     root.destroy()
     return True
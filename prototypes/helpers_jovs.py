@@ -1,33 +1,48 @@
 # helpers.py
 
 import os
+import sys
+import threading
 import torch
 import sounddevice as sd
 from scipy.io.wavfile import write
 from speechbrain.inference.speaker import SpeakerRecognition
-from config_jovs import SAMPLE_RATE, CHANNELS, MODEL_SOURCE, MODELS_DIR
+from speechbrain.lobes.models.ECAPA_TDNN import TDNNBlock
+from config_jovs import BASE_DIR, SAMPLE_RATE, CHANNELS, MODEL_SOURCE, MODELS_DIR, SEGMENT_EMBEDDING_MODE
 import numpy as np
 import tkinter as tk
 from tkinter import ttk
 
+# The VAD lives in backend/ (shared with the Flask server's pipelines).
+sys.path.append(os.path.join(os.path.dirname(BASE_DIR), "backend"))
+import vad
+
 
 # --- Model Loading (Singleton) ---
+verification_model = None
+_model_lock = threading.Lock()
+
 def get_model():
-    """Loads and returns the speaker recognition model."""
+    """
+    Loads and returns the speaker recognition model. Safe to call from several
+    threads at once: the first caller loads it, the others wait for that load.
+    """
     global verification_model
-    if 'verification_model' not in globals():
-        print("Loading verification model KeyVox v1.0")
-        run_opts = {
-            "device": "cpu",
-            "data_parallel_backend": False,
-            "local_storage_strategy": "COPY"
-        }
-        verification_model = SpeakerRecognition.from_hparams(
-            source=MODEL_SOURCE,
-            savedir=MODELS_DIR,
-            run_opts=run_opts
-        )
-        print("Model loaded.")
+    if verification_model is None:
+        with _model_lock:
+            if verification_model is None:
+                print("Loading verification model KeyVox v1.0")
+                run_opts = {
+                    "device": "cpu",
+                    "data_parallel_backend": False,
+                    "local_storage_strategy": "COPY"
+                }
+                verification_model = SpeakerRecognition.from_hparams(
+                    source=MODEL_SOURCE,
+                    savedir=MODELS_DIR,
+                    run_opts=run_opts
+                )
+                print("Model loaded.")
     return verification_model
 
 
@@ -138,20 +153,22 @@ def calibrate_ambient_noise(duration=1.0, gui_mode=False):
 # --- Trim leading/trailing quiet frames ---
 def trim_silence(signal_tensor, threshold=0.01):
     """
-    Trim frames where RMS is below threshold at start and end.
-    signal_tensor: [channels, samples]
+    Drop frames whose RMS is below threshold, using the shared frame-level VAD
+    (backend/vad.py): at start and end, or everywhere with KEYVOX_VAD_MODE=segments.
+    signal_tensor: [channels, samples] or [samples]
     """
     signal_np = signal_tensor.numpy()
-    rms = np.sqrt(np.mean(signal_np**2, axis=0)) if signal_np.ndim == 1 else np.sqrt(np.mean(signal_np**2, axis=0))
-    
-    # Find indices above threshold
-    indices = np.where(rms > threshold)[0]
-    if len(indices) == 0:
+    mono = signal_np.mean(axis=0) if signal_np.ndim == 2 else signal_np
+    if vad.VAD_MODE == "segments":
+        segments = vad.speech_segments(mono, SAMPLE_RATE, threshold=threshold)
+    else:
+        segments = np.array([vad.trim_bounds(mono, threshold=threshold)])
+    segments = segments[segments[:, 1] > segments[:, 0]]
+    if len(segments) == 0:
         return signal_tensor  # nothing above threshold, return original
-    
-    start, end = indices[0], indices[-1] + 1
-    trimmed_signal = signal_tensor[:, start:end] if signal_tensor.ndim == 2 else signal_tensor[start:end]
-    return trimmed_signal
+
+    pieces = [signal_tensor[..., start:end] for start, end in segments]
+    return pieces[0] if len(pieces) == 1 else torch.cat(pieces, dim=-1)
 
 
 def sliding_windows(signal_tensor, sr, win_sec=1.2, hop_sec=0.6):
@@ -170,3 +187,143 @@ def sliding_windows(signal_tensor, sr, win_sec=1.2, hop_sec=0.6):
     starts = list(range(0, total - win + 1, hop))
     segments = [x[:, s:s+win] for s in starts]
     return segments if segments else [x]
+
+
+def sliding_window_batch(signal_tensor, sr, win_sec=1.2, hop_sec=0.6, max_segments=None):
+    """
+    Same windows as sliding_windows(), but stacked into one [N, Win] tensor
+    (a strided view, no copies) so they can go through encode_batch together.
+    Multi-channel input is averaged to mono first. Falls back to the full
+    signal as a batch of one if it is shorter than a window.
+    """
+    x = signal_tensor
+    if x.ndim == 2:
+        x = x.mean(dim=0)  # [T]
+    win = int(win_sec * sr)
+    hop = int(hop_sec * sr)
+    if x.shape[-1] < win:
+        return x.unsqueeze(0)
+    segments = x.unfold(0, win, hop)  # [N, Win]
+    if max_segments is not None:
+        segments = segments[:max_segments]
+    return segments
+
+
+def voiced_segment_indices(segments, keep_ratio=0.6, min_keep=2):
+    """Indices of the most voiced windows of a [N, Win] batch: top `keep_ratio` by RMS, but at least `min_keep`."""
+    n = segments.shape[0]
+    if n <= 1:
+        return torch.arange(n)
+    rms = segments.pow(2).mean(dim=1).sqrt()
+    keep = min(n, max(min_keep, int(round(keep_ratio * n))))
+    return torch.topk(rms, keep).indices
+
+
+def select_voiced_segments(segments, keep_ratio=0.6, min_keep=2):
+    """Keep the most voiced windows of a [N, Win] batch (see voiced_segment_indices)."""
+    return segments[voiced_segment_indices(segments, keep_ratio, min_keep)]
+
+
+def l2_normalize(x, dim=-1):
+    return x / (x.norm(p=2, dim=dim, keepdim=True) + 1e-8)
+
+
+def encode_segments(model, segments, min_samples=0):
+    """
+    Embed a [N, Win] batch of equal-length windows with a single encode_batch
+    call. Returns L2-normalized embeddings [N, D]; windows shorter than
+    `min_samples` yield an empty [0, D] result.
+    """
+    if segments.shape[-1] < min_samples:
+        return segments.new_zeros((0, 0))
+    with torch.no_grad():
+        emb = model.encode_batch(segments)  # [N, 1, D]
+    emb = emb.reshape(segments.shape[0], -1)
+    return l2_normalize(emb)
+
+
+def encode_full(model, signal_tensor):
+    """L2-normalized embedding [D] of the whole utterance."""
+    with torch.no_grad():
+        emb = model.encode_batch(signal_tensor)
+    if emb.ndim == 3:
+        emb = emb.squeeze(0)
+    if emb.ndim == 2:
+        emb = emb.mean(dim=0)
+    return l2_normalize(emb)
+
+
+# --- Shared-trunk segment embeddings ---
+def _ecapa_trunk(model, wavs):
+    """Fbank + sentence norm + TDNN/SE-Res2Net blocks + MFA of ECAPA: [B, T] -> [B, C, frames]."""
+    feats = model.mods.compute_features(wavs)
+    feats = model.mods.mean_var_norm(feats, torch.ones(wavs.shape[0], device=wavs.device))
+    ecapa = model.mods.embedding_model
+    x = feats.transpose(1, 2)
+    xl = []
+    for layer in ecapa.blocks:
+        x = layer(x) if isinstance(layer, TDNNBlock) else layer(x, lengths=None)
+        xl.append(x)
+    return ecapa.mfa(torch.cat(xl[1:], dim=1))
+
+
+def _ecapa_pool(model, frames):
+    """Attentive statistics pooling + BN + final linear of ECAPA: [B, C, frames] -> [B, D]."""
+    ecapa = model.mods.embedding_model
+    x = ecapa.asp(frames)
+    x = ecapa.asp_bn(x)
+    x = ecapa.fc(x)
+    return x.squeeze(-1)
+
+
+def embed_full_and_segments(model, signal_tensor, sr, win_sec=1.5, hop_sec=0.5, max_segments=None,
+                            keep_ratio=None, min_keep=2, min_samples=0, mode=None, need_full=True):
+    """
+    Full-utterance embedding [D] plus per-window embeddings [N, D], all L2-normalized.
+
+    Windows follow sliding_window_batch(); with `keep_ratio` only the most voiced
+    ones are kept (select_voiced_segments). `mode` defaults to
+    SEGMENT_EMBEDDING_MODE:
+      - "batched": full utterance and the window batch are each encoded once.
+      - "shared_trunk": the convolutional trunk runs once over the utterance and
+        each window only pools its own slice of trunk frames, so the overlapping
+        frames are never recomputed. Window embeddings then see the utterance
+        context at their edges and the utterance-level feature normalisation,
+        so they are close to, not identical with, "batched" ones.
+    With need_full=False the full embedding may be skipped (returned as None).
+    """
+    mode = mode or SEGMENT_EMBEDDING_MODE
+    x = signal_tensor.mean(dim=0) if signal_tensor.ndim == 2 else signal_tensor  # [T]
+    segments = sliding_window_batch(x, sr, win_sec=win_sec, hop_sec=hop_sec, max_segments=max_segments)
+    keep = torch.arange(segments.shape[0])
+    if keep_ratio is not None:
+        keep = voiced_segment_indices(segments, keep_ratio=keep_ratio, min_keep=min_keep)
+
+    if mode == "batched":
+        full = encode_full(model, signal_tensor) if need_full else None
+        return full, encode_segments(model, segments[keep], min_samples=min_samples)
+    if mode != "shared_trunk":
+        raise ValueError(f"Unknown segment embedding mode '{mode}'.")
+
+    with torch.no_grad():
+        trunk = _ecapa_trunk(model, x.unsqueeze(0).float())  # [1, C, F]
+        full = l2_normalize(_ecapa_pool(model, trunk)[0])
+
+        if segments.shape[-1] < min_samples:
+            return full, trunk.new_zeros((0, full.shape[0]))
+
+        n_frames = trunk.shape[-1]
+        frame_hop = model.mods.compute_features.compute_STFT.hop_length
+        if segments.shape[-1] >= x.shape[-1]:
+            # Utterance shorter than one window: the only "segment" is the utterance.
+            return full, full.unsqueeze(0)
+
+        # Window k starts at sample k * hop; encoding it alone would give win // frame_hop + 1 frames.
+        win_frames = min(segments.shape[-1] // frame_hop + 1, n_frames)
+        starts = (keep * int(hop_sec * sr)) // frame_hop
+        starts = torch.clamp(starts, max=n_frames - win_frames)
+        idx = starts.unsqueeze(1) + torch.arange(win_frames).unsqueeze(0)  # [N, win_frames]
+        windows = trunk[0][:, idx].permute(1, 0, 2)                        # [N, C, win_frames]
+        segs = l2_normalize(_ecapa_pool(model, windows))
+    return full, segs
+
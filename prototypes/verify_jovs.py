@@ -7,8 +7,9 @@ import numpy as np
 import warnings
 import contextlib
 import sys
-from helpers_jovs import get_model, record_audio, save_temp_audio,  trim_silence, sliding_windows
-from config_jovs import VOICEPRINTS_DIR, SAMPLE_RATE, DURATION, VERIFICATION_THRESHOLD
+from helpers_jovs import get_model, record_audio, save_temp_audio, trim_silence, embed_full_and_segments, l2_normalize
+from config_jovs import SAMPLE_RATE, DURATION, VERIFICATION_THRESHOLD, ZNORM_MODE, ZNORM_MIN_COHORT
+from cohort_index import get_cohort_index, robust_stats
 
 import tkinter as tk
 from tkinter import messagebox
@@ -29,20 +30,6 @@ def suppress_stdout():
         finally:
             sys.stdout, sys.stderr = old_stdout, old_stderr
 
-def load_cohort(voiceprints_dir, exclude_username):
-    cohort = []
-    for fname in os.listdir(voiceprints_dir):
-        if not fname.endswith(".pt"):
-            continue
-        if fname == f"{exclude_username}.pt":
-            continue
-        v = torch.load(os.path.join(voiceprints_dir, fname))
-        if v.ndim == 2:
-            v = v.mean(dim=0)
-        v = v / (v.norm(p=2) + 1e-8)
-        cohort.append(v)
-    return cohort
-
 def verify_user(username: str) -> bool:
     """
     Verify a user by comparing their voiceprint.
@@ -52,11 +39,9 @@ def verify_user(username: str) -> bool:
     root = tk.Tk()
     root.withdraw()  # hide main window
 
-    voiceprint_path = os.path.join(VOICEPRINTS_DIR, f"{username}.pt")
-    if not os.path.exists(voiceprint_path):
-        # fix typo in path earlier (ensure correct path string)
-        voiceprint_path = os.path.join(VOICEPRINTS_DIR, f"{username}.pt")
-    if not os.path.exists(voiceprint_path):
+    # Voiceprints are read from the shared memory-mapped store (see cohort_index.py).
+    cohort = get_cohort_index()
+    if username not in cohort.store:
         messagebox.showerror("Verification Error", f"No enrollment found for '{username}'.")
         root.destroy()
         return False
@@ -109,60 +94,26 @@ def verify_user(username: str) -> bool:
         fs = SAMPLE_RATE
 
     # --- Load stored embedding (target) once ---
-    stored_embedding = torch.load(voiceprint_path)
-    if stored_embedding.ndim == 2:
-        stored_embedding = stored_embedding.mean(dim=0)
+    stored_embedding = torch.from_numpy(cohort.get(username))
     stored_embedding = stored_embedding / (stored_embedding.norm(p=2) + 1e-8)
 
     # ---------- Primary: full-utterance embedding ----------
-    with torch.no_grad():
-        full_emb = model.encode_batch(signal)
-    if full_emb.ndim == 3:
-        full_emb = full_emb.squeeze(0)
-    if full_emb.ndim == 2:
-        full_emb = full_emb.mean(dim=0)
-    full_emb = full_emb / (full_emb.norm(p=2) + 1e-8)
-
-    full_cos = torch.nn.functional.cosine_similarity(
-        full_emb.unsqueeze(0), stored_embedding.unsqueeze(0), dim=1
-    ).item()
-
     # ---------- Stabilizer: multi-segment Top-K median ----------
-    segments = sliding_windows(signal, fs, win_sec=1.5, hop_sec=0.5)
-    # cap segments to avoid tails
-    segments = segments[:8]
-
-    # Keep only the most voiced segments (top 60% by RMS), but at least 2
-    if len(segments) > 1:
-        seg_rms = [float(torch.sqrt((seg**2).mean()).item()) for seg in segments]
-        idx_sorted = sorted(range(len(segments)), key=lambda i: seg_rms[i], reverse=True)
-        keep = max(2, int(round(0.6 * len(segments))))
-        segments = [segments[i] for i in idx_sorted[:keep]]
-
-    seg_cosines = []
-    seg_embeds = []
-    with torch.no_grad():
-        for seg in segments:
-            if seg.shape[-1] < int(0.6 * SAMPLE_RATE):
-                continue
-            emb = model.encode_batch(seg)
-            if emb.ndim == 3:
-                emb = emb.squeeze(0)
-            if emb.ndim == 2:
-                emb = emb.mean(dim=0)
-            emb = emb / (emb.norm(p=2) + 1e-8)
-            seg_embeds.append(emb)
-            c = torch.nn.functional.cosine_similarity(
-                emb.unsqueeze(0), stored_embedding.unsqueeze(0), dim=1
-            ).item()
-            seg_cosines.append(float(c))
-
-    if not seg_cosines:
+    # Windows are capped to avoid tails, and only the most voiced ones are kept
+    # (top 60% by RMS, but at least 2). See SEGMENT_EMBEDDING_MODE for how they are encoded.
+    full_emb, seg_embeds = embed_full_and_segments(
+        model, signal, fs, win_sec=1.5, hop_sec=0.5, max_segments=8,
+        keep_ratio=0.6, min_keep=2, min_samples=int(0.6 * SAMPLE_RATE)
+    )
+    full_cos = float(full_emb @ stored_embedding)
+
+    if seg_embeds.shape[0] == 0:
         messagebox.showerror("Verification Error", "Recording too short/noisy. Please try again.")
         root.destroy()
         return False
 
-    seg_cosines_np = np.array(seg_cosines, dtype=np.float32)
+    # Cosine of every segment against the target in one matrix-vector product
+    seg_cosines_np = (seg_embeds @ stored_embedding).numpy().astype(np.float32)
     K = max(2, int(round(0.5 * len(seg_cosines_np))))  # top 50%, at least 2
     topk = np.sort(seg_cosines_np)[-K:]
     seg_score = float(np.median(topk))
@@ -175,27 +126,23 @@ def verify_user(username: str) -> bool:
     raw_score = alpha * full_cos + (1.0 - alpha) * seg_score
 
     # --- Build an aggregate probe embedding ONLY for z-norm (optional if you have cohort) ---
-    agg_probe = torch.stack(seg_embeds, dim=0).mean(dim=0) if len(seg_embeds) > 0 else full_emb
-    agg_probe = agg_probe / (agg_probe.norm(p=2) + 1e-8)
+    agg_probe = l2_normalize(seg_embeds.mean(dim=0))
 
     # --- Z-Norm using cohort (if available) ---
-    cohort = load_cohort(VOICEPRINTS_DIR, username)
-
-    if len(cohort) >= 5:
-        with torch.no_grad():
-            coh_scores = [
-                torch.nn.functional.cosine_similarity(
-                    agg_probe.unsqueeze(0), c.unsqueeze(0), dim=1
-                ).item()
-                for c in cohort
-            ]
-        cs = np.array(coh_scores, dtype=np.float32)
-        m = float(np.median(cs))
-        mad = float(np.median(np.abs(cs - m)))
-        sigma = 1.4826 * mad + 1e-6  # MAD->std
+    # Every other enrolled voiceprint lives in the same memory-mapped matrix.
+    znorm = None  # (median, mad, sigma)
+    if cohort.cohort_size(exclude=username) >= ZNORM_MIN_COHORT:
+        stats = cohort.enrolled_stats(username) if ZNORM_MODE == "enrolled" else None
+        if stats is not None:
+            znorm = (stats["median"], stats["mad"], stats["sigma"])
+        else:
+            znorm = robust_stats(cohort.scores(agg_probe.numpy(), exclude=username))
+
+    if znorm is not None:
+        m, mad, sigma = znorm
         score = (raw_score - m) / sigma
         threshold = 0.0
-        print(f"raw={raw_score:.3f} | z={score:.3f} (med={m:.3f}, mad={mad:.3f}) | thr={threshold:.3f}")
+        print(f"raw={raw_score:.3f} | z={score:.3f} (med={m:.3f}, mad={mad:.3f}, {ZNORM_MODE}) | thr={threshold:.3f}")
     else:
         score = raw_score
         threshold = VERIFICATION_THRESHOLD
@@ -266,42 +213,16 @@ def self_check() -> bool:
                 import torchaudio.functional as AF
                 sig = AF.resample(sig, fs, SAMPLE_RATE)
 
-            # full emb
-            with torch.no_grad():
-                full = model.encode_batch(sig)
-            if full.ndim == 3:  # [1, T, D]
-                full = full.squeeze(0)
-            if full.ndim == 2:  # [T, D]
-                full = full.mean(dim=0)
-            full = full / (full.norm(p=2) + 1e-8)
-
-            # segments (same params as verify)
-            segs = sliding_windows(sig, SAMPLE_RATE, win_sec=1.5, hop_sec=0.5)
-            segs = segs[:8]
-            if len(segs) > 1:
-                seg_rms = [float(torch.sqrt((s**2).mean()).item()) for s in segs]
-                idx_sorted = sorted(range(len(segs)), key=lambda i: seg_rms[i], reverse=True)
-                keep = max(2, int(round(0.6 * len(segs))))
-                segs = [segs[i] for i in idx_sorted[:keep]]
-
-            seg_embs = []
-            with torch.no_grad():
-                for s in segs:
-                    if s.shape[-1] < int(0.6 * SAMPLE_RATE):
-                        continue
-                    e = model.encode_batch(s)
-                    if e.ndim == 3:
-                        e = e.squeeze(0)
-                    if e.ndim == 2:
-                        e = e.mean(dim=0)
-                    e = e / (e.norm(p=2) + 1e-8)
-                    seg_embs.append(e)
-
-            if len(seg_embs) == 0:
+            # full emb + segments (same params as verify)
+            full, seg_embs = embed_full_and_segments(
+                model, sig, SAMPLE_RATE, win_sec=1.5, hop_sec=0.5, max_segments=8,
+                keep_ratio=0.6, min_keep=2, min_samples=int(0.6 * SAMPLE_RATE)
+            )
+
+            if seg_embs.shape[0] == 0:
                 agg = full
             else:
-                agg = torch.stack(seg_embs, dim=0).mean(dim=0)
-                agg = agg / (agg.norm(p=2) + 1e-8)
+                agg = l2_normalize(seg_embs.mean(dim=0))
             return full, agg
 
         full1, agg1 = encode_from_wav(tmp1)